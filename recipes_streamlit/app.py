@@ -1,10 +1,16 @@
 from __future__ import annotations
 
+import os
+
 import pandas as pd
 import streamlit as st
 from bson import ObjectId
 
-from mongo import get_db, ensure_indexes
+from mongo import get_client, get_db, ensure_indexes, pool_metrics
+from metrics import REGISTRY, SLOW_LOG, SLOW_MS
+from backends import MemoryBackend
+from cache import SavedState
+import columnar
 import services
 
 
@@ -13,22 +19,38 @@ st.set_page_config(page_title="Recepti", layout="wide")
 
 @st.cache_resource
 def init_db():
-    db = get_db()
-    ensure_indexes(db)
+    # STORAGE_BACKEND=memory pokrece aplikaciju bez mongod-a, sa sintetickim podacima
+    if os.getenv("STORAGE_BACKEND", "mongo") == "memory":
+        import datagen
+        db = MemoryBackend()
+        datagen.generate(db, recipes=int(os.getenv("MEMORY_SEED_RECIPES", "1000")))
+    else:
+        db = get_db()
+        ensure_indexes(db)
+        services.ensure_recipes_feed(db)
+        services.detect_allergen_mask(db)
+        services.detect_ingredient_ids(db)
+    if os.getenv("PANTRY_INDEX", "0") == "1":
+        services.enable_pantry_index(db)
+    # gradnja pri pokretanju da je prva pretraga ne placa
+    if os.getenv("TEXT_INDEX", "1") == "1":
+        services.enable_text_index(db)
+    if os.getenv("SUGGEST_INDEX", "1") == "1":
+        services.enable_suggest_index(db)
     return db
 
 
 db = init_db()
 
 def ensure_state():
-    if "saved_ids" not in st.session_state:
-        st.session_state["saved_ids"] = set()
     if "results_all" not in st.session_state:
         st.session_state["results_all"] = None
     if "results_search" not in st.session_state:
         st.session_state["results_search"] = None
     if "results_pantry" not in st.session_state:
         st.session_state["results_pantry"] = None
+    if "results_text" not in st.session_state:
+        st.session_state["results_text"] = None
 
 ensure_state()
 
@@ -39,6 +61,7 @@ def require_login() -> bool:
 
 def logout():
     st.session_state["user"] = None
+    st.session_state.pop("saved_state", None)
     st.session_state["login_tries"] = {}
     st.rerun()
 
@@ -75,10 +98,9 @@ def show_auth():
                 st.error(f"{err} (pokušaj {tries+1}/3)")
             else:
                 st.session_state["user"] = user
+                st.session_state.pop("saved_state", None)
                 st.success(f"Ulogiran korisnik: {user.get('username')}")
                 st.rerun()
-                st.session_state["user"] = user
-                refresh_saved_ids(user)
 
 
     with tab2:
@@ -112,24 +134,106 @@ def show_auth():
 
 
 def dataframe_from_recipes(recipes):
+    # stupci se grade izravno iz rezultata (columnar.py), bez kopije po retku
+    return columnar.to_dataframe(recipes, columnar.present(recipes, columnar.CARD_SCHEMA))
 
-    rows = []
-    for r in recipes:
-        rr = services.serialize_doc(r)
-        rr["_id"] = str(r.get("_id")) if r.get("_id") else rr.get("_id")
-        rows.append(rr)
-    return pd.DataFrame(rows) if rows else pd.DataFrame()
 
+# koliko dugo se vjeruje zapamcenom stanju spremljenog recepta prije nove provjere
+SAVED_STATE_TTL = float(os.getenv("SAVED_STATE_TTL", "300"))
+
+
+def saved_state(user) -> SavedState:
+    state = st.session_state.get("saved_state")
+    if state is None or state.user_id != user["_id"]:
+        state = SavedState(user["_id"], ttl_seconds=SAVED_STATE_TTL)
+        st.session_state["saved_state"] = state
+    return state
+
+
+### Prikaz rezultata ###
+
+# Streamlit pri svakoj interakciji ponovno izvrsi cijelu skriptu, pa se
+# widgeti rade samo za trenutnu stranicu kartica, a tijelo kartice (gumbi,
+# komentari, unos) tek kad je kartica otvorena. Za velike rezultate zadani
+# prikaz je tablica.
+CARDS_PER_PAGE = int(os.getenv("CARDS_PER_PAGE", "20"))
+TABLE_MODE_THRESHOLD = int(os.getenv("TABLE_MODE_THRESHOLD", "100"))
 
-def render_recipe_cards(recipes, user, saved_ids: set[ObjectId] | None = None, show_match=False):
+
+def export_payload(recipes):
+    schema = columnar.present(recipes, columnar.CARD_SCHEMA)
+    if columnar.pa is not None:
+        return columnar.to_parquet_bytes(recipes, schema), "rezultati.parquet", "application/octet-stream"
+    return "\n".join(columnar.to_ndjson_lines(recipes, schema)), "rezultati.ndjson", "application/x-ndjson"
+
+
+def recipes_table(recipes, key):
+    st.dataframe(dataframe_from_recipes(recipes), use_container_width=True)
+    # izvoz se gradi tek na zahtjev i cuva u sesiji dok se rezultati ne promijene,
+    # a ne pri svakom ponovnom izvrsavanju skripte
+    signature = (len(recipes), recipes[0].get("_id"), recipes[-1].get("_id"))
+    export = st.session_state.get(f"export_{key}")
+    if export is not None and export[0] != signature:
+        export = st.session_state[f"export_{key}"] = None
+    if export is None:
+        if st.button("Pripremi izvoz", key=f"prepare_export_{key}"):
+            st.session_state[f"export_{key}"] = (signature, export_payload(recipes))
+            st.rerun()
+        return
+    data, name, mime = export[1]
+    st.download_button("Preuzmi rezultate", data, file_name=name, mime=mime, key=f"download_{key}")
+
+
+def paginate(items, key):
+    pages = max(1, -(-len(items) // CARDS_PER_PAGE))
+    page = min(st.session_state.get(f"page_{key}", 0), pages - 1)
+    if pages > 1:
+        col1, col2, col3 = st.columns([1, 3, 1])
+        with col1:
+            if st.button("Prethodna", key=f"prev_{key}", disabled=page == 0):
+                page -= 1
+        with col3:
+            if st.button("Sljedeća", key=f"next_{key}", disabled=page >= pages - 1):
+                page += 1
+        with col2:
+            st.caption(f"Stranica {page + 1}/{pages} ({len(items)} rezultata)")
+    st.session_state[f"page_{key}"] = page
+    return items[page * CARDS_PER_PAGE:(page + 1) * CARDS_PER_PAGE]
+
+
+def render_recipe_cards(recipes, user, saved_ids: set[ObjectId] | None = None, show_match=False, key="cards"):
     if not recipes:
         st.info("Nema rezultata.")
         return
 
-    if saved_ids is None:
-        saved_ids = set()
+    # korisnikov izbor prikaza vrijedi dok se zadani ne promijeni (npr. kad
+    # "Učitaj još" ili novi upit prijede prag, prelazi se na tablicu)
+    default = "Tablica" if len(recipes) > TABLE_MODE_THRESHOLD else "Kartice"
+    if st.session_state.get(f"view_default_{key}") != default:
+        st.session_state[f"view_default_{key}"] = default
+        st.session_state[f"view_{key}"] = default
+    view = st.radio("Prikaz", ["Kartice", "Tablica"], horizontal=True, key=f"view_{key}")
+    if view == "Tablica":
+        recipes_table(recipes, key)
+        return
 
-    for r in recipes:
+    visible = paginate(recipes, key)
+    state = saved_state(user)
+    if saved_ids is None:
+        # provjeravaju se samo prikazani recepti, i to samo oni kojima je stanje zastarjelo
+        shown = [r["_id"] for r in visible if isinstance(r.get("_id"), ObjectId)]
+        saved_ids = state.saved_among(shown, lambda ids: services.saved_ids_among(db, user["_id"], ids))
+
+    # komentari svih otvorenih kartica se dohvacaju jednim upitom
+    loaded = [
+        r["_id"] for r in visible
+        if isinstance(r.get("_id"), ObjectId)
+        and st.session_state.get(f"card_open_{key}_{r['_id']}", False)
+        and st.session_state.get(f"comments_loaded_{r['_id']}", False)
+    ]
+    comments_by_recipe = services.list_comments_for_recipes(db, loaded) if loaded else {}
+
+    for r in visible:
         rid_raw = r.get("_id")
 
         try:
@@ -140,75 +244,171 @@ def render_recipe_cards(recipes, user, saved_ids: set[ObjectId] | None = None, s
         rid_str = str(rid) if rid else "(no id)"
         title = r.get("title", "(no title)")
         author = r.get("author_username") or "unknown"
-        created = r.get("created_at")
 
-        header = f"{title}  —  autor: {author}  |  id: {rid_str}"
-        with st.expander(header, expanded=False):
-            cols = st.columns([1, 1, 1])
+        # ista kartica u dvije liste (npr. pretraga i slicni) otvara se zasebno
+        is_open = st.session_state.get(f"card_open_{key}_{rid_str}", False)
+        head, toggle = st.columns([6, 1])
+        with head:
+            st.markdown(f"**{title}**  —  autor: {author}  |  saves: {int(r.get('save_count', 0))}  |  komentari: {int(r.get('comment_count', 0))}")
+        with toggle:
+            if st.button("Zatvori" if is_open else "Otvori", key=f"toggle_{key}_{rid_str}"):
+                st.session_state[f"card_open_{key}_{rid_str}"] = not is_open
+                st.rerun()
 
-            with cols[0]:
-                st.write("**Allergens:**", r.get("allergens", []))
-                st.write("**Ingredient keys:**", r.get("ingredient_keys", []))
+        if is_open:
+            with st.container():
+                render_card_body(r, rid, rid_str, user, state, saved_ids, show_match, comments_by_recipe, key)
+        st.markdown("---")
 
-            with cols[1]:
-                st.write("**Saves:**", int(r.get("save_count", 0)))
-                st.write("**Comments:**", int(r.get("comment_count", 0)))
-                st.write("**Created:**", created)
 
-            with cols[2]:
-                if rid is None:
-                    st.warning("Nije moguće spremiti ovaj recept (neispravan _id).")
-                else:
-                    is_saved = rid in saved_ids
-                    if not is_saved:
-                        if st.button("Spremi", key=f"save_{rid_str}"):
-                            ok, msg = services.save_recipe(db, user["_id"], rid)
-                            if ok:
-                                refresh_saved_ids(user)
-                                st.success(msg)
-                            else:
-                                st.warning(msg)
-                            st.rerun()
+def render_card_body(r, rid, rid_str, user, state, saved_ids, show_match, comments_by_recipe, key):
+    cols = st.columns([1, 1, 1])
+
+    with cols[0]:
+        st.write("**Allergens:**", r.get("allergens", []))
+        st.write("**Ingredient keys:**", r.get("ingredient_keys", []))
+
+    with cols[1]:
+        st.write("**Id:**", rid_str)
+        st.write("**Created:**", r.get("created_at"))
+        if r.get("score") is not None:
+            st.write("**Relevantnost:**", r["score"])
+
+    with cols[2]:
+        if rid is None:
+            st.warning("Nije moguće spremiti ovaj recept (neispravan _id).")
+        else:
+            is_saved = rid in saved_ids
+            if not is_saved:
+                if st.button("Spremi", key=f"save_{key}_{rid_str}"):
+                    ok, msg = services.save_recipe(db, user["_id"], rid)
+                    if ok:
+                        state.apply(rid, True)
+                        st.success(msg)
                     else:
-                        if st.button("Ukloni iz spremljenih", key=f"unsave_{rid_str}"):
-                            ok, msg = services.unsave_recipe(db, user["_id"], rid)
-                            if ok:
-                                refresh_saved_ids(user)
-                                st.success(msg)
-                            else:
-                                st.warning(msg)
-                            st.rerun()
-
-            if show_match:
-                st.write("**Match count:**", r.get("match_count", 0))
-                st.write("**Match keys:**", r.get("match_keys", []))
-
-            if rid is not None:
-                st.markdown("---")
-                st.write("### Komentari")
-
-                if st.button("Učitaj komentare", key=f"load_comments_{rid_str}"):
-                    st.session_state[f"comments_loaded_{rid_str}"] = True
-
-                if st.session_state.get(f"comments_loaded_{rid_str}", False):
-                    recipe_title, comments, err = services.list_comments_for_recipe(db, rid)
-                    if err:
-                        st.error(err)
+                        state.forget(rid)
+                        st.warning(msg)
+                    st.rerun()
+            else:
+                if st.button("Ukloni iz spremljenih", key=f"unsave_{key}_{rid_str}"):
+                    ok, msg = services.unsave_recipe(db, user["_id"], rid)
+                    if ok:
+                        state.apply(rid, False)
+                        st.success(msg)
                     else:
-                        if not comments:
-                            st.info("Nema komentara.")
-                        else:
-                            for c in comments:
-                                au = c.get("author_username") or "unknown"
-                                st.write(f"- **[{au}]** {c.get('text')} ({c.get('created_at')})")
-
-                new_comment = st.text_input("Dodaj komentar", key=f"comment_text_{rid_str}")
-                if st.button("Spremi komentar", key=f"add_comment_{rid_str}"):
-                    ok, msg = services.add_comment(db, user["_id"], rid, new_comment)
-                    st.success(msg) if ok else st.error(msg)
-                    st.session_state[f"comments_loaded_{rid_str}"] = True
+                        state.forget(rid)
+                        st.warning(msg)
                     st.rerun()
 
+    if show_match:
+        st.write("**Match count:**", r.get("match_count", 0))
+        st.write("**Match keys:**", r.get("match_keys", []))
+
+    if rid is not None:
+        similar_open = st.session_state.get(f"similar_open_{key}_{rid_str}", False)
+        if st.button("Sakrij slične" if similar_open else "Slični recepti", key=f"similar_{key}_{rid_str}"):
+            st.session_state[f"similar_open_{key}_{rid_str}"] = not similar_open
+            st.rerun()
+        if similar_open:
+            similar = services.similar_recipes(db, rid, limit=5)
+            if not similar:
+                st.info("Nema sličnih recepata.")
+            for s in similar:
+                au = s.get("author_username") or "unknown"
+                st.write(f"- **{s.get('title')}** — autor: {au} | sličnost: {s['similarity']:.2f} | id={s['_id']}")
+
+        recs_open = st.session_state.get(f"recs_open_{key}_{rid_str}", False)
+        if st.button("Sakrij preporuke" if recs_open else "Spremili su i", key=f"recs_{key}_{rid_str}"):
+            st.session_state[f"recs_open_{key}_{rid_str}"] = not recs_open
+            st.rerun()
+        if recs_open:
+            recs = services.recommended_recipes(db, rid, limit=5)
+            if not recs:
+                st.info("Nema preporuka za ovaj recept.")
+            for s in recs:
+                au = s.get("author_username") or "unknown"
+                st.write(f"- **{s.get('title')}** — autor: {au} | zajedno spremljeno: {s['co_saves']} | id={s['_id']}")
+
+    if rid is not None:
+        st.markdown("---")
+        st.write("### Komentari")
+
+        if st.button("Učitaj komentare", key=f"load_comments_{key}_{rid_str}"):
+            st.session_state[f"comments_loaded_{rid_str}"] = True
+            st.rerun()
+
+        if st.session_state.get(f"comments_loaded_{rid_str}", False):
+            comments = comments_by_recipe.get(rid)
+            if comments is None:
+                st.error("Ne postoji recept s tim id-om.")
+            else:
+                if not comments:
+                    st.info("Nema komentara.")
+                else:
+                    for c in comments:
+                        au = c.get("author_username") or "unknown"
+                        st.write(f"- **[{au}]** {c.get('text')} ({c.get('created_at')})")
+
+        new_comment = st.text_input("Dodaj komentar", key=f"comment_text_{key}_{rid_str}")
+        if st.button("Spremi komentar", key=f"add_comment_{key}_{rid_str}"):
+            ok, msg = services.add_comment(db, user["_id"], rid, new_comment)
+            st.success(msg) if ok else st.error(msg)
+            st.session_state[f"comments_loaded_{rid_str}"] = True
+            st.rerun()
+
+
+# poredak kartica u "Svi recepti" i "Pretraga"; upit ga nosi kao sort=
+CARD_SORT_LABELS = {"Najnovije": "newest", "Trending": "trending"}
+
+
+def run_query(name, fetch, sort_name="newest", **query):
+    results = fetch(db, **query)
+    st.session_state[f"results_{name}"] = results
+    st.session_state[f"query_{name}"] = query
+    st.session_state[f"page_{name}"] = 0
+    st.session_state[f"cursor_{name}"] = services.next_cursor(results, query["limit"], query.get("sort", sort_name))
+
+
+def load_more(name, fetch, sort_name="newest"):
+    cursor = st.session_state.get(f"cursor_{name}")
+    if not cursor:
+        return
+    if st.button("Učitaj još", key=f"more_{name}"):
+        query = st.session_state[f"query_{name}"]
+        more = fetch(db, after=cursor, **query)
+        st.session_state[f"results_{name}"] = st.session_state[f"results_{name}"] + more
+        st.session_state[f"cursor_{name}"] = services.next_cursor(more, query["limit"], query.get("sort", sort_name))
+        st.rerun()
+
+
+def correct_terms(*csv_texts):
+    # tipfeleri ("piletna", "rizza") se ispravljaju prije upita, uz napomenu korisniku
+    out = []
+    for text in csv_texts:
+        fixed, fixes = services.correct_csv(db, text)
+        for typed, key in fixes:
+            st.info(f"'{typed}' -> '{key}'")
+        out.append(fixed if fixes else text)
+    return out
+
+
+def suggest_terms(csv_text):
+    # iskljucenja se ne ispravljaju sama: krivo ispravljen pojam bi iskljucio
+    # pogresan sastojak, pa se samo predlaze
+    _, fixes = services.correct_csv(db, csv_text)
+    for typed, key in fixes:
+        st.warning(f"Exclude '{typed}' nije poznat sastojak - mislio si '{key}'?")
+
+
+def suggest_box(key):
+    typed = st.text_input("Prijedlozi sastojaka (upiši početak ili naziv s greškom)", key=key)
+    if typed.strip():
+        hits = services.suggest_ingredients(db, typed, limit=10)
+        if hits:
+            st.caption(", ".join(f"{h['key']} ({h['count']})" for h in hits))
+        else:
+            st.caption("Nema prijedloga.")
+
 
 def page_add_recipe(user):
     st.header("Dodaj recept")
@@ -286,27 +486,29 @@ def page_all_recipes(user):
             username = st.text_input("Filtriraj po username (prazno = svi)", key="all_username")
         with col2:
             limit = st.number_input("Limit", min_value=1, max_value=500, value=50, step=10, key="all_limit")
+        sort_label = st.radio("Poredak", list(CARD_SORT_LABELS), horizontal=True, key="all_sort")
 
         submitted = st.form_submit_button("Prikaži")
 
     if submitted:
-        st.session_state["results_all"] = services.list_all_recipes_enriched(
-            db, username=username, limit=int(limit)
+        run_query(
+            "all", services.list_all_recipes_enriched,
+            username=username, limit=int(limit), sort=CARD_SORT_LABELS[sort_label],
         )
 
     if st.session_state["results_all"] is not None:
-
-        st.session_state["saved_ids"] = services.get_saved_recipe_ids(db, user["_id"])
         render_recipe_cards(
             st.session_state["results_all"],
             user,
-            saved_ids=st.session_state["saved_ids"],
             show_match=False,
+            key="all",
         )
+        load_more("all", services.list_all_recipes_enriched)
 
 
 def page_search(user):
     st.header("Pretraga po sastojcima (AND/OR/NOT + alergeni)")
+    suggest_box("s_suggest")
 
     with st.form("form_search"):
         col1, col2 = st.columns(2)
@@ -318,24 +520,63 @@ def page_search(user):
             exa = st.text_input("Exclude allergens, npr: mlijeko,gluten", key="s_exa")
 
         limit = st.number_input("Limit", min_value=1, max_value=500, value=50, step=10, key="s_limit")
+        sort_label = st.radio("Poredak", list(CARD_SORT_LABELS), horizontal=True, key="s_sort")
         submitted = st.form_submit_button("Traži")
 
     if submitted:
-        st.session_state["results_search"] = services.search_by_ingredients_enriched(
-            db, inc_csv=inc, any_csv=any_of, exc_csv=exc, exa_csv=exa, limit=int(limit)
+        inc, any_of = correct_terms(inc, any_of)
+        suggest_terms(exc)
+        run_query(
+            "search", services.search_by_ingredients_enriched,
+            inc_csv=inc, any_csv=any_of, exc_csv=exc, exa_csv=exa, limit=int(limit),
+            sort=CARD_SORT_LABELS[sort_label],
         )
 
     if st.session_state["results_search"] is not None:
-        st.session_state["saved_ids"] = services.get_saved_recipe_ids(db, user["_id"])
         render_recipe_cards(
             st.session_state["results_search"],
             user,
-            saved_ids=st.session_state["saved_ids"],
             show_match=False,
+            key="search",
         )
+        load_more("search", services.search_by_ingredients_enriched)
+
+        # ljudi u polje sastojaka upisuju nazive jela ("sarma")
+        query = st.session_state.get("query_search") or {}
+        typed = " ".join(query.get(k, "") for k in ("inc_csv", "any_csv")).replace(",", " ").strip()
+        if not st.session_state["results_search"] and typed:
+            hits = services.search_text(db, typed, limit=5)
+            if hits:
+                st.info(f"Nema recepata s tim sastojcima, ali pretraga teksta za '{typed}' nalazi:")
+                render_recipe_cards(hits, user, show_match=False, key="search_text_hints")
+
+def page_text_search(user):
+    st.header("Pretraga teksta (naslov, opis, koraci)")
+
+    with st.form("form_text"):
+        col1, col2 = st.columns([3, 1])
+        with col1:
+            q = st.text_input("Upit, npr: sarma, pileca juha, brza tor", key="t_query")
+        with col2:
+            limit = st.number_input("Limit", min_value=1, max_value=200, value=20, step=10, key="t_limit")
+        submitted = st.form_submit_button("Traži")
+
+    if submitted:
+        st.session_state["results_text"] = services.search_text(db, q, limit=int(limit))
+        st.session_state["page_text"] = 0
+
+    if st.session_state["results_text"] is not None:
+        render_recipe_cards(
+            st.session_state["results_text"],
+            user,
+            show_match=False,
+            key="text",
+        )
+
 
 def page_pantry(user):
     st.header("'Imam doma'")
+    suggest_box("p_suggest")
 
     with st.form("form_pantry"):
         pantry = st.text_input("Sastojci koje imaš (zarez), npr: piletina, luk, riza", key="p_pantry")
@@ -348,18 +589,20 @@ def page_pantry(user):
         if not pantry.strip():
             st.error("Unesi barem jedan sastojak.")
         else:
-            st.session_state["results_pantry"] = services.pantry_ranked_search_enriched(
-                db, pantry_csv=pantry, min_match=int(min_match), exa_csv=exa, limit=int(limit)
+            (pantry,) = correct_terms(pantry)
+            run_query(
+                "pantry", services.pantry_ranked_search_enriched, sort_name="pantry",
+                pantry_csv=pantry, min_match=int(min_match), exa_csv=exa, limit=int(limit),
             )
 
     if st.session_state["results_pantry"] is not None:
-        st.session_state["saved_ids"] = services.get_saved_recipe_ids(db, user["_id"])
         render_recipe_cards(
             st.session_state["results_pantry"],
             user,
-            saved_ids=st.session_state["saved_ids"],
             show_match=True,
+            key="pantry",
         )
+        load_more("pantry", services.pantry_ranked_search_enriched, sort_name="pantry")
 
 
 def page_saved(user):
@@ -386,20 +629,81 @@ def page_save_count(user):
         except Exception as e:
             st.error(f"Greška: {e}")
 
-def refresh_saved_ids(user):
-    st.session_state["saved_ids"] = services.get_saved_recipe_ids(db, user["_id"])
+def page_admin(user):
+    st.header("Admin / metrike")
+    if not services.is_admin(user):
+        st.error("Nemate pristup ovoj stranici.")
+        return
+
+    st.subheader("Services pozivi")
+    calls = REGISTRY.histograms("services_call_seconds")
+    if calls:
+        st.dataframe(pd.DataFrame(calls).sort_values("total_s", ascending=False), use_container_width=True)
+    else:
+        st.info("Jos nema mjerenja.")
+
+    st.subheader("Mongo komande")
+    commands = REGISTRY.histograms("mongo_command_seconds")
+    if commands:
+        df = pd.DataFrame(commands)
+        for metric in ("mongo_command_documents_total", "mongo_command_reply_bytes_total"):
+            totals = {(c["command"], c["collection"]): c["value"] for c in REGISTRY.counters(metric)}
+            df[metric.replace("mongo_command_", "")] = [
+                totals.get((c, k), 0) for c, k in zip(df["command"], df["collection"])
+            ]
+        st.dataframe(df.sort_values("total_s", ascending=False), use_container_width=True)
+
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.write("**Connection pool**")
+        st.json(pool_metrics())
+        st.write("**Spremljeni recepti (sesija)**")
+        st.json(saved_state(user).stats())
+    with col2:
+        st.write("**Cache rezultata**")
+        st.json(services.result_cache_stats())
+    with col3:
+        st.write("**Imenik korisnika**")
+        st.json(services.user_directory_stats())
+        st.write("**Indeks teksta**")
+        st.json(services.text_index_stats())
+        st.write("**Prijedlozi sastojaka**")
+        st.json(services.suggest_index_stats())
+
+    st.subheader(f"Spori upiti (>= {SLOW_MS:.0f} ms)")
+    # planovi se dohvacaju i automatski (METRICS_EXPLAIN_INTERVAL), gumb ne ceka red
+    if not isinstance(db, MemoryBackend) and st.button("Dohvati explain planove"):
+        n = SLOW_LOG.explain_pending(get_client())
+        st.success(f"Explain dohvacen za {n} upita.")
+    slow = SLOW_LOG.entries()
+    if not slow:
+        st.info("Nema sporih upita.")
+    for e in slow:
+        title = f"{e['duration_ms']:.0f} ms  {e['command_name']} {e['db']}.{e['collection']}  ({e['at']:%H:%M:%S})"
+        with st.expander(title):
+            st.write("**Plan:**", e.get("plan") or "-")
+            st.write("**Dokumenata:**", e.get("documents"))
+            if e.get("command") is not None:
+                st.code(str(e["command"]))
+
+    st.subheader("Prometheus")
+    text = REGISTRY.render_prometheus()
+    st.download_button("Preuzmi metrics.txt", text, file_name="metrics.txt")
+    with st.expander("Prometheus text"):
+        st.code(text)
+
 
 def ensure_state():
     if "user" not in st.session_state:
         st.session_state["user"] = None
-    if "saved_ids" not in st.session_state:
-        st.session_state["saved_ids"] = set()
     if "results_all" not in st.session_state:
         st.session_state["results_all"] = None
     if "results_search" not in st.session_state:
         st.session_state["results_search"] = None
     if "results_pantry" not in st.session_state:
         st.session_state["results_pantry"] = None
+    if "results_text" not in st.session_state:
+        st.session_state["results_text"] = None
 
 def main():
     # top bar
@@ -414,17 +718,18 @@ def main():
     if st.sidebar.button("Logout"):
         logout()
 
-    page = st.sidebar.selectbox(
-        "Odaberi",
-        [
-            "Dodaj recept",
-            "Moji recepti",
-            "Svi recepti",
-            "Pretraga",
-            "Imam doma (rangirano)",
-            "Spremljeni",
-        ],
-    )
+    pages = [
+        "Dodaj recept",
+        "Moji recepti",
+        "Svi recepti",
+        "Pretraga",
+        "Pretraga teksta",
+        "Imam doma (rangirano)",
+        "Spremljeni",
+    ]
+    if services.is_admin(user):
+        pages.append("Admin / metrike")
+    page = st.sidebar.selectbox("Odaberi", pages)
 
     if page == "Dodaj recept":
         page_add_recipe(user)
@@ -434,10 +739,14 @@ def main():
         page_all_recipes(user)
     elif page == "Pretraga":
         page_search(user)
+    elif page == "Pretraga teksta":
+        page_text_search(user)
     elif page == "Imam doma (rangirano)":
         page_pantry(user)
     elif page == "Spremljeni":
         page_saved(user)
+    elif page == "Admin / metrike":
+        page_admin(user)
 
 
 
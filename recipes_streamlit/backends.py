@@ -0,0 +1,1194 @@
+from __future__ import annotations
+
+import bisect
+from abc import ABC, abstractmethod
+import heapq
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from bson import ObjectId
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+import recommend
+import trending
+from logic import allergen_mask
+from mongo import (
+    CO_SAVES_COLLECTION,
+    COUNTERS_COLLECTION,
+    FEED_COLLECTION,
+    INGREDIENTS_COLLECTION,
+    MAX_TIME_MS,
+    RECS_COLLECTION,
+    read_options,
+)
+
+
+Doc = Dict[str, Any]
+
+
+### Sortiranja i keyset ###
+
+# keyset paginacija: cursor nosi vrijednosti sort kljuceva zadnjeg vracenog
+# recepta, a sljedeca stranica krece range uvjetom iza njih (bez skip-a)
+SORTS: Dict[str, List[Tuple[str, int]]] = {
+    "newest": [("created_at", -1), ("_id", -1)],
+    "pantry": [("match_count", -1), ("created_at", -1), ("_id", -1)],
+    "trending": [("trend", -1), ("_id", -1)],
+}
+
+# sortiranja koja nude kartice svih recepata i pretraga po sastojcima
+CARD_SORTS = ("newest", "trending")
+
+CARD_FIELDS = ("_id", "title", "ingredient_keys", "allergens", "created_at", "trend")
+
+
+# polja koja mogu nedostajati (trend prije backfill-trend): Mongo ih silazno
+# sortira iza svih brojeva, pa se u keysetu ponasaju kao najmanja vrijednost
+# (isto kao _trend_key u MemoryBackend-u)
+NULLABLE_SORT_FIELDS = ("trend",)
+
+
+def keyset_filter(sort_name: str, values: Sequence[Any]) -> Dict[str, Any]:
+    spec = SORTS[sort_name]
+    branches: List[Dict[str, Any]] = []
+    for i, (field, direction) in enumerate(spec):
+        prefix = {f: v for (f, _), v in zip(spec[:i], values[:i])}
+        if field in NULLABLE_SORT_FIELDS and direction < 0:
+            if values[i] is None:
+                # ispod najmanje vrijednosti nema nicega, ostaje samo grana s jednakim poljem
+                continue
+            branches.append(dict(prefix, **{field: None}))
+        branches.append(dict(prefix, **{field: {"$lt" if direction < 0 else "$gt": values[i]}}))
+    return {"$or": branches}
+
+
+def allergen_filter(exclude_allergens: Sequence[str], use_mask: bool = True) -> Optional[Dict[str, Any]]:
+    # $nin nad multikey poljem allergens ne moze suziti indeks; maska se
+    # provjerava na samom kljucu (created_at, _id, allergen_mask) indeksa
+    if not exclude_allergens:
+        return None
+    if not use_mask:
+        return {"allergens": {"$nin": list(exclude_allergens)}}
+    mask = allergen_mask(exclude_allergens)
+    return {"allergen_mask": {"$bitsAllClear": mask}} if mask else None
+
+
+def _and(*filters: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    parts = [f for f in filters if f]
+    if not parts:
+        return None
+    if len(parts) == 1:
+        return parts[0]
+    return {"$and": parts}
+
+
+### Sucelje ###
+
+# services radi samo preko ovih metoda; Mongo i in-memory implementacija
+# vracaju iste oblike dokumenata. Kartice recepata nose _author_id koji
+# services popuni iz imenika korisnika (ili author_* ako backend sam radi join).
+
+class StorageBackend(ABC):
+
+    name = ""
+    # recipe_cards/pantry_cards filtriraju po ingredient_ids preko key_ids
+    use_ingredient_ids = False
+
+    # korisnici
+    @abstractmethod
+    def find_user(self, username: str) -> Optional[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_user(self, user_id: ObjectId) -> Optional[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_user(self, doc: Doc) -> ObjectId:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_users(self, docs: List[Doc]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def users_by_ids(self, user_ids: List[ObjectId]) -> Dict[ObjectId, Doc]:
+        raise NotImplementedError
+
+    # recepti
+    @abstractmethod
+    def insert_recipe(self, doc: Doc) -> ObjectId:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_recipes(self, docs: List[Doc]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recipe(self, recipe_id: ObjectId, fields: Sequence[str] = ()) -> Optional[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def recipes_by_author(self, user_id: ObjectId, limit: int = 50) -> List[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def inc_recipe_counter(self, recipe_id: ObjectId, field: str, delta: int) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_trend(self, recipe_id: ObjectId, value: float, remove: bool = False) -> None:
+        # log-sum-exp dogadaja u trend recepta (trending.event_value); remove za unsave.
+        # Recept bez trenda (stari podaci) ostaje bez njega do backfill-trend.
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_recipes(self, fields: Sequence[str], batch_size: int = 10000) -> Iterator[Doc]:
+        # po (created_at, _id) uzlazno
+        raise NotImplementedError
+
+    def refresh_feed(self, recipe_ids: List[ObjectId]) -> None:
+        # recepti izmijenjeni mimo backenda (import, odrzavanje); bez feeda nema posla
+        pass
+
+    @abstractmethod
+    def lsh_candidates(self, band_keys: Sequence[int], limit: int) -> List[Doc]:
+        # recepti s barem jednom zajednickom LSH trakom (similarity.py), prvo oni
+        # s najvise zajednickih traka; samo _id i ingredient_keys
+        raise NotImplementedError
+
+    @abstractmethod
+    def recipe_cards(
+        self,
+        author_id: Optional[ObjectId] = None,
+        all_keys: Sequence[str] = (),
+        any_keys: Sequence[str] = (),
+        exclude_keys: Sequence[str] = (),
+        exclude_allergens: Sequence[str] = (),
+        after: Optional[Sequence[Any]] = None,
+        limit: int = 50,
+        sort: str = "newest",
+        key_ids: Optional[Dict[str, int]] = None,
+    ) -> List[Doc]:
+        # key_ids: kljuc -> id za sve kljuceve upita (services ih razrijesi)
+        raise NotImplementedError
+
+    @abstractmethod
+    def pantry_cards(
+        self,
+        pantry_keys: Sequence[str],
+        min_match: int = 1,
+        exclude_allergens: Sequence[str] = (),
+        after: Optional[Sequence[Any]] = None,
+        limit: int = 50,
+        key_ids: Optional[Dict[str, int]] = None,
+    ) -> List[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def cards_by_ids(
+        self,
+        recipe_ids: List[ObjectId],
+        pantry_keys: Sequence[str] = (),
+        key_ids: Optional[Dict[str, int]] = None,
+    ) -> List[Doc]:
+        raise NotImplementedError
+
+    # vokabular sastojaka
+
+    @abstractmethod
+    def ingredient_vocab(self, keys: Sequence[str]) -> Dict[str, Tuple[int, int]]:
+        # kljuc -> (id, df) za poznate kljuceve
+        raise NotImplementedError
+
+    @abstractmethod
+    def register_ingredients(self, counts: Dict[str, int]) -> Dict[str, int]:
+        # dodijeli id-eve novim kljucevima, df += counts[k]; vraca kljuc -> id
+        raise NotImplementedError
+
+    # spremanja
+    @abstractmethod
+    def insert_save(self, doc: Doc) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_saves(self, docs: List[Doc]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_save(self, user_id: ObjectId, recipe_id: ObjectId) -> Optional[Doc]:
+        # obrisano spremanje (treba mu created_at) ili None
+        raise NotImplementedError
+
+    @abstractmethod
+    def saved_recipe_ids(self, user_id: ObjectId) -> Set[ObjectId]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def saved_among(self, user_id: ObjectId, recipe_ids: List[ObjectId]) -> Set[ObjectId]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def saved_recipes(self, user_id: ObjectId, limit: int = 50) -> List[Doc]:
+        raise NotImplementedError
+
+    # preporuke iz spremanja (recommend.py)
+    @abstractmethod
+    def apply_co_saves(self, user_id: ObjectId, recipe_id: ObjectId, delta: int, saved_at: datetime) -> None:
+        # nakon insert_save (+1) ili delete_save (-1) jednog spremanja sa
+        # created_at saved_at; bulk upisi (insert_saves) ne azuriraju
+        # preporuke, za njih je rebuild_recs
+        raise NotImplementedError
+
+    @abstractmethod
+    def recipe_recs(self, recipe_id: ObjectId) -> List[Tuple[ObjectId, int]]:
+        # gotova top-N lista (recipe_id, broj zajednickih spremanja)
+        raise NotImplementedError
+
+    @abstractmethod
+    def rebuild_recs(
+        self,
+        workers: Optional[int] = None,
+        chunk_users: int = 2000,
+        chunk_recipes: int = 50000,
+        progress=None,
+    ) -> Doc:
+        raise NotImplementedError
+
+    # komentari
+    @abstractmethod
+    def insert_comment(self, doc: Doc) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_comments(self, docs: List[Doc]) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def comments_for_recipe(self, recipe_id: ObjectId, limit: int = 100) -> List[Doc]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def comments_for_recipes(self, recipe_ids: List[ObjectId], per_recipe: int = 100) -> Dict[ObjectId, List[Doc]]:
+        raise NotImplementedError
+
+    # generator podataka i benchmark
+    @abstractmethod
+    def drop_all(self) -> None:
+        raise NotImplementedError
+
+    @abstractmethod
+    def sample_ids(self, collection: str, field: str, n: int) -> List[Any]:
+        raise NotImplementedError
+
+
+### Mongo ###
+
+# recipes_feed je materijalizirani oblik kartice: naslov, kljucevi, alergeni,
+# brojaci i ime autora, s _id-em recepta. S feed=True kartice se citaju iz
+# njega jednim find-om po indeksu (bez $lookup-a i $project-a po zahtjevu), a
+# MongoBackend ga odrzava pri upisu recepata, brojaca i korisnika. Cijeli se
+# gradi istim stageovima ($merge) - vidi maintenance.py rebuild-feed/check-feed.
+def feed_stages() -> List[Doc]:
+    return [
+        {"$lookup": {"from": "users", "localField": "author_id", "foreignField": "_id", "as": "author"}},
+        {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
+        {"$project": {
+            "title": 1,
+            "ingredient_keys": 1,
+            "ingredient_ids": 1,
+            "allergens": 1,
+            "allergen_mask": 1,
+            "created_at": 1,
+            "author_id": 1,
+            "author_username": "$author.username",
+            "author_display_name": "$author.display_name",
+            "save_count": {"$ifNull": ["$save_count", 0]},
+            "comment_count": {"$ifNull": ["$comment_count", 0]},
+            "trend": 1,
+        }},
+    ]
+
+
+def trend_update(value: float, remove: bool = False) -> List[Doc]:
+    # update pipeline s istom formulom kao trending.log_add / log_sub
+    if remove:
+        new = {"$add": ["$trend", {"$ln": {"$max": [
+            trending.MIN_FRACTION,
+            {"$subtract": [1, {"$exp": {"$min": [0, {"$subtract": [value, "$trend"]}]}}]},
+        ]}}]}
+    else:
+        hi, lo = {"$max": ["$trend", value]}, {"$min": ["$trend", value]}
+        new = {"$add": [hi, {"$ln": {"$add": [1, {"$exp": {"$subtract": [lo, hi]}}]}}]}
+    return [{"$set": {"trend": {"$cond": [{"$eq": [{"$ifNull": ["$trend", None]}, None]}, None, new]}}}]
+
+
+class MongoBackend(StorageBackend):
+
+    def __init__(
+        self,
+        db,
+        join_authors: bool = False,
+        feed: bool = False,
+        mask_allergens: bool = False,
+        use_ingredient_ids: bool = False,
+    ):
+        self.db = db
+        self.name = db.name
+        # bez imenika korisnika autori se dohvacaju $lookup-om u samom upitu
+        self.join_authors = join_authors
+        self.feed = feed
+        # filtar alergena po allergen_mask umjesto $nin (treba backfill-allergen-mask)
+        self.mask_allergens = mask_allergens
+        # filtri po sastojcima nad ingredient_ids (treba backfill-ingredient-ids)
+        self.use_ingredient_ids = use_ingredient_ids
+
+    def find_user(self, username):
+        return self.db["users"].find_one({"username": username})
+
+    def get_user(self, user_id):
+        return self.db["users"].find_one({"_id": user_id})
+
+    def insert_user(self, doc):
+        return self.db["users"].insert_one(doc).inserted_id
+
+    def insert_users(self, docs):
+        if docs:
+            self.db["users"].insert_many(docs, ordered=False)
+
+    def users_by_ids(self, user_ids):
+        cur = self.db["users"].find({"_id": {"$in": list(user_ids)}}, {"username": 1, "display_name": 1})
+        return {u["_id"]: {"username": u.get("username"), "display_name": u.get("display_name")} for u in cur}
+
+    def refresh_feed(self, recipe_ids):
+        if not self.feed or not recipe_ids:
+            return
+        pipeline = [{"$match": {"_id": {"$in": list(recipe_ids)}}}] + feed_stages()
+        ops = [ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in self.db["recipes"].aggregate(pipeline)]
+        if ops:
+            self.db[FEED_COLLECTION].bulk_write(ops, ordered=False)
+
+    def insert_recipe(self, doc):
+        rid = self.db["recipes"].insert_one(doc).inserted_id
+        self.refresh_feed([rid])
+        return rid
+
+    def insert_recipes(self, docs):
+        if docs:
+            self.db["recipes"].insert_many(docs, ordered=False)
+            self.refresh_feed([d["_id"] for d in docs])
+
+    def get_recipe(self, recipe_id, fields=()):
+        return self.db["recipes"].find_one({"_id": recipe_id}, {f: 1 for f in fields} or None)
+
+    def lsh_candidates(self, band_keys, limit):
+        bands = list(band_keys)
+        pipeline = [
+            {"$match": {"lsh_bands": {"$in": bands}}},
+            {"$project": {
+                "ingredient_keys": 1,
+                "hits": {"$size": {"$filter": {"input": "$lsh_bands", "cond": {"$in": ["$$this", bands]}}}},
+            }},
+            {"$sort": {"hits": -1, "_id": -1}},
+            {"$limit": int(limit)},
+        ]
+        return list(self.db["recipes"].aggregate(pipeline, **read_options()))
+
+    def recipes_by_author(self, user_id, limit=50):
+        cur = (
+            self.db["recipes"].find({"author_id": user_id})
+            .sort("created_at", -1)
+            .limit(int(limit))
+            .max_time_ms(MAX_TIME_MS or None)
+        )
+        return list(cur)
+
+    # Dvostruki upis (recipes pa feed) nije atomican: pad izmedu dva upisa
+    # ostavi karticu sa starim brojacem/trendom. recipes je izvor istine, a
+    # takve kartice ispravlja check-feed --fix.
+    def inc_recipe_counter(self, recipe_id, field, delta):
+        self.db["recipes"].update_one({"_id": recipe_id}, {"$inc": {field: int(delta)}})
+        if self.feed:
+            self.db[FEED_COLLECTION].update_one({"_id": recipe_id}, {"$inc": {field: int(delta)}})
+
+    def add_trend(self, recipe_id, value, remove=False):
+        update = trend_update(value, remove)
+        q = {"_id": recipe_id, "trend": {"$ne": None}}
+        self.db["recipes"].update_one(q, update)
+        if self.feed:
+            self.db[FEED_COLLECTION].update_one(q, update)
+
+    def iter_recipes(self, fields, batch_size=10000):
+        return iter(
+            self.db["recipes"]
+            .find({}, {f: 1 for f in fields})
+            .sort([("created_at", 1), ("_id", 1)])
+            .batch_size(int(batch_size))
+        )
+
+    def _author_join_stages(self, local_field: str) -> List[Doc]:
+        return [
+            {"$lookup": {"from": "users", "localField": local_field, "foreignField": "_id", "as": "author"}},
+            {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
+        ]
+
+    def _enrich_pipeline(
+        self,
+        base_match: Optional[Doc] = None,
+        limit: int = 50,
+        extra_stages: Optional[List[Doc]] = None,
+        include_match_fields: bool = False,
+        sort: Optional[Dict[str, int]] = None,
+    ) -> List[Doc]:
+        pipeline: List[Doc] = []
+        if base_match:
+            pipeline.append({"$match": base_match})
+
+        if extra_stages:
+            pipeline.extend(extra_stages)
+
+        project = {
+            "_id": 1,
+            "title": 1,
+            "ingredient_keys": 1,
+            "allergens": 1,
+            "created_at": 1,
+            "save_count": {"$ifNull": ["$save_count", 0]},
+            "comment_count": {"$ifNull": ["$comment_count", 0]},
+            "trend": 1,
+        }
+        if include_match_fields:
+            project["match_count"] = 1
+            project["match_keys"] = 1
+        if self.feed:
+            project["author_username"] = 1
+            project["author_display_name"] = 1
+        elif self.join_authors:
+            project["author_username"] = "$author.username"
+            project["author_display_name"] = "$author.display_name"
+        else:
+            project["_author_id"] = "$author_id"
+
+        # brojaci su na samom receptu, pa se sort/limit rade prije join-a s autorom
+        pipeline += [
+            {"$sort": sort or dict(SORTS["newest"])},
+            {"$limit": int(limit)},
+        ]
+        if self.join_authors and not self.feed:
+            pipeline += self._author_join_stages("author_id")
+        pipeline.append({"$project": project})
+        return pipeline
+
+    def _cards_collection(self):
+        return self.db[FEED_COLLECTION] if self.feed else self.db["recipes"]
+
+    def _aggregate_cards(self, **kwargs) -> List[Doc]:
+        return list(self._cards_collection().aggregate(self._enrich_pipeline(**kwargs), **read_options()))
+
+    def _key_field(self, keys: Sequence[str], key_ids: Optional[Dict[str, int]]) -> Tuple[str, List[Any]]:
+        # isti redoslijed kao u upitu: $all suzi indeksom po prvom kljucu
+        if key_ids is None:
+            return "ingredient_keys", list(keys)
+        return "ingredient_ids", [key_ids[k] for k in keys if k in key_ids]
+
+    def recipe_cards(self, author_id=None, all_keys=(), any_keys=(), exclude_keys=(), exclude_allergens=(), after=None, limit=50, sort="newest", key_ids=None):
+        filters: List[Doc] = []
+        if author_id is not None:
+            filters.append({"author_id": author_id})
+        for keys, op in ((all_keys, "$all"), (any_keys, "$in"), (exclude_keys, "$nin")):
+            if keys:
+                field, values = self._key_field(keys, key_ids)
+                filters.append({field: {op: values}})
+        filters.append(allergen_filter(exclude_allergens, self.mask_allergens))
+        if after:
+            filters.append(keyset_filter(sort, after))
+        if self.feed:
+            # feed vec ima oblik kartice: jedan find po (created_at, _id) ili (trend, _id) indeksu
+            cur = (
+                self.db[FEED_COLLECTION].find(_and(*filters) or {}, {"author_id": 0, "allergen_mask": 0, "ingredient_ids": 0})
+                .sort(SORTS[sort])
+                .limit(int(limit))
+                .max_time_ms(MAX_TIME_MS or None)
+            )
+            return list(cur)
+        return self._aggregate_cards(base_match=_and(*filters), limit=limit, sort=dict(SORTS[sort]))
+
+    def _match_stages(self, pantry_keys: Sequence[str], key_ids: Optional[Dict[str, int]] = None) -> List[Doc]:
+        field, values = self._key_field(pantry_keys, key_ids)
+        return [
+            {"$addFields": {"match_keys": {"$setIntersection": [f"${field}", values]}}},
+            {"$addFields": {"match_count": {"$size": "$match_keys"}}},
+        ]
+
+    def _match_keys_to_str(self, docs: List[Doc], key_ids: Optional[Dict[str, int]]) -> List[Doc]:
+        # presjek nad id-evima vraca id-eve; kartica pokazuje kljuceve
+        if key_ids is not None:
+            names = {v: k for k, v in key_ids.items()}
+            for d in docs:
+                d["match_keys"] = sorted(names[i] for i in d.get("match_keys") or [])
+        return docs
+
+    def pantry_cards(self, pantry_keys, min_match=1, exclude_allergens=(), after=None, limit=50, key_ids=None):
+        base = None
+        if key_ids is not None and int(min_match) >= 1:
+            # samo recepti s barem jednim sastojkom iz smocnice, preko ingredient_ids indeksa
+            base = {"ingredient_ids": {"$in": self._key_field(pantry_keys, key_ids)[1]}}
+        extra: List[Doc] = []
+        alg = allergen_filter(exclude_allergens, self.mask_allergens)
+        if alg:
+            extra.append({"$match": alg})
+        extra += self._match_stages(pantry_keys, key_ids)
+        extra.append({"$match": {"match_count": {"$gte": int(min_match)}}})
+        if after:
+            extra.append({"$match": keyset_filter("pantry", after)})
+
+        docs = self._aggregate_cards(
+            base_match=base,
+            limit=limit,
+            extra_stages=extra,
+            include_match_fields=True,
+            sort=dict(SORTS["pantry"]),
+        )
+        return self._match_keys_to_str(docs, key_ids)
+
+    def cards_by_ids(self, recipe_ids, pantry_keys=(), key_ids=None):
+        docs = self._aggregate_cards(
+            base_match={"_id": {"$in": list(recipe_ids)}},
+            limit=len(recipe_ids),
+            extra_stages=self._match_stages(pantry_keys, key_ids) if pantry_keys else None,
+            include_match_fields=bool(pantry_keys),
+        )
+        return self._match_keys_to_str(docs, key_ids) if pantry_keys else docs
+
+    def ingredient_vocab(self, keys):
+        cur = self.db[INGREDIENTS_COLLECTION].find({"_id": {"$in": list(keys)}})
+        return {d["_id"]: (d["id"], d.get("df", 0)) for d in cur}
+
+    def register_ingredients(self, counts):
+        vocab = self.db[INGREDIENTS_COLLECTION]
+        ids = {k: iid for k, (iid, _) in self.ingredient_vocab(list(counts)).items()}
+        new = [k for k in counts if k not in ids]
+        if new:
+            # blok id-eva jednim $inc; kljuc koji je u meduvremenu dodao drugi
+            # proces zadrzi svoj id, a rezervirani ostane neiskoristen
+            seq = self.db[COUNTERS_COLLECTION].find_one_and_update(
+                {"_id": INGREDIENTS_COLLECTION},
+                {"$inc": {"n": len(new)}},
+                upsert=True,
+                return_document=ReturnDocument.AFTER,
+            )
+            first = seq["n"] - len(new) + 1
+            try:
+                vocab.insert_many([{"_id": k, "id": first + i, "df": 0} for i, k in enumerate(new)], ordered=False)
+            except BulkWriteError as e:
+                if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                    raise
+            ids.update((k, iid) for k, (iid, _) in self.ingredient_vocab(new).items())
+        ops = [UpdateOne({"_id": k}, {"$inc": {"df": int(n)}}) for k, n in counts.items() if n]
+        if ops:
+            vocab.bulk_write(ops, ordered=False)
+        return ids
+
+    def insert_save(self, doc):
+        self.db["saves"].insert_one(doc)
+
+    def insert_saves(self, docs):
+        if docs:
+            self.db["saves"].insert_many(docs, ordered=False)
+
+    def delete_save(self, user_id, recipe_id):
+        return self.db["saves"].find_one_and_delete({"user_id": user_id, "recipe_id": recipe_id})
+
+    def saved_recipe_ids(self, user_id):
+        cur = self.db["saves"].find({"user_id": user_id}, {"recipe_id": 1}).max_time_ms(MAX_TIME_MS or None)
+        return {d["recipe_id"] for d in cur}
+
+    def saved_among(self, user_id, recipe_ids):
+        # pokriven unique (user_id, recipe_id) indeksom, bez citanja dokumenata
+        q = {"user_id": user_id, "recipe_id": {"$in": list(recipe_ids)}}
+        cur = self.db["saves"].find(q, {"_id": 0, "recipe_id": 1}).max_time_ms(MAX_TIME_MS or None)
+        return {d["recipe_id"] for d in cur}
+
+    def saved_recipes(self, user_id, limit=50):
+        project = {
+            "_id": 0,
+            "saved_at": "$created_at",
+            "recipe_id": "$recipe._id",
+            "title": "$recipe.title",
+            "allergens": "$recipe.allergens",
+            "ingredient_keys": "$recipe.ingredient_keys"
+        }
+        pipeline = [
+            {"$match": {"user_id": user_id}},
+            {"$sort": {"created_at": -1}},
+            {"$lookup": {
+                "from": FEED_COLLECTION if self.feed else "recipes",
+                "localField": "recipe_id",
+                "foreignField": "_id",
+                "as": "recipe",
+            }},
+            {"$unwind": {"path": "$recipe", "preserveNullAndEmptyArrays": False}},
+        ]
+        if self.feed:
+            project["author_username"] = "$recipe.author_username"
+        elif self.join_authors:
+            pipeline += self._author_join_stages("recipe.author_id")
+            project["author_username"] = "$author.username"
+        else:
+            project["_author_id"] = "$recipe.author_id"
+        pipeline += [
+            {"$project": project},
+            {"$limit": int(limit)}
+        ]
+        return list(self.db["saves"].aggregate(pipeline, **read_options()))
+
+    def apply_co_saves(self, user_id, recipe_id, delta, saved_at):
+        recommend.apply_delta(self.db, user_id, recipe_id, delta, saved_at)
+
+    def recipe_recs(self, recipe_id):
+        return recommend.recipe_recs(self.db, recipe_id)
+
+    def rebuild_recs(self, workers=None, chunk_users=2000, chunk_recipes=50000, progress=None):
+        return recommend.rebuild(self.db, workers, chunk_users, chunk_recipes, progress)
+
+    def insert_comment(self, doc):
+        self.db["comments"].insert_one(doc)
+
+    def insert_comments(self, docs):
+        if docs:
+            self.db["comments"].insert_many(docs, ordered=False)
+
+    def _comment_author_stages(self) -> List[Doc]:
+        if not self.join_authors:
+            return [{"$project": {"text": 1, "created_at": 1, "_author_id": "$user_id"}}]
+        return self._author_join_stages("user_id") + [
+            {"$project": {"text": 1, "created_at": 1, "author_username": "$author.username"}},
+        ]
+
+    def comments_for_recipe(self, recipe_id, limit=100):
+        pipeline = [
+            {"$match": {"recipe_id": recipe_id}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": int(limit)},
+        ]
+        pipeline += self._comment_author_stages()
+        return list(self.db["comments"].aggregate(pipeline, **read_options()))
+
+    def comments_for_recipes(self, recipe_ids, per_recipe=100):
+        # jedan upit za cijelu stranicu kartica: za svaki recept index seek po
+        # (recipe_id, created_at) i zadnjih per_recipe komentara s autorom
+        pipeline = [
+            {"$match": {"_id": {"$in": list(recipe_ids)}}},
+            {"$project": {"_id": 1}},
+            {"$lookup": {
+                "from": "comments",
+                "localField": "_id",
+                "foreignField": "recipe_id",
+                "pipeline": [
+                    {"$sort": {"created_at": -1}},
+                    {"$limit": int(per_recipe)},
+                ] + self._comment_author_stages(),
+                "as": "comments",
+            }},
+        ]
+        return {d["_id"]: d["comments"] for d in self.db["recipes"].aggregate(pipeline, **read_options())}
+
+    def drop_all(self):
+        for name in (
+            "users", "recipes", "saves", "comments",
+            FEED_COLLECTION, CO_SAVES_COLLECTION, RECS_COLLECTION, INGREDIENTS_COLLECTION, COUNTERS_COLLECTION,
+        ):
+            self.db[name].drop()
+
+    def sample_ids(self, collection, field, n):
+        pipeline = [{"$sample": {"size": int(n)}}, {"$project": {field: 1}}]
+        return [d[field] for d in self.db[collection].aggregate(pipeline) if d.get(field) is not None]
+
+
+### In-memory ###
+
+# Cijeli skup podataka u procesu, s pravim sekundarnim indeksima:
+#   - recepti po (created_at, _id), po autoru, po ingredient key-u i alergenu
+#   - spremanja po (user, recipe) (unique), po korisniku i po receptu
+#   - komentari po receptu, korisnici po username-u (unique)
+# Sluzi za testove i benchmark bez mongod procesa te kao read-only edge cache
+# (MemoryBackend.from_mongo). Vrijeme se reze na milisekunde kao u BSON-u, da
+# keyset cursori kroz json_util daju isti poredak kao na Mongu.
+
+def _bson_time(dt: Optional[datetime]) -> datetime:
+    dt = dt or datetime.utcnow()
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+
+
+def _after_key(after: Sequence[Any]) -> Tuple[Any, ...]:
+    # vrijednosti iz cursora; datum moze doci tz-aware ovisno o json_util opcijama
+    return tuple(_bson_time(v) if isinstance(v, datetime) else v for v in after)
+
+
+def _trend_key(trend: Optional[float], rid: ObjectId) -> Tuple[float, ObjectId]:
+    # recept bez trenda (prije backfill-trend) ide na kraj trending poretka
+    return (float("-inf") if trend is None else float(trend), rid)
+
+
+class MemoryBackend(StorageBackend):
+
+    def __init__(self, name: str = "memory"):
+        self.name = name
+        self._lock = threading.RLock()
+        self.drop_all()
+
+    def drop_all(self):
+        with self._lock:
+            self._users: Dict[ObjectId, Doc] = {}
+            self._by_username: Dict[str, ObjectId] = {}
+
+            self._recipes: Dict[ObjectId, Doc] = {}
+            self._order: List[Tuple[datetime, ObjectId]] = []
+            self._trend_order: List[Tuple[float, ObjectId]] = []
+            self._by_author: Dict[ObjectId, List[Tuple[datetime, ObjectId]]] = {}
+            self._by_key: Dict[str, Set[ObjectId]] = {}
+            # kljuc -> id; df je len(_by_key[k])
+            self._vocab: Dict[str, int] = {}
+            self._masks: Dict[ObjectId, int] = {}
+            self._by_band: Dict[int, Set[ObjectId]] = {}
+
+            self._saves: Dict[Tuple[ObjectId, ObjectId], Doc] = {}
+            self._saves_by_user: Dict[ObjectId, List[Tuple[datetime, ObjectId]]] = {}
+            self._saves_by_recipe: Dict[ObjectId, Set[ObjectId]] = {}
+            self._co: Dict[ObjectId, Dict[ObjectId, int]] = {}
+            self._recs: Dict[ObjectId, List[Tuple[ObjectId, int]]] = {}
+
+            self._comments: Dict[ObjectId, Doc] = {}
+            self._comments_by_recipe: Dict[ObjectId, List[Tuple[datetime, ObjectId]]] = {}
+
+    @classmethod
+    def from_mongo(cls, db, batch_size: int = 10000) -> "MemoryBackend":
+        mem = cls(name=db.name)
+        for coll, insert in (
+            ("users", mem.insert_users),
+            ("recipes", mem.insert_recipes),
+            ("saves", mem.insert_saves),
+            ("comments", mem.insert_comments),
+        ):
+            batch: List[Doc] = []
+            for d in db[coll].find({}).batch_size(int(batch_size)):
+                batch.append(d)
+                if len(batch) >= batch_size:
+                    insert(batch)
+                    batch = []
+            insert(batch)
+        return mem
+
+    def __len__(self) -> int:
+        return len(self._recipes)
+
+    # korisnici
+
+    def find_user(self, username):
+        with self._lock:
+            uid = self._by_username.get(username)
+            return dict(self._users[uid]) if uid is not None else None
+
+    def get_user(self, user_id):
+        with self._lock:
+            u = self._users.get(user_id)
+            return dict(u) if u else None
+
+    def _insert_user(self, doc: Doc) -> ObjectId:
+        if doc.get("username") in self._by_username:
+            raise DuplicateKeyError("E11000 duplicate key error: username")
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        doc["created_at"] = _bson_time(doc.get("created_at"))
+        self._users[doc["_id"]] = doc
+        self._by_username[doc.get("username")] = doc["_id"]
+        return doc["_id"]
+
+    def insert_user(self, doc):
+        with self._lock:
+            return self._insert_user(doc)
+
+    def insert_users(self, docs):
+        with self._lock:
+            for d in docs:
+                self._insert_user(d)
+
+    def users_by_ids(self, user_ids):
+        with self._lock:
+            return {
+                uid: {"username": u.get("username"), "display_name": u.get("display_name")}
+                for uid, u in ((uid, self._users.get(uid)) for uid in user_ids) if u
+            }
+
+    # recepti
+
+    def _insert_recipe(self, doc: Doc) -> ObjectId:
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        if doc["_id"] in self._recipes:
+            raise DuplicateKeyError("E11000 duplicate key error: _id")
+        doc["created_at"] = _bson_time(doc.get("created_at"))
+        rid = doc["_id"]
+        sort_key = (doc["created_at"], rid)
+
+        self._recipes[rid] = doc
+        bisect.insort(self._order, sort_key)
+        bisect.insort(self._trend_order, _trend_key(doc.get("trend"), rid))
+        bisect.insort(self._by_author.setdefault(doc.get("author_id"), []), sort_key)
+        for k in doc.get("ingredient_keys") or []:
+            self._by_key.setdefault(k, set()).add(rid)
+            self._vocab.setdefault(k, len(self._vocab) + 1)
+        self._masks[rid] = allergen_mask(doc.get("allergens") or [])
+        for b in doc.get("lsh_bands") or []:
+            self._by_band.setdefault(b, set()).add(rid)
+        return rid
+
+    def insert_recipe(self, doc):
+        with self._lock:
+            return self._insert_recipe(doc)
+
+    def insert_recipes(self, docs):
+        with self._lock:
+            for d in docs:
+                self._insert_recipe(d)
+
+    def get_recipe(self, recipe_id, fields=()):
+        with self._lock:
+            r = self._recipes.get(recipe_id)
+            if r is None:
+                return None
+            # kao Mongo projekcija: samo trazena polja (koja postoje) i _id
+            if fields:
+                return {f: r[f] for f in set(fields) | {"_id"} if f in r}
+            return dict(r)
+
+    def lsh_candidates(self, band_keys, limit):
+        with self._lock:
+            hits = Counter(rid for b in band_keys for rid in self._by_band.get(b, ()))
+            top = heapq.nlargest(int(limit), hits.items(), key=lambda kv: (kv[1], kv[0]))
+            return [{"_id": rid, "ingredient_keys": list(self._recipes[rid].get("ingredient_keys") or [])} for rid, _ in top]
+
+    def _newest_first(self, order: List[Tuple[datetime, ObjectId]], after: Optional[Sequence[Any]]) -> Iterator[ObjectId]:
+        end = len(order)
+        if after:
+            end = bisect.bisect_left(order, _after_key(after))
+        for i in range(end - 1, -1, -1):
+            yield order[i][1]
+
+    def recipes_by_author(self, user_id, limit=50):
+        with self._lock:
+            order = self._by_author.get(user_id, [])
+            out = []
+            for rid in self._newest_first(order, None):
+                if len(out) >= int(limit):
+                    break
+                out.append(dict(self._recipes[rid]))
+            return out
+
+    def inc_recipe_counter(self, recipe_id, field, delta):
+        with self._lock:
+            r = self._recipes.get(recipe_id)
+            if r is not None:
+                r[field] = r.get(field, 0) + int(delta)
+
+    def add_trend(self, recipe_id, value, remove=False):
+        with self._lock:
+            r = self._recipes.get(recipe_id)
+            if r is None or r.get("trend") is None:
+                return
+            old = _trend_key(r.get("trend"), recipe_id)
+            del self._trend_order[bisect.bisect_left(self._trend_order, old)]
+            r["trend"] = trending.log_sub(r.get("trend"), value) if remove else trending.log_add(r.get("trend"), value)
+            bisect.insort(self._trend_order, _trend_key(r["trend"], recipe_id))
+
+    def iter_recipes(self, fields, batch_size=10000):
+        with self._lock:
+            order = list(self._order)
+        for _, rid in order:
+            r = self._recipes.get(rid)
+            if r is not None:
+                yield {f: r.get(f) for f in set(fields) | {"_id"}}
+
+    def _card(self, r: Doc) -> Doc:
+        card = {f: r.get(f) for f in CARD_FIELDS}
+        card["ingredient_keys"] = list(card["ingredient_keys"] or [])
+        card["allergens"] = list(card["allergens"] or [])
+        card["save_count"] = r.get("save_count") or 0
+        card["comment_count"] = r.get("comment_count") or 0
+        card["_author_id"] = r.get("author_id")
+        return card
+
+    def _excluded(self, exclude_keys: Sequence[str]) -> Set[ObjectId]:
+        out: Set[ObjectId] = set()
+        for k in exclude_keys:
+            out |= self._by_key.get(k, set())
+        return out
+
+    def recipe_cards(self, author_id=None, all_keys=(), any_keys=(), exclude_keys=(), exclude_allergens=(), after=None, limit=50, sort="newest", key_ids=None):
+        # skupovi su vec po kljucu, pa key_ids ovdje ne treba
+        limit = int(limit)
+        trend = sort == "trending"
+        if trend and after:
+            after = _trend_key(*after)
+        with self._lock:
+            cand: Optional[Set[ObjectId]] = None
+            # $all: presjek od najmanjeg skupa prema vecima
+            for k in sorted(set(all_keys), key=lambda k: len(self._by_key.get(k, ()))):
+                ids = self._by_key.get(k, set())
+                cand = set(ids) if cand is None else cand & ids
+                if not cand:
+                    return []
+            if any_keys:
+                union: Set[ObjectId] = set()
+                for k in set(any_keys):
+                    union |= self._by_key.get(k, set())
+                cand = union if cand is None else cand & union
+
+            skip = self._excluded(exclude_keys)
+            mask = allergen_mask(exclude_allergens)
+            if trend:
+                order = self._trend_order
+            else:
+                order = self._order if author_id is None else self._by_author.get(author_id, [])
+
+            def ok(rid: ObjectId) -> bool:
+                if rid in skip or self._masks[rid] & mask:
+                    return False
+                if author_id is not None and self._recipes[rid].get("author_id") != author_id:
+                    return False
+                return cand is None or rid in cand
+
+            out: List[Doc] = []
+            if cand is None or len(cand) * 8 >= len(order):
+                # siroki filter: hodanje po (created_at, _id) / (trend, _id) indeksu brzo nade limit pogodaka
+                for rid in self._newest_first(order, after):
+                    if ok(rid):
+                        out.append(self._card(self._recipes[rid]))
+                        if len(out) >= limit:
+                            break
+                return out
+
+            # uski filter: top-N kandidata po sort kljucu
+            after_key = _after_key(after) if after else None
+            keys = (
+                _trend_key(self._recipes[rid].get("trend"), rid) if trend else (self._recipes[rid]["created_at"], rid)
+                for rid in cand if ok(rid)
+            )
+            if after_key is not None:
+                keys = (k for k in keys if k < after_key)
+            return [self._card(self._recipes[rid]) for _, rid in heapq.nlargest(limit, keys)]
+
+    def _with_matches(self, r: Doc, pantry: Set[str], count: Optional[int] = None) -> Doc:
+        card = self._card(r)
+        card["match_keys"] = sorted(set(card["ingredient_keys"]) & pantry)
+        card["match_count"] = len(card["match_keys"]) if count is None else count
+        return card
+
+    def pantry_cards(self, pantry_keys, min_match=1, exclude_allergens=(), after=None, limit=50, key_ids=None):
+        pantry = set(pantry_keys)
+        with self._lock:
+            counts: Counter = Counter()
+            for k in pantry:
+                counts.update(self._by_key.get(k, ()))
+            mask = allergen_mask(exclude_allergens)
+            keys = (
+                (c, self._recipes[rid]["created_at"], rid) for rid, c in counts.items()
+                if c >= int(min_match) and not self._masks[rid] & mask
+            )
+            if after:
+                after_key = _after_key(after)
+                keys = (k for k in keys if k < after_key)
+            top = heapq.nlargest(int(limit), keys)
+            return [self._with_matches(self._recipes[rid], pantry, c) for c, _, rid in top]
+
+    def cards_by_ids(self, recipe_ids, pantry_keys=(), key_ids=None):
+        pantry = set(pantry_keys)
+        card = (lambda r: self._with_matches(r, pantry)) if pantry else self._card
+        with self._lock:
+            return [card(self._recipes[rid]) for rid in recipe_ids if rid in self._recipes]
+
+    def ingredient_vocab(self, keys):
+        with self._lock:
+            return {k: (self._vocab[k], len(self._by_key.get(k, ()))) for k in keys if k in self._vocab}
+
+    def register_ingredients(self, counts):
+        with self._lock:
+            return {k: self._vocab.setdefault(k, len(self._vocab) + 1) for k in counts}
+
+    # spremanja
+
+    def _insert_save(self, doc: Doc) -> None:
+        key = (doc["user_id"], doc["recipe_id"])
+        if key in self._saves:
+            raise DuplicateKeyError("E11000 duplicate key error: user_id_1_recipe_id_1")
+        doc = dict(doc)
+        doc["created_at"] = _bson_time(doc.get("created_at"))
+        self._saves[key] = doc
+        bisect.insort(self._saves_by_user.setdefault(doc["user_id"], []), (doc["created_at"], doc["recipe_id"]))
+        self._saves_by_recipe.setdefault(doc["recipe_id"], set()).add(doc["user_id"])
+
+    def insert_save(self, doc):
+        with self._lock:
+            self._insert_save(doc)
+
+    def insert_saves(self, docs):
+        with self._lock:
+            for d in docs:
+                self._insert_save(d)
+
+    def delete_save(self, user_id, recipe_id):
+        with self._lock:
+            doc = self._saves.pop((user_id, recipe_id), None)
+            if doc is None:
+                return None
+            by_user = self._saves_by_user.get(user_id, [])
+            i = bisect.bisect_left(by_user, (doc["created_at"], recipe_id))
+            if i < len(by_user) and by_user[i] == (doc["created_at"], recipe_id):
+                del by_user[i]
+            self._saves_by_recipe.get(recipe_id, set()).discard(user_id)
+            return dict(doc)
+
+    def saved_recipe_ids(self, user_id):
+        with self._lock:
+            return {rid for _, rid in self._saves_by_user.get(user_id, [])}
+
+    def saved_among(self, user_id, recipe_ids):
+        with self._lock:
+            return {rid for rid in recipe_ids if (user_id, rid) in self._saves}
+
+    def saved_recipes(self, user_id, limit=50):
+        with self._lock:
+            out = []
+            for saved_at, rid in reversed(self._saves_by_user.get(user_id, [])):
+                r = self._recipes.get(rid)
+                if r is None:
+                    continue
+                out.append({
+                    "saved_at": saved_at,
+                    "recipe_id": rid,
+                    "title": r.get("title"),
+                    "allergens": list(r.get("allergens") or []),
+                    "ingredient_keys": list(r.get("ingredient_keys") or []),
+                    "_author_id": r.get("author_id"),
+                })
+                if len(out) >= int(limit):
+                    break
+            return out
+
+    # preporuke
+
+    def apply_co_saves(self, user_id, recipe_id, delta, saved_at):
+        with self._lock:
+            key = (_bson_time(saved_at), recipe_id)
+            newest = [s for s in reversed(self._saves_by_user.get(user_id, [])) if s[1] != recipe_id]
+            newest = newest[:recommend.MAX_USER_SAVES]
+            position = sum(1 for s in newest if s > key)
+            changes = recommend.window_changes([rid for _, rid in newest], position, recipe_id, delta)
+            partners = changes[0][1] if changes else []
+            if not partners:
+                return
+            for rid, _, d in changes:
+                for o in partners:
+                    for a, b in ((rid, o), (o, rid)):
+                        row = self._co.setdefault(a, {})
+                        row[b] = row.get(b, 0) + int(d)
+                        if row[b] <= 0:
+                            del row[b]
+            changed = [rid for rid, _, _ in changes]
+            for rid in changed:
+                self._recs[rid] = recommend.top_n(self._co.get(rid, {}))
+            for o in partners:
+                row = self._co.get(o, {})
+                new = recommend.merge_recs(self._recs.get(o, []), [(rid, row.get(rid, 0)) for rid in changed])
+                self._recs[o] = new if new is not None else recommend.top_n(row)
+
+    def recipe_recs(self, recipe_id):
+        with self._lock:
+            return list(self._recs.get(recipe_id, []))
+
+    def rebuild_recs(self, workers=None, chunk_users=2000, chunk_recipes=50000, progress=None):
+        t0 = time.perf_counter()
+        with self._lock:
+            groups = [[rid for _, rid in reversed(rows)] for rows in self._saves_by_user.values()]
+            counts = recommend.pair_counts(groups)
+            co: Dict[ObjectId, Dict[ObjectId, int]] = {}
+            for (a, b), n in counts.items():
+                co.setdefault(a, {})[b] = n
+            self._co = co
+            self._recs = {rid: recommend.top_n(row) for rid, row in co.items()}
+        return {"workers": 1, "users": len(groups), "recipes": len(co), "pairs": len(counts), "seconds": time.perf_counter() - t0}
+
+    # komentari
+
+    def _insert_comment(self, doc: Doc) -> None:
+        doc = dict(doc)
+        doc.setdefault("_id", ObjectId())
+        doc["created_at"] = _bson_time(doc.get("created_at"))
+        self._comments[doc["_id"]] = doc
+        bisect.insort(self._comments_by_recipe.setdefault(doc["recipe_id"], []), (doc["created_at"], doc["_id"]))
+
+    def insert_comment(self, doc):
+        with self._lock:
+            self._insert_comment(doc)
+
+    def insert_comments(self, docs):
+        with self._lock:
+            for d in docs:
+                self._insert_comment(d)
+
+    def _comment_rows(self, recipe_id: ObjectId, limit: int) -> List[Doc]:
+        rows = self._comments_by_recipe.get(recipe_id, [])
+        out = []
+        for _, cid in reversed(rows[-int(limit):] if limit else []):
+            c = self._comments[cid]
+            out.append({"_id": cid, "text": c.get("text"), "created_at": c["created_at"], "_author_id": c.get("user_id")})
+        return out
+
+    def comments_for_recipe(self, recipe_id, limit=100):
+        with self._lock:
+            return self._comment_rows(recipe_id, limit)
+
+    def comments_for_recipes(self, recipe_ids, per_recipe=100):
+        with self._lock:
+            return {rid: self._comment_rows(rid, per_recipe) for rid in recipe_ids if rid in self._recipes}
+
+    def sample_ids(self, collection, field, n):
+        with self._lock:
+            if collection == "users":
+                rows = [{"_id": uid} for uid in self._users]
+            elif collection == "recipes":
+                rows = [{"_id": rid} for rid in self._recipes]
+            elif collection == "saves":
+                rows = list(self._saves.values())
+            elif collection == "comments":
+                rows = list(self._comments.values())
+            else:
+                return []
+            picked = random.sample(rows, min(int(n), len(rows)))
+            return [d[field] for d in picked if d.get(field) is not None]
+
+
+def as_backend(
+    db,
+    join_authors: bool = False,
+    feed: bool = False,
+    mask_allergens: bool = False,
+    use_ingredient_ids: bool = False,
+) -> StorageBackend:
+    # services prima ili gotov backend ili pymongo Database (dosadasnji pozivi)
+    if isinstance(db, StorageBackend):
+        return db
+    return MongoBackend(
+        db,
+        join_authors=join_authors,
+        feed=feed,
+        mask_allergens=mask_allergens,
+        use_ingredient_ids=use_ingredient_ids,
+    )
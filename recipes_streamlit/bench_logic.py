@@ -0,0 +1,115 @@
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import time
+import unicodedata
+from typing import Callable, List
+
+import logic
+
+
+### Mikro-benchmark normalizacije ###
+
+# Provjerava da je normalize_key identican staroj implementaciji (svi Unicode
+# znakovi pojedinacno + nasumicni nizovi + realni nazivi sastojaka) i mjeri
+# brzinu stare, nove bez memo cache-a i nove s toplim cache-om.
+
+
+def normalize_key_reference(text: str) -> str:
+    # stara implementacija iz logic.py, ostavljena samo za usporedbu
+    text = (text or "").strip().lower()
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^a-z0-9\s_-]", "", text)
+    text = re.sub(r"\s+", " ", text).strip().replace(" ", "_")
+    return text
+
+
+INGREDIENTS = [
+    "Piletina", "Riža", "Luk", "Češnjak", "Rajčica", "Tjestenina", "Mlijeko", "Jaja",
+    "Zobene pahuljice", "Banana", "Šunka", "Sir", "Slanutak", "Brašno", "Orah",
+    "Đumbir", "Indijski oraščići", "Sojin umak", "Maslinovo ulje", "Crveni  luk",
+    "  Kiselo vrhnje ", "Pšenično brašno T-550", "Ječam", "Inćuni", "Lješnjaci",
+    "Mljevena paprika (slatka)", "Sol & papar", "Krumpir", "Tikvica", "Patlidžan",
+]
+
+
+def _random_text(rng: random.Random, alphabet: List[str]) -> str:
+    return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 24)))
+
+
+def check_equivalence(samples: int, seed: int) -> List[str]:
+    failures = []
+
+    for code in range(sys.maxunicode + 1):
+        if 0xD800 <= code <= 0xDFFF:
+            continue
+        ch = chr(code)
+        for text in (ch, f"a{ch}b", f" {ch}{ch} "):
+            if logic.normalize_key(text) != normalize_key_reference(text):
+                failures.append(repr(text))
+        logic.normalize_key.cache_clear()
+
+    rng = random.Random(seed)
+    alphabet = list("abcčćdđefghijklmnoprsštuvzžABCČĆŠŽ0123456789 _-.,()&'\t\n  ") + [
+        "é", "̈", "ﬁ", "①", "Ⅻ", "ǅ", "İ", "ß", "​", "　",
+    ]
+    for _ in range(samples):
+        text = _random_text(rng, alphabet)
+        if logic.normalize_key(text) != normalize_key_reference(text):
+            failures.append(repr(text))
+
+    for text in INGREDIENTS + [None, "", "   "]:
+        if logic.normalize_key(text) != normalize_key_reference(text):
+            failures.append(repr(text))
+
+    return failures
+
+
+def _bench(fn: Callable[[str], str], texts: List[str], repeat: int, before: Callable[[], None] = lambda: None) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        before()
+        t0 = time.perf_counter()
+        for t in texts:
+            fn(t)
+        best = min(best, time.perf_counter() - t0)
+    return best / len(texts) * 1e9
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provjera i benchmark logic.normalize_key.")
+    parser.add_argument("--samples", type=int, default=200_000)
+    parser.add_argument("--names", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    failures = check_equivalence(args.samples, args.seed)
+    if failures:
+        print(f"RAZLIKA u {len(failures)} ulaza, npr: {failures[:10]}")
+        return 1
+    print("normalize_key: identican rezultat kao referentna implementacija")
+
+    rng = random.Random(args.seed)
+    texts = [rng.choice(INGREDIENTS) + rng.choice(["", " svježi", " (bio)", " 2"]) for _ in range(args.names)]
+    unique = list({t: None for t in texts})
+
+    uncached = logic.normalize_key.__wrapped__
+    results = [
+        ("referentna", _bench(normalize_key_reference, unique, args.repeat)),
+        ("nova, bez cache-a", _bench(uncached, unique, args.repeat)),
+        ("nova, hladni cache", _bench(logic.normalize_key, texts, args.repeat, logic.normalize_key.cache_clear)),
+        ("nova, topli cache", _bench(logic.normalize_key, texts, args.repeat)),
+    ]
+    base = results[0][1]
+    for name, ns in results:
+        print(f"{name:<22} {ns:9.0f} ns/poziv   {base / ns:5.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
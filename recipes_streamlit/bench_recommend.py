@@ -0,0 +1,149 @@
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from typing import Dict, List
+
+from bson import ObjectId
+
+import recommend
+import services
+from backends import MemoryBackend, MongoBackend
+from mongo import CO_SAVES_COLLECTION
+
+
+### Provjera inkrementalnih preporuka ###
+
+# Nasumicna spremanja/uklanjanja kroz services (isti put kao app) na
+# MemoryBackend-u i na MongoBackend-u nad mongomock-om (recommend.apply_delta),
+# pa usporedba co_saves i recipe_recs s punom obnovom. Prozor MAX_USER_SAVES
+# se smanjuje (--window) da korisnici imaju vise spremanja od prozora i da se
+# spremanja/uklanjanja dogadaju i izvan njega. Uz to merge_rec na granici
+# pune liste (jednaki brojevi, par na dnu liste, ispadanje) protiv top_n nad
+# cijelim retkom.
+
+INGREDIENTS = ["brasno", "jaja", "mlijeko", "sol", "secer", "luk", "rajcica", "tuna", "riza", "sir", "maslac", "orasi"]
+
+
+def co_rows(backend) -> Dict[ObjectId, Dict[ObjectId, int]]:
+    if isinstance(backend, MemoryBackend):
+        return {a: dict(row) for a, row in backend._co.items() if row}
+    rows: Dict[ObjectId, Dict[ObjectId, int]] = {}
+    for d in backend.db[CO_SAVES_COLLECTION].find({"n": {"$gt": 0}}):
+        rows.setdefault(d["r"], {})[d["o"]] = d["n"]
+    return rows
+
+
+def check_incremental(backend, users: int, recipes: int, ops: int, seed: int, pause: float = 0.0) -> List[str]:
+    rng = random.Random(seed)
+    uids = []
+    for i in range(users):
+        u, _ = services.register(backend, f"user{i}", "pw", f"User {i}")
+        uids.append(u["_id"])
+    rids = []
+    for i in range(recipes):
+        ings = [{"name": n} for n in rng.sample(INGREDIENTS, rng.randint(2, 5))]
+        rid, _, _ = services.create_recipe(backend, uids[i % users], f"Recept {i}", "", ings, ["korak"])
+        rids.append(rid)
+
+    failures = []
+    saved = set()
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        pair = (rng.choice(uids), rng.choice(rids))
+        if pair in saved and rng.random() < 0.5:
+            ok, msg = services.unsave_recipe(backend, *pair)
+            saved.discard(pair)
+        elif pair not in saved:
+            ok, msg = services.save_recipe(backend, *pair)
+            saved.add(pair)
+        else:
+            continue
+        if not ok:
+            failures.append(f"{pair}: {msg}")
+        if pause:
+            # Mongo cuva created_at u ms; jednaki datumi nemaju zadani poredak
+            time.sleep(pause)
+    incremental_s = time.perf_counter() - t0
+
+    incremental = {rid: backend.recipe_recs(rid) for rid in rids}
+    co = co_rows(backend)
+    t0 = time.perf_counter()
+    backend.rebuild_recs(workers=1)
+    rebuild_s = time.perf_counter() - t0
+
+    if co != co_rows(backend):
+        failures.append("co_saves se razlikuje od pune obnove")
+    for rid in rids:
+        full = backend.recipe_recs(rid)
+        if incremental[rid] != full:
+            failures.append(f"recipe_recs {rid}: {incremental[rid][:3]} != {full[:3]}")
+    print(
+        f"{type(backend).__name__}: {len(saved)} spremanja nakon {ops} operacija: "
+        f"inkrementalno {incremental_s:.2f}s, obnova {rebuild_s * 1000:.0f} ms"
+    )
+    return failures
+
+
+def check_merge_rec(rows: int, seed: int) -> List[str]:
+    # mali brojevi -> puno jednakih kljuceva oko zadnjeg mjesta pune liste
+    rng = random.Random(seed)
+    failures = []
+    checked_full = 0
+    for _ in range(rows):
+        row: Dict[ObjectId, int] = {ObjectId(): rng.randint(1, 4) for _ in range(rng.randint(recommend.TOP_N - 3, recommend.TOP_N + 6))}
+        recs = recommend.top_n(row)
+        full = len(recs) == recommend.TOP_N
+        checked_full += full
+
+        candidates = list(row) + [ObjectId()]
+        if full:
+            # parovi na dnu liste i prvi ispod nje
+            candidates += [recs[-1][0]] + [o for o, _ in recommend.top_n(row, recommend.TOP_N + 2)[recommend.TOP_N:]]
+        for rid in candidates:
+            for n in range(0, 6):
+                new_row = dict(row)
+                new_row[rid] = n
+                expected = recommend.top_n(new_row)
+                got = recommend.merge_rec(recs, rid, n)
+                was_in = any(o == rid for o, _ in recs)
+                if got is None and not (full and was_in):
+                    failures.append(f"None za par izvan pune liste (n={n})")
+                elif got is not None and got != expected:
+                    failures.append(f"{'puna' if full else 'nepuna'} lista, n={n}: {got[-2:]} != {expected[-2:]}")
+    print(f"merge_rec: {rows} redaka, od toga {checked_full} punih lista")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provjera inkrementalnih preporuka (co_saves/recipe_recs) i merge_rec.")
+    parser.add_argument("--users", type=int, default=25)
+    parser.add_argument("--recipes", type=int, default=40)
+    parser.add_argument("--ops", type=int, default=3000)
+    parser.add_argument("--mongo-ops", type=int, default=300, help="operacija na mongomock-u (0 = preskoci)")
+    parser.add_argument("--window", type=int, default=8, help="MAX_USER_SAVES za provjeru")
+    parser.add_argument("--rows", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    recommend.MAX_USER_SAVES = args.window
+    failures = check_incremental(MemoryBackend("bench_recommend"), args.users, args.recipes, args.ops, args.seed)
+    if args.mongo_ops:
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock nije instaliran (pip install mongomock).")
+        backend = MongoBackend(mongomock.MongoClient()["bench_recommend"])
+        failures += check_incremental(backend, args.users, args.recipes, args.mongo_ops, args.seed, pause=0.002)
+    failures += check_merge_rec(args.rows, args.seed)
+    if failures:
+        print(f"RAZLIKA u {len(failures)} slucajeva, npr: {failures[:10]}")
+        return 1
+    print("preporuke: inkrementalno azuriranje identicno punoj obnovi")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,267 @@
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import datagen
+import services
+from backends import MemoryBackend
+from mongo import ensure_indexes
+
+
+Doc = Dict[str, Any]
+
+
+### Benchmark services sloja ###
+
+# Za svaku velicinu skupa podataka generira (ili ponovno koristi) bazu
+# bench_<n>, pa mjeri svaki ulaz u services s nasumicnim, ali ponovljivim
+# upitima. Cache rezultata se prazni prije svakog poziva da se mjeri upit, a
+# ne cache. Rezultat je JSON s p50/p95/p99 koji se moze spremiti kao baseline
+# i kasnije usporediti (--compare) - izlazni kod 1 znaci regresiju.
+#
+#   python bench_services.py --sizes 10000,100000 --out baseline.json
+#   python bench_services.py --sizes 10000,100000 --compare baseline.json
+#   python bench_services.py --target memory --sizes 10000,1000000
+
+
+def percentile(sorted_samples: List[float], q: float) -> float:
+    # nearest-rank na sortiranim uzorcima
+    if not sorted_samples:
+        return 0.0
+    k = max(0, min(len(sorted_samples) - 1, math.ceil(q * len(sorted_samples)) - 1))
+    return sorted_samples[k]
+
+
+def summarize(samples: List[float]) -> Doc:
+    s = sorted(samples)
+    return {
+        "n": len(s),
+        "mean_ms": sum(s) / len(s) * 1000 if s else 0.0,
+        "p50_ms": percentile(s, 0.50) * 1000,
+        "p95_ms": percentile(s, 0.95) * 1000,
+        "p99_ms": percentile(s, 0.99) * 1000,
+        "max_ms": s[-1] * 1000 if s else 0.0,
+    }
+
+
+def open_client(target: str):
+    if target == "memory":
+        # svaka velicina dobije svoj MemoryBackend, vidi prepare_db
+        return None
+    if target == "mongo":
+        from mongo import get_client
+        return get_client()
+    if target == "mongomock":
+        try:
+            import mongomock
+        except ImportError:
+            raise SystemExit("mongomock nije instaliran (pip install mongomock).")
+        return mongomock.MongoClient()
+    raise SystemExit(f"Nepoznat target: {target}")
+
+
+def prepare_db(client, size: int, seed: int, reuse: bool, indexes: bool, log: Callable[[str], None]):
+    if client is None:
+        db = MemoryBackend(name=f"bench_{size}")
+    else:
+        db = client[f"bench_{size}"]
+    if client is not None and reuse and db["recipes"].estimated_document_count() == size:
+        log(f"  baza {db.name} vec ima {size} recepata, preskacem generiranje")
+        # baze generirane prije recipes_feed
+        if services.ensure_recipes_feed(db):
+            log("  recipes_feed izgraden")
+        if not services.detect_allergen_mask(db):
+            log("  recepti bez allergen_mask, alergeni se filtriraju s $nin")
+        if not services.detect_ingredient_ids(db):
+            log("  recepti bez ingredient_ids, sastojci se filtriraju po kljucevima")
+        return db
+    log(f"  generiram {size} recepata u {db.name}...")
+    stats = datagen.generate(db, recipes=size, seed=seed, drop=True)
+    if indexes:
+        # mongomock ne razumije partialFilterExpression, a indeksi mu ionako ne mijenjaju plan
+        ensure_indexes(db)
+    log(f"  generirano za {stats['seconds']:.1f}s ({stats['saves']} saveova, {stats['comments']} komentara)")
+    return db
+
+
+def _sample_ids(db, coll: str, field: str, n: int) -> List[Any]:
+    return services.get_backend(db).sample_ids(coll, field, n)
+
+
+def build_queries(db, rng: random.Random, n: int) -> Dict[str, List[Callable[[], Any]]]:
+    keys = datagen.ZipfSampler(datagen._vocabulary(5000), 1.1, rng)
+    user_ids = _sample_ids(db, "saves", "user_id", n) or _sample_ids(db, "users", "_id", n)
+    recipe_ids = _sample_ids(db, "comments", "recipe_id", n) or _sample_ids(db, "recipes", "_id", n)
+    exa_choices = ["", "", "gluten", "mlijeko", "orasasti_plodovi"]
+
+    queries: Dict[str, List[Callable[[], Any]]] = {
+        "list_all_recipes_enriched": [],
+        "list_all_recipes_trending": [],
+        "search_by_ingredients_enriched": [],
+        "pantry_ranked_search_enriched": [],
+        "list_saved_recipes": [],
+        "list_comments_for_recipe": [],
+        "search_text": [],
+        "similar_recipes": [],
+    }
+    for i in range(n):
+        inc = ",".join(keys.sample(rng.randint(1, 2)))
+        any_ = ",".join(keys.sample(2)) if rng.random() < 0.3 else ""
+        pantry = ",".join(keys.sample(rng.randint(4, 10)))
+        exa = rng.choice(exa_choices)
+        text = f"{rng.choice(datagen.DISHES)} {rng.choice(datagen.TITLE_WORDS)[:rng.randint(2, 5)]}"
+        uid = user_ids[i % len(user_ids)]
+        rid = recipe_ids[i % len(recipe_ids)]
+
+        queries["list_all_recipes_enriched"].append(lambda: services.list_all_recipes_enriched(db, limit=50))
+        queries["list_all_recipes_trending"].append(lambda: services.list_all_recipes_enriched(db, limit=50, sort="trending"))
+        queries["search_by_ingredients_enriched"].append(
+            lambda inc=inc, any_=any_, exa=exa: services.search_by_ingredients_enriched(db, inc, any_, "", exa, limit=50)
+        )
+        queries["pantry_ranked_search_enriched"].append(
+            lambda pantry=pantry, exa=exa: services.pantry_ranked_search_enriched(db, pantry, 1, exa, limit=50)
+        )
+        queries["list_saved_recipes"].append(lambda uid=uid: services.list_saved_recipes(db, uid, limit=50))
+        queries["list_comments_for_recipe"].append(lambda rid=rid: services.list_comments_for_recipe(db, rid, limit=100))
+        queries["search_text"].append(lambda text=text: services.search_text(db, text, limit=20))
+        queries["similar_recipes"].append(lambda rid=rid: services.similar_recipes(db, rid, limit=10))
+    return queries
+
+
+def run_queries(calls: List[Callable[[], Any]], warmup: int) -> Tuple[Optional[Doc], Optional[str]]:
+    samples: List[float] = []
+    try:
+        for i, call in enumerate(calls):
+            services.clear_result_cache()
+            t0 = time.perf_counter()
+            call()
+            dt = time.perf_counter() - t0
+            if i >= warmup:
+                samples.append(dt)
+    except Exception as e:
+        # npr. mongomock ne podrzava sve operatore agregacije
+        return None, f"{type(e).__name__}: {e}"
+    return summarize(samples), None
+
+
+def run(
+    target: str = "mongo",
+    sizes: List[int] = (10000,),
+    queries: int = 200,
+    warmup: int = 10,
+    seed: int = 42,
+    reuse: bool = True,
+    pantry_index: bool = False,
+    log: Callable[[str], None] = print,
+) -> Doc:
+    client = open_client(target)
+    if target == "mongomock":
+        # mongomock ne podrzava $bitsAllClear
+        services.USE_ALLERGEN_MASK = False
+    report: Doc = {
+        "meta": {
+            "target": target,
+            "queries": queries,
+            "warmup": warmup,
+            "seed": seed,
+            "pantry_index": pantry_index,
+            "python": platform.python_version(),
+            "created_at": datetime.utcnow().isoformat(),
+        },
+        "results": {},
+    }
+
+    for size in sizes:
+        log(f"[{size}]")
+        db = prepare_db(client, size, seed, reuse, target == "mongo", log)
+        if pantry_index:
+            services.enable_pantry_index(db)
+        else:
+            services.disable_pantry_index()
+        services.enable_text_index(db)
+
+        rng = random.Random(seed)
+        per_size: Doc = {}
+        for name, calls in build_queries(db, rng, queries + warmup).items():
+            summary, err = run_queries(calls, warmup)
+            per_size[name] = summary if summary else {"error": err}
+            if summary:
+                log(f"  {name:<32} p50 {summary['p50_ms']:8.2f}  p95 {summary['p95_ms']:8.2f}  p99 {summary['p99_ms']:8.2f} ms")
+            else:
+                log(f"  {name:<32} GRESKA {err}")
+        report["results"][str(size)] = per_size
+
+    services.disable_pantry_index()
+    return report
+
+
+def compare(report: Doc, baseline: Doc, metric: str = "p95_ms", threshold: float = 1.2, floor_ms: float = 1.0) -> List[str]:
+    # regresija: novi rezultat je > threshold puta sporiji i barem floor_ms sporiji
+    regressions = []
+    for size, entries in report["results"].items():
+        base_entries = baseline.get("results", {}).get(size, {})
+        for name, cur in entries.items():
+            base = base_entries.get(name)
+            if not base or metric not in base or metric not in cur:
+                continue
+            old, new = base[metric], cur[metric]
+            ratio = new / old if old else float("inf")
+            status = "REGRESIJA" if ratio > threshold and new - old > floor_ms else "ok"
+            print(f"  [{size}] {name:<32} {metric} {old:8.2f} -> {new:8.2f} ms  ({ratio:4.2f}x) {status}")
+            if status != "ok":
+                regressions.append(f"{size}/{name}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark services funkcija na sintetickim podacima.")
+    parser.add_argument("--target", choices=["mongo", "mongomock", "memory"], default="mongo")
+    parser.add_argument("--sizes", default="10000,100000", help="velicine skupa odvojene zarezom")
+    parser.add_argument("--queries", type=int, default=200, help="broj mjerenih upita po funkciji")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--regenerate", action="store_true", help="generiraj podatke i ako baza vec postoji")
+    parser.add_argument("--pantry-index", action="store_true", help="pantry pretraga preko PantryIndex")
+    parser.add_argument("--out", default=None, help="spremi rezultat kao JSON")
+    parser.add_argument("--compare", default=None, help="usporedi s baseline JSON-om")
+    parser.add_argument("--metric", default="p95_ms", choices=["p50_ms", "p95_ms", "p99_ms", "mean_ms"])
+    parser.add_argument("--threshold", type=float, default=1.2)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    report = run(
+        target=args.target,
+        sizes=sizes,
+        queries=args.queries,
+        warmup=args.warmup,
+        seed=args.seed,
+        reuse=not args.regenerate,
+        pantry_index=args.pantry_index,
+    )
+
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Rezultat spremljen u {args.out}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.metric, args.threshold)
+        if regressions:
+            print(f"Regresije: {', '.join(regressions)}")
+            return 1
+        print("Nema regresija.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,124 @@
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import datagen
+from backends import MemoryBackend
+from suggest import TOP_K, SuggestIndex, max_distance
+
+
+### Provjera ispravka tipfelera (OSA) ###
+
+# SuggestIndex._fuzzy (setnja po sortiranom vokabularu s odsijecanjem
+# podstabala) protiv izravne OSA udaljenosti do svakog kljuca, za cijelu
+# rijec (correct) i za prefiks (suggest), za limit do TOP_K kao u suggest.
+# Vokabulari: nasumicne rijeci nad malom abecedom (puno bliskih kljuceva) i
+# kljucevi iz datagen korpusa s nasumicnim tipfelerima u upitu.
+
+ALPHABET = "abcdeo_"
+TYPO_ALPHABET = "abcdefghijklmnoprstuvz_"
+
+
+def osa_reference(a: str, b: str) -> List[int]:
+    # zadnji redak DP tablice: [j] = OSA udaljenost a do b[:j]
+    d = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) + 1):
+        d[i][0] = i
+    for j in range(len(b) + 1):
+        d[0][j] = j
+    for i in range(1, len(a) + 1):
+        for j in range(1, len(b) + 1):
+            d[i][j] = min(d[i - 1][j] + 1, d[i][j - 1] + 1, d[i - 1][j - 1] + (a[i - 1] != b[j - 1]))
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                d[i][j] = min(d[i][j], d[i - 2][j - 2] + 1)
+    return d[len(a)]
+
+
+def fuzzy_reference(
+    distances: Dict[str, List[int]], counts: Dict[str, int], limit: int, max_dist: int, prefix: bool
+) -> List[Tuple[int, str]]:
+    scored = []
+    for k, row in distances.items():
+        d = min(row) if prefix else row[-1]
+        if d <= max_dist:
+            scored.append((d, -counts[k], k))
+    return [(d, k) for d, _, k in sorted(scored)[:limit]]
+
+
+def _typo(rng: random.Random, word: str) -> str:
+    i = rng.randrange(len(word) + 1)
+    op = rng.choice("isdt")
+    if op == "i":
+        return word[:i] + rng.choice(TYPO_ALPHABET) + word[i:]
+    if i >= len(word):
+        return word + rng.choice(TYPO_ALPHABET)
+    if op == "s":
+        return word[:i] + rng.choice(TYPO_ALPHABET) + word[i + 1:]
+    if op == "d":
+        return word[:i] + word[i + 1:]
+    return word[:i] + word[i + 1:i + 2] + word[i] + word[i + 2:]
+
+
+def check_fuzzy(index: SuggestIndex, queries: List[str], limits: List[int]) -> Tuple[List[str], float, float]:
+    failures = []
+    index_s = reference_s = 0.0
+    for q in queries:
+        t0 = time.perf_counter()
+        distances = {k: osa_reference(q, k) for k in index._counts}
+        reference_s += time.perf_counter() - t0
+        for max_dist in sorted({1, 2, max_distance(q)}):
+            for prefix in (False, True):
+                for limit in limits:
+                    t0 = time.perf_counter()
+                    got = index._fuzzy(q, limit, max_dist, prefix=prefix)
+                    index_s += time.perf_counter() - t0
+                    expected = fuzzy_reference(distances, index._counts, limit, max_dist, prefix)
+                    if got != expected:
+                        mode = "prefiks" if prefix else "rijec"
+                        failures.append(f"'{q}' d<={max_dist} {mode} limit={limit}: {got[:3]} != {expected[:3]}")
+    return failures, index_s, reference_s
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provjera OSA ispravka tipfelera suggest.SuggestIndex.")
+    parser.add_argument("--keys", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=300)
+    parser.add_argument("--typos", type=int, default=50)
+    parser.add_argument("--recipes", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+    rng = random.Random(args.seed)
+
+    dense = SuggestIndex("dense")
+    # nasumican redoslijed dodavanja: trie cvorovi moraju ispravno primati
+    # kljuceve s istim df-om kad su vec puni (mali df -> puno jednakih)
+    keys = sorted({"".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 9))) for _ in range(args.keys)})
+    rng.shuffle(keys)
+    for k in keys:
+        dense._add_key(k, rng.randint(1, 10))
+    queries = ["".join(rng.choice(ALPHABET) for _ in range(rng.randint(1, 9))) for _ in range(args.queries)]
+    failures, index_s, reference_s = check_fuzzy(dense, queries, [1, 5, TOP_K])
+    print(f"gusti vokabular ({len(dense)} kljuceva): indeks {index_s * 1000:.0f} ms, izravno {reference_s * 1000:.0f} ms")
+
+    backend = MemoryBackend("bench_suggest")
+    datagen.generate(backend, recipes=args.recipes, seed=args.seed)
+    corpus = SuggestIndex.build(backend)
+    keys = sorted(corpus._counts)
+    queries = [_typo(rng, _typo(rng, k) if rng.random() < 0.3 else k) for k in rng.sample(keys, min(args.typos, len(keys)))]
+    more, index_s, reference_s = check_fuzzy(corpus, queries, [1, TOP_K])
+    failures += more
+    print(f"datagen vokabular ({len(corpus)} kljuceva): indeks {index_s * 1000:.0f} ms, izravno {reference_s * 1000:.0f} ms")
+
+    if failures:
+        print(f"RAZLIKA u {len(failures)} upita, npr: {failures[:10]}")
+        return 1
+    print("suggest: OSA ispravak identican izravnom racunu")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
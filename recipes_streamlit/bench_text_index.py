@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import argparse
+import math
+import random
+import sys
+import time
+from collections import Counter
+from typing import Dict, List, Tuple
+
+from bson import ObjectId
+
+import datagen
+import text_index
+from backends import MemoryBackend
+from text_index import B, FIELD_WEIGHTS, K1, TextIndex, tokenize
+
+
+### Provjera BM25 rangiranja ###
+
+# TextIndex (numpy i cisti Python put) protiv izravnog BM25 racuna nad svim
+# zivim receptima, nakon sto je dio recepata ponovno dodan s izmijenjenim
+# tekstom (mrtvi zapisi u posting listama, df samo zivih). Mjeri se i
+# vrijeme upita u usporedbi s prolaskom kroz cijeli korpus.
+
+EDIT_WORDS = ["sarma", "kupus", "brza", "juha", "bakina", "torta", "pita", "sir"]
+
+
+def _tf(doc: Dict) -> Counter:
+    tf: Counter = Counter()
+    for field, weight in FIELD_WEIGHTS.items():
+        value = doc.get(field)
+        for tok in tokenize(" ".join(map(str, value)) if isinstance(value, list) else str(value or "")):
+            tf[tok] += weight
+    return tf
+
+
+def bm25_reference(docs: Dict[ObjectId, Counter], query: str) -> Dict[ObjectId, float]:
+    tokens = list(dict.fromkeys(tokenize(query)))
+    n = len(docs)
+    avgdl = sum(sum(tf.values()) for tf in docs.values()) / n
+    df = {t: sum(1 for tf in docs.values() if t in tf) for t in tokens}
+    scores = {}
+    for rid, tf in docs.items():
+        dl = sum(tf.values())
+        s = 0.0
+        for t in tokens:
+            if t in tf:
+                idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+                s += idf * tf[t] * (K1 + 1) / (tf[t] + K1 * (1 - B + B * dl / avgdl))
+        if s > 0:
+            scores[rid] = s
+    return scores
+
+
+def _search(index: TextIndex, query: str, limit: int, use_numpy: bool, prefix: bool = False) -> List[Tuple[ObjectId, float]]:
+    np_ = text_index.np
+    if not use_numpy:
+        text_index.np = None
+    try:
+        return index.search(query, limit=limit, prefix=prefix)
+    finally:
+        text_index.np = np_
+
+
+def _close(a: float, b: float) -> bool:
+    # posting liste drze tf i duljine kao float32
+    return abs(a - b) <= 1e-4 * max(1.0, abs(b))
+
+
+def check_ranking(recipes: int, edits: int, queries: int, limit: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    backend = MemoryBackend("bench_text")
+    datagen.generate(backend, recipes=recipes, seed=seed)
+    index = TextIndex.build(backend)
+
+    docs = {d["_id"]: d for d in backend.iter_recipes(tuple(FIELD_WEIGHTS))}
+    rids = list(docs)
+    for _ in range(edits):
+        rid = rng.choice(rids)
+        docs[rid] = dict(docs[rid], title=" ".join(rng.sample(EDIT_WORDS, 2)) + " " + str(docs[rid].get("title") or ""))
+        index.add(rid, docs[rid])
+    tfs = {rid: _tf(d) for rid, d in docs.items()}
+
+    words = sorted({t for tf in tfs.values() for t in tf})
+    failures = []
+    index_ms = reference_ms = 0.0
+    for _ in range(queries):
+        query = " ".join(rng.sample(EDIT_WORDS + rng.sample(words, 5), rng.randint(1, 3)))
+        t0 = time.perf_counter()
+        expected = bm25_reference(tfs, query)
+        reference_ms += (time.perf_counter() - t0) * 1000
+        top = sorted(expected.values(), reverse=True)[:limit]
+
+        for use_numpy in ([True, False] if text_index.np is not None else [False]):
+            t0 = time.perf_counter()
+            got = _search(index, query, limit, use_numpy)
+            index_ms += (time.perf_counter() - t0) * 1000
+            path = "numpy" if use_numpy else "python"
+            if len(got) != len(top) or not all(_close(s, e) for (_, s), e in zip(got, top)):
+                failures.append(f"{path} '{query}': {[round(s, 3) for _, s in got[:3]]} != {[round(s, 3) for s in top[:3]]}")
+            elif not all(_close(s, expected.get(rid, 0.0)) for rid, s in got):
+                failures.append(f"{path} '{query}': krivi recept za dani score")
+
+        # prosirenje prefiksom: oba puta moraju dati isto
+        prefix_query = query[:-1] if len(query) > 3 else query
+        if text_index.np is not None:
+            a = _search(index, prefix_query, limit, True, prefix=True)
+            b = _search(index, prefix_query, limit, False, prefix=True)
+            if [round(s, 3) for _, s in a] != [round(s, 3) for _, s in b]:
+                failures.append(f"prefiks '{prefix_query}': numpy i python se razlikuju")
+
+    runs = queries * (2 if text_index.np is not None else 1)
+    print(
+        f"{len(docs)} recepata, {edits} izmjena: indeks {index_ms / runs:.2f} ms/upit, "
+        f"izravni BM25 {reference_ms / queries:.1f} ms/upit, {index.stats()}"
+    )
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Provjera BM25 rangiranja text_index.TextIndex.")
+    parser.add_argument("--recipes", type=int, default=3000)
+    parser.add_argument("--edits", type=int, default=500)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    failures = check_ranking(args.recipes, args.edits, args.queries, args.limit, args.seed)
+    if failures:
+        print(f"RAZLIKA u {len(failures)} upita, npr: {failures[:10]}")
+        return 1
+    print("text_index: BM25 rangiranje identicno izravnom racunu")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
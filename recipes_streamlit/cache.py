@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Set, Tuple
+
+
+### Cache rezultata pretraga ###
+
+# LRU + TTL cache s generacijama. Svaki unos pamti generaciju i redni broj
+# zadnjeg upisa u trenutku kad je upit pokrenut (token) te id-eve recepata
+# koje sadrzi. bump_all() ponistava sve (novi recept moze uci u bilo koji
+# rezultat), bump(rid) samo unose u kojima se taj recept pojavljuje.
+
+class ResultCache:
+
+    def __init__(self, max_entries: int = 256, ttl_seconds: float = 60.0, max_tracked: int = 100_000):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self.max_tracked = int(max_tracked)
+
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, Tuple[float, int, int, Tuple[Any, ...], List[Any]]]" = OrderedDict()
+        self._generation = 0
+        self._seq = 0
+        self._touched: Dict[Any, int] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def token(self) -> Tuple[int, int]:
+        with self._lock:
+            return self._generation, self._seq
+
+    def bump_all(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._touched.clear()
+
+    def bump(self, dep: Any) -> None:
+        with self._lock:
+            self._seq += 1
+            if len(self._touched) >= self.max_tracked:
+                # ne mozemo zaboraviti upis bez rizika da stari unos ostane valjan
+                self._generation += 1
+                self._touched.clear()
+            self._touched[dep] = self._seq
+
+    def get(self, key: Hashable) -> Optional[List[Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            expires_at, generation, seq, deps, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if generation != self._generation or any(self._touched.get(d, 0) > seq for d in deps):
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return list(value)
+
+    def put(self, key: Hashable, value: List[Any], deps: Iterable[Any], token: Tuple[int, int]) -> None:
+        generation, seq = token
+        with self._lock:
+            if generation != self._generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, generation, seq, tuple(deps), list(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits / total) if total else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "invalidations": self.invalidations,
+                "generation": self._generation,
+            }
+
+
+### Imenik korisnika ###
+
+# id -> username/display_name za popunjavanje autora nakon upita, umjesto
+# $lookup-a u users za svaki red rezultata. Korisnika je malo i stalno se
+# citaju isti, pa je dovoljan ograniceni LRU. Izmjenu korisnika iz drugog
+# procesa invalidate ne vidi, pa unos vrijedi ttl sekundi.
+
+class UserDirectory:
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 300.0):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Any, Tuple[Dict[str, Any], float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, backend, user_ids: Iterable[Any]) -> Dict[Any, Dict[str, Any]]:
+        now = time.monotonic()
+        found: Dict[Any, Dict[str, Any]] = {}
+        missing = []
+        with self._lock:
+            for uid in set(user_ids):
+                if uid is None:
+                    continue
+                entry = self._entries.get(uid)
+                if entry is None or now - entry[1] > self.ttl_seconds:
+                    missing.append(uid)
+                    continue
+                self._entries.move_to_end(uid)
+                found[uid] = entry[0]
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = backend.users_by_ids(missing)
+            with self._lock:
+                for uid, entry in loaded.items():
+                    self._entries[uid] = (entry, now)
+                    self._entries.move_to_end(uid)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            found.update(loaded)
+
+        return found
+
+    def invalidate(self, user_id: Any = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+### Vokabular sastojaka ###
+
+# kljuc sastojka -> (id, df) za prevodenje upita u ingredient_ids. Vokabular
+# je ogranicen i rijetko se mijenja, pa unos vrijedi ttl sekundi (df sluzi
+# samo za poredak uvjeta). Nepoznati kljucevi se ne pamte: sljedeci recept ih
+# moze dodati, a upit za njih je jedan _id lookup.
+
+class VocabularyCache:
+
+    def __init__(self, max_entries: int = 200000, ttl_seconds: float = 300.0):
+        self.max_entries = int(max_entries)
+        self.ttl_seconds = float(ttl_seconds)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[int, int, float]]" = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get_many(self, backend, keys: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        now = time.monotonic()
+        found: Dict[str, Tuple[int, int]] = {}
+        missing = []
+        with self._lock:
+            for k in set(keys):
+                entry = self._entries.get((backend.name, k))
+                if entry is None or now - entry[2] > self.ttl_seconds:
+                    missing.append(k)
+                    continue
+                self._entries.move_to_end((backend.name, k))
+                found[k] = (entry[0], entry[1])
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            loaded = backend.ingredient_vocab(missing)
+            with self._lock:
+                for k, (iid, df) in loaded.items():
+                    self._entries[(backend.name, k)] = (iid, df, now)
+                    self._entries.move_to_end((backend.name, k))
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+                    self.evictions += 1
+            found.update(loaded)
+
+        return found
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+### Spremljeni recepti sesije ###
+
+# Koje je od prikazanih recepata korisnik spremio. Umjesto cijele povijesti
+# saves pri svakom rerunu, stanje se puni samo za prikazane id-eve (jedan $in
+# upit po unique (user_id, recipe_id) indeksu), save/unsave ga mijenjaju na
+# mjestu, a id se ponovno provjerava tek kad mu istekne ttl (npr. spremanje
+# iz druge sesije istog korisnika).
+
+class SavedState:
+
+    def __init__(self, user_id: Any, ttl_seconds: float = 300.0):
+        self.user_id = user_id
+        self.ttl_seconds = float(ttl_seconds)
+        self._saved: Dict[Any, bool] = {}
+        self._checked: Dict[Any, float] = {}
+
+        self.lookups = 0
+        self.checked_ids = 0
+
+    def saved_among(self, recipe_ids: Iterable[Any], load: Callable[[List[Any]], Set[Any]]) -> Set[Any]:
+        ids = list(dict.fromkeys(recipe_ids))
+        now = time.monotonic()
+        stale = [rid for rid in ids if now - self._checked.get(rid, float("-inf")) > self.ttl_seconds]
+        if stale:
+            found = load(stale)
+            for rid in stale:
+                self._saved[rid] = rid in found
+                self._checked[rid] = now
+            self.lookups += 1
+            self.checked_ids += len(stale)
+        return {rid for rid in ids if self._saved.get(rid)}
+
+    def apply(self, recipe_id: Any, saved: bool) -> None:
+        # ishod save/unsave je svjez podatak, pa se id ne mora ponovno provjeravati
+        self._saved[recipe_id] = saved
+        self._checked[recipe_id] = time.monotonic()
+
+    def forget(self, recipe_id: Any) -> None:
+        # neuspjeli save/unsave: stanje je mozda zastarjelo, provjeri pri sljedecem prikazu
+        self._saved.pop(recipe_id, None)
+        self._checked.pop(recipe_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "known": len(self._saved),
+            "saved": sum(1 for v in self._saved.values() if v),
+            "lookups": self.lookups,
+            "checked_ids": self.checked_ids,
+        }
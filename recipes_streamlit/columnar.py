@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import io
+import json
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # bez pyarrow-a radi samo NDJSON i pandas put
+    pa = None
+    pq = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+
+Doc = Dict[str, Any]
+Schema = Sequence[Tuple[str, str]]
+
+
+### Stupcani rezultati ###
+
+# Rezultat upita pretvara se u stupce jednim prolazom po dokumentima (lista
+# po stupcu), bez kopije dokumenta po retku i bez rekurzivnog serialize_doc-a.
+# Dokumenti mogu doci izravno iz kursora: nijedan se ne zadrzava nakon sto mu
+# se vrijednosti prepisu u stupce. Tip stupca je zadan shemom pa Arrow/Parquet
+# dobiju stabilne tipove bez zakljucivanja iz podataka: id -> string, time ->
+# timestamp[ms], list -> list<string>.
+
+CARD_SCHEMA: Schema = [
+    ("title", "str"),
+    ("author_username", "str"),
+    ("author_display_name", "str"),
+    ("save_count", "int"),
+    ("comment_count", "int"),
+    ("match_count", "int"),
+    ("match_keys", "list"),
+    ("score", "float"),
+    ("similarity", "float"),
+    ("co_saves", "int"),
+    ("allergens", "list"),
+    ("ingredient_keys", "list"),
+    ("created_at", "time"),
+    ("_id", "id"),
+]
+
+# izvoz za analitiku; lozinke korisnika se ne izvoze
+EXPORT_SCHEMAS: Dict[str, Schema] = {
+    "recipes": [
+        ("_id", "id"),
+        ("author_id", "id"),
+        ("title", "str"),
+        ("description", "str"),
+        ("ingredient_keys", "list"),
+        ("allergens", "list"),
+        ("steps", "list"),
+        ("save_count", "int"),
+        ("comment_count", "int"),
+        ("rules_version", "str"),
+        ("created_at", "time"),
+    ],
+    "saves": [
+        ("_id", "id"),
+        ("user_id", "id"),
+        ("recipe_id", "id"),
+        ("created_at", "time"),
+    ],
+    "comments": [
+        ("_id", "id"),
+        ("recipe_id", "id"),
+        ("user_id", "id"),
+        ("text", "str"),
+        ("created_at", "time"),
+    ],
+    "users": [
+        ("_id", "id"),
+        ("username", "str"),
+        ("display_name", "str"),
+        ("created_at", "time"),
+    ],
+}
+
+
+def _id(v: Any) -> Any:
+    return str(v) if v is not None else None
+
+
+def _str(v: Any) -> Any:
+    return str(v) if v is not None else None
+
+
+def _int(v: Any) -> Any:
+    return int(v) if v is not None else None
+
+
+def _float(v: Any) -> Any:
+    return float(v) if v is not None else None
+
+
+def _list(v: Any) -> List[str]:
+    return [str(x) for x in v] if v else []
+
+
+def _time(v: Any) -> Any:
+    return v if isinstance(v, datetime) else None
+
+
+CONVERTERS: Dict[str, Callable[[Any], Any]] = {
+    "id": _id,
+    "str": _str,
+    "int": _int,
+    "float": _float,
+    "list": _list,
+    "time": _time,
+}
+
+
+def present(docs: Sequence[Doc], schema: Schema) -> Schema:
+    # samo stupci koji postoje u barem jednom dokumentu (npr. match_count samo za pantry)
+    return [(f, kind) for f, kind in schema if any(f in d for d in docs)]
+
+
+def to_columns(docs: Iterable[Doc], schema: Schema) -> Dict[str, List[Any]]:
+    fields = [(f, CONVERTERS[kind], []) for f, kind in schema]
+    for d in docs:
+        for f, convert, column in fields:
+            column.append(convert(d.get(f)))
+    return {f: column for f, _, column in fields}
+
+
+def to_dataframe(docs: Iterable[Doc], schema: Schema):
+    if pd is None:
+        raise RuntimeError("pandas nije instaliran.")
+    columns = to_columns(docs, schema)
+    return pd.DataFrame(columns, columns=[f for f, _ in schema])
+
+
+def arrow_schema(schema: Schema):
+    types = {
+        "id": pa.string(),
+        "str": pa.string(),
+        "int": pa.int64(),
+        "float": pa.float64(),
+        "list": pa.list_(pa.string()),
+        "time": pa.timestamp("ms"),
+    }
+    return pa.schema([(f, types[kind]) for f, kind in schema])
+
+
+def columns_to_arrow(columns: Dict[str, List[Any]], schema: Schema):
+    if pa is None:
+        raise RuntimeError("pyarrow nije instaliran (pip install pyarrow).")
+    return pa.Table.from_pydict(columns, schema=arrow_schema(schema))
+
+
+def to_arrow(docs: Iterable[Doc], schema: Schema):
+    return columns_to_arrow(to_columns(docs, schema), schema)
+
+
+def _json_value(v: Any) -> Any:
+    if isinstance(v, datetime):
+        return v.isoformat()
+    return v
+
+
+def columns_to_ndjson_lines(columns: Dict[str, List[Any]], schema: Schema) -> Iterator[str]:
+    names = [f for f, _ in schema]
+    for row in zip(*(columns[f] for f in names)):
+        yield json.dumps({f: _json_value(v) for f, v in zip(names, row)}, ensure_ascii=False)
+
+
+def to_ndjson_lines(docs: Iterable[Doc], schema: Schema) -> Iterator[str]:
+    return columns_to_ndjson_lines(to_columns(docs, schema), schema)
+
+
+def to_parquet_bytes(docs: Iterable[Doc], schema: Schema) -> bytes:
+    buf = io.BytesIO()
+    pq.write_table(to_arrow(docs, schema), buf, compression="zstd")
+    return buf.getvalue()
+
@@ -0,0 +1,210 @@
+from __future__ import annotations
+
+import argparse
+import bisect
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from bson import ObjectId
+
+import services
+import trending
+
+
+Doc = Dict[str, Any]
+
+
+### Sinteticki podaci ###
+
+# Sastojci su Zipf-distribuirani: mali broj cestih (luk, sol, ulje...) i dugi
+# rep rijetkih. Stvarni nazivi su na pocetku ranga pa alergeni (mlijeko, jaja,
+# brasno, orasi...) izlaze u realnim omjerima preko detect_allergens, a rep
+# vokabulara su sinteticki sastojci bez alergena. Isti seed daje iste podatke.
+
+COMMON_INGREDIENTS = [
+    "Luk", "Sol", "Maslinovo ulje", "Češnjak", "Papar", "Rajčica", "Brašno", "Jaja",
+    "Mlijeko", "Maslac", "Šećer", "Krumpir", "Mrkva", "Piletina", "Riža", "Sir",
+    "Peršin", "Paprika", "Tjestenina", "Vrhnje", "Limun", "Svinjetina", "Junetina",
+    "Tikvica", "Gljive", "Kruh", "Jogurt", "Slanutak", "Grah", "Kupus", "Špinat",
+    "Orah", "Bademi", "Lješnjaci", "Tuna", "Losos", "Sardina", "Sojin umak", "Tofu",
+    "Kikiriki", "Zob", "Banana", "Jabuka", "Med", "Cimet", "Vanilija", "Kakao",
+    "Ječam", "Skuta", "Kefir", "Patlidžan", "Brokula", "Cvjetača", "Celer", "Đumbir",
+    "Indijski oraščići", "Pistacija", "Ocat", "Lovorov list", "Origano",
+]
+
+TITLE_WORDS = ["Brza", "Domaća", "Bakina", "Pečena", "Kuhana", "Lagana", "Zimska", "Ljetna", "Posna", "Fina"]
+DISHES = ["juha", "salata", "pita", "tjestenina", "rižoto", "složenac", "gulaš", "torta", "kaša", "pečenka"]
+
+
+class ZipfSampler:
+
+    def __init__(self, items: List[str], s: float, rng: random.Random):
+        self.items = items
+        self.rng = rng
+        weights = [1.0 / (rank ** s) for rank in range(1, len(items) + 1)]
+        self.cum = list(itertools.accumulate(weights))
+
+    def sample(self, k: int) -> List[str]:
+        # k razlicitih elemenata; ponovljeni izvlacenja se odbacuju
+        out: List[str] = []
+        seen = set()
+        total = self.cum[-1]
+        while len(out) < k:
+            i = bisect.bisect_left(self.cum, self.rng.random() * total)
+            if i not in seen:
+                seen.add(i)
+                out.append(self.items[i])
+        return out
+
+
+def _vocabulary(size: int) -> List[str]:
+    synthetic = [f"Sastojak {i}" for i in range(max(size - len(COMMON_INGREDIENTS), 0))]
+    return COMMON_INGREDIENTS + synthetic
+
+
+def _geometric(rng: random.Random, mean: float) -> int:
+    # broj dogadaja po receptu: vecina nula/malo, rijetki recepti puno
+    if mean <= 0:
+        return 0
+    p = 1.0 / (1.0 + mean)
+    n = 0
+    while rng.random() > p:
+        n += 1
+    return n
+
+
+def generate(
+    db,
+    recipes: int = 10000,
+    users: Optional[int] = None,
+    vocabulary: int = 5000,
+    zipf_s: float = 1.1,
+    saves_per_recipe: float = 2.0,
+    comments_per_recipe: float = 0.5,
+    seed: int = 42,
+    chunk_size: int = 5000,
+    drop: bool = False,
+    progress=None,
+) -> Doc:
+    backend = services.get_backend(db)
+    rng = random.Random(seed)
+    n_users = int(users or max(10, recipes // 50))
+    sampler = ZipfSampler(_vocabulary(vocabulary), zipf_s, rng)
+
+    if drop:
+        backend.drop_all()
+
+    t0 = time.perf_counter()
+    base_time = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(recipes, 1)
+
+    user_ids = [ObjectId() for _ in range(n_users)]
+    for i in range(0, n_users, chunk_size):
+        backend.insert_users([
+            {
+                "_id": uid,
+                "username": f"user{i + j}",
+                "display_name": f"Korisnik {i + j}",
+                "password": "123",
+                "created_at": base_time,
+            }
+            for j, uid in enumerate(user_ids[i:i + chunk_size])
+        ])
+
+    stats = {"users": n_users, "recipes": 0, "saves": 0, "comments": 0}
+    for start in range(0, recipes, chunk_size):
+        recipe_docs: List[Doc] = []
+        save_docs: List[Doc] = []
+        comment_docs: List[Doc] = []
+
+        for i in range(start, min(start + chunk_size, recipes)):
+            created = base_time + step * i
+            names = sampler.sample(rng.randint(3, 12))
+            title = f"{rng.choice(TITLE_WORDS)} {rng.choice(DISHES)} {i}"
+            doc = services.build_recipe_doc(
+                rng.choice(user_ids),
+                title,
+                f"Opis recepta {i}.",
+                [{"name": n, "qty": rng.randint(1, 500), "unit": rng.choice(["g", "ml", "kom"])} for n in names],
+                [f"Korak {k + 1}" for k in range(rng.randint(2, 6))],
+                created_at=created,
+            )
+            doc["_id"] = ObjectId()
+
+            events = [("recipe", created)]
+            savers = rng.sample(user_ids, min(_geometric(rng, saves_per_recipe), n_users))
+            for uid in savers:
+                at = created + timedelta(hours=rng.randint(1, 500))
+                save_docs.append({"user_id": uid, "recipe_id": doc["_id"], "created_at": at})
+                events.append(("save", at))
+            n_comments = _geometric(rng, comments_per_recipe)
+            for k in range(n_comments):
+                at = created + timedelta(hours=rng.randint(1, 500))
+                comment_docs.append({
+                    "recipe_id": doc["_id"],
+                    "user_id": rng.choice(user_ids),
+                    "text": f"Komentar {k + 1}",
+                    "created_at": at,
+                })
+                events.append(("comment", at))
+
+            doc["save_count"] = len(savers)
+            doc["comment_count"] = n_comments
+            doc["trend"] = trending.score(events)
+            recipe_docs.append(doc)
+
+        services.assign_ingredient_ids(backend, recipe_docs, count_df=False)
+        backend.insert_recipes(recipe_docs)
+        services.count_ingredient_df(backend, recipe_docs)
+        backend.insert_saves(save_docs)
+        backend.insert_comments(comment_docs)
+        services.notify_recipes_changed(recipe_docs)
+
+        stats["recipes"] += len(recipe_docs)
+        stats["saves"] += len(save_docs)
+        stats["comments"] += len(comment_docs)
+        stats["seconds"] = time.perf_counter() - t0
+        if progress:
+            progress(stats)
+
+    return stats
+
+
+def main(argv=None):
+    from mongo import get_db, ensure_indexes
+
+    parser = argparse.ArgumentParser(description="Generator sintetickih recepata, saveova i komentara.")
+    parser.add_argument("--recipes", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=None)
+    parser.add_argument("--vocabulary", type=int, default=5000)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--saves-per-recipe", type=float, default=2.0)
+    parser.add_argument("--comments-per-recipe", type=float, default=0.5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--chunk-size", type=int, default=5000)
+    parser.add_argument("--drop", action="store_true", help="obrisi postojece kolekcije prije generiranja")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    stats = generate(
+        db,
+        recipes=args.recipes,
+        users=args.users,
+        vocabulary=args.vocabulary,
+        zipf_s=args.zipf,
+        saves_per_recipe=args.saves_per_recipe,
+        comments_per_recipe=args.comments_per_recipe,
+        seed=args.seed,
+        chunk_size=args.chunk_size,
+        drop=args.drop,
+        progress=lambda s: print(f"  recepata {s['recipes']}, saveova {s['saves']}, komentara {s['comments']} ({s['seconds']:.1f}s)"),
+    )
+    ensure_indexes(db)
+    print(f"Gotovo: {stats}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from bson import ObjectId
+from pymongo import ReadPreference
+
+from columnar import EXPORT_SCHEMAS, columns_to_arrow, columns_to_ndjson_lines, pa, pq, to_columns
+
+
+Doc = Dict[str, Any]
+
+
+### Izvoz za analitiku ###
+
+# Kolekcija se cita po _id redoslijedu u batchevima (range na _id indeksu,
+# bez skip-a i sortiranja u memoriji), samo s izvezenim poljima i po zelji sa
+# sekundarnog cvora, umjesto find({}) cijele kolekcije. Kursor batcha ide
+# ravno u stupce (columnar.to_columns), bez liste dokumenata. Svaki batch postaje
+# jedan Parquet dio (out/<kolekcija>/part-00000.parquet) ili se dopisuje u
+# out/<kolekcija>.ndjson. Nakon batcha se u checkpoint upisuju zadnji _id,
+# broj dijela i velicina NDJSON datoteke, pa prekinuti izvoz nastavlja tocno
+# iza zadnjeg zapisanog batcha (djelomicni zapis se odreze ili prepise).
+#
+#   python export.py recipes saves comments --out export/ --format parquet
+#   python export.py comments --out export/ --format ndjson --secondary --pause 0.2
+
+FORMATS = ("parquet", "ndjson")
+
+
+def _checkpoint_path(out_dir: str, collection: str, fmt: str) -> str:
+    return os.path.join(out_dir, f"{collection}.{fmt}.checkpoint.json")
+
+
+def _load_state(path: str) -> Doc:
+    if not os.path.exists(path):
+        return {"last_id": None, "part": 0, "rows": 0, "bytes": 0}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_state(path: str, state: Doc) -> None:
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(dict(state, updated_at=datetime.utcnow().isoformat()), f)
+    os.replace(tmp, path)
+
+
+def _write_parquet_part(out_dir: str, collection: str, part: int, columns) -> None:
+    part_dir = os.path.join(out_dir, collection)
+    os.makedirs(part_dir, exist_ok=True)
+    path = os.path.join(part_dir, f"part-{part:05d}.parquet")
+    tmp = path + ".tmp"
+    pq.write_table(columns_to_arrow(columns, EXPORT_SCHEMAS[collection]), tmp, compression="zstd")
+    os.replace(tmp, path)
+
+
+def export_collection(
+    db,
+    collection: str,
+    out_dir: str,
+    fmt: str = "parquet",
+    batch_size: int = 50000,
+    pause_seconds: float = 0.0,
+    secondary: bool = False,
+    restart: bool = False,
+    progress: Optional[Callable[[Doc], None]] = None,
+) -> Doc:
+    if collection not in EXPORT_SCHEMAS:
+        raise ValueError(f"Nepoznata kolekcija: {collection}")
+    if fmt not in FORMATS:
+        raise ValueError(f"Nepoznat format: {fmt}")
+    if fmt == "parquet" and pa is None:
+        raise RuntimeError("Parquet izvoz treba pyarrow (pip install pyarrow).")
+
+    os.makedirs(out_dir, exist_ok=True)
+    checkpoint = _checkpoint_path(out_dir, collection, fmt)
+    ndjson_path = os.path.join(out_dir, f"{collection}.ndjson")
+    if restart:
+        for path in (checkpoint, ndjson_path):
+            if os.path.exists(path):
+                os.remove(path)
+    state = _load_state(checkpoint)
+    state.update(collection=collection, format=fmt)
+
+    coll = db[collection]
+    if secondary:
+        coll = coll.with_options(read_preference=ReadPreference.SECONDARY_PREFERRED)
+    schema = EXPORT_SCHEMAS[collection]
+    projection = {f: 1 for f, _ in schema}
+
+    out = None
+    if fmt == "ndjson":
+        out = open(ndjson_path, "a+b")
+        # ostatak batcha koji je zapisan prije pada, a nije usao u checkpoint
+        out.truncate(int(state["bytes"]))
+        out.seek(0, os.SEEK_END)
+
+    t0 = time.perf_counter()
+    stats: Doc = {"collection": collection, "resumed_from": state["last_id"], "rows": 0, "seconds": 0.0}
+    try:
+        while True:
+            q = {"_id": {"$gt": ObjectId(state["last_id"])}} if state["last_id"] else {}
+            columns = to_columns(coll.find(q, projection).sort("_id", 1).limit(int(batch_size)), schema)
+            rows = len(columns["_id"])
+            if not rows:
+                break
+
+            if fmt == "parquet":
+                _write_parquet_part(out_dir, collection, state["part"], columns)
+            else:
+                for line in columns_to_ndjson_lines(columns, schema):
+                    out.write(line.encode("utf-8") + b"\n")
+                out.flush()
+                os.fsync(out.fileno())
+                state["bytes"] = out.tell()
+
+            state["last_id"] = columns["_id"][-1]
+            state["part"] += 1
+            state["rows"] += rows
+            _save_state(checkpoint, state)
+
+            stats["rows"] += rows
+            stats["total_rows"] = state["rows"]
+            stats["seconds"] = time.perf_counter() - t0
+            if progress:
+                progress(stats)
+            if pause_seconds:
+                time.sleep(pause_seconds)
+    finally:
+        if out is not None:
+            out.close()
+
+    stats["total_rows"] = state["rows"]
+    stats["seconds"] = time.perf_counter() - t0
+    return stats
+
+
+def main(argv=None):
+    from mongo import get_db
+
+    parser = argparse.ArgumentParser(description="Izvoz kolekcija u Parquet/NDJSON za analitiku.")
+    parser.add_argument("collections", nargs="+", choices=sorted(EXPORT_SCHEMAS))
+    parser.add_argument("--out", default="export")
+    parser.add_argument("--format", choices=FORMATS, default="parquet")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--pause", type=float, default=0.0, help="pauza izmedu batcheva u sekundama")
+    parser.add_argument("--secondary", action="store_true", help="citaj sa sekundarnog cvora ako postoji")
+    parser.add_argument("--restart", action="store_true", help="zanemari checkpoint i kreni ispocetka")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    for name in args.collections:
+        stats = export_collection(
+            db,
+            name,
+            args.out,
+            fmt=args.format,
+            batch_size=args.batch_size,
+            pause_seconds=args.pause,
+            secondary=args.secondary,
+            restart=args.restart,
+            progress=lambda s: print(f"  [{s['collection']}] redaka {s['total_rows']} ({s['seconds']:.1f}s)"),
+        )
+        print(f"{name}: izvezeno {stats['rows']} redaka, ukupno {stats['total_rows']} ({stats['seconds']:.1f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,326 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+import services
+from mongo import ensure_import_key_index
+
+
+Doc = Dict[str, Any]
+
+
+### Bulk import recepata ###
+
+# JSONL: jedan recept po retku
+#   {"title": "...", "description": "...", "author": "ana",
+#    "ingredients": [{"name": "Riža", "qty": 200, "unit": "g"}, "Luk"],
+#    "steps": ["...", "..."]}
+#
+# CSV: stupci title, description, author, ingredients, steps
+#   ingredients = "Riža:200:g; Luk:1:kom; Sol"   (name[:qty[:unit]], odvojeno s ;)
+#   steps       = "Skuhaj rižu | Dodaj luk"       (odvojeno s |)
+#
+# Svaki zapis dobije import_key "<source>:<redni broj>" i upisuje se kao upsert
+# s $setOnInsert, pa ponovljeni chunk nakon pada ne stvara duplikate.
+
+
+def detect_format(path: str) -> str:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        return "csv"
+    if ext in (".jsonl", ".ndjson", ".json"):
+        return "jsonl"
+    raise ValueError(f"Nepoznat format datoteke: {path}")
+
+
+def _parse_qty(raw: str) -> Any:
+    raw = raw.strip().replace(",", ".")
+    if not raw:
+        return None
+    try:
+        q = float(raw)
+    except ValueError:
+        return raw
+    return int(q) if q.is_integer() else q
+
+
+def _csv_ingredients(text: str) -> List[Doc]:
+    out = []
+    for part in (text or "").split(";"):
+        if not part.strip():
+            continue
+        bits = part.split(":")
+        out.append({
+            "name": bits[0].strip(),
+            "qty": _parse_qty(bits[1]) if len(bits) > 1 else None,
+            "unit": bits[2].strip() if len(bits) > 2 else None,
+        })
+    return out
+
+
+def _text(value: Any) -> str:
+    return "" if value is None else str(value)
+
+
+def _normalize_record(rec: Doc) -> Doc:
+    # oblik zapisa se provjerava ovdje: los zapis je greska tog zapisa (ValueError),
+    # a ne iznimka koja prekida cijeli import
+    if not isinstance(rec, dict):
+        raise ValueError("zapis nije objekt")
+
+    raw_ingredients = rec.get("ingredients") or []
+    if not isinstance(raw_ingredients, list):
+        raise ValueError("ingredients nije lista")
+    ingredients = []
+    for ing in raw_ingredients:
+        if isinstance(ing, str):
+            ingredients.append({"name": ing})
+        elif isinstance(ing, dict):
+            ingredients.append({
+                "name": _text(ing.get("name")),
+                "qty": ing.get("qty"),
+                "unit": _text(ing.get("unit")) or None,
+            })
+        else:
+            raise ValueError(f"neispravan sastojak: {ing!r}")
+
+    steps = rec.get("steps") or []
+    if isinstance(steps, str):
+        steps = [s.strip() for s in steps.replace("|", "\n").splitlines() if s.strip()]
+    elif isinstance(steps, list):
+        steps = [_text(s).strip() for s in steps if _text(s).strip()]
+    else:
+        raise ValueError("steps nije lista ni tekst")
+
+    return {
+        "title": _text(rec.get("title")),
+        "description": _text(rec.get("description")),
+        "author": _text(rec.get("author")).strip(),
+        "ingredients": ingredients,
+        "steps": steps,
+    }
+
+
+def iter_records(path: str, fmt: str, skip: int = 0) -> Iterator[Tuple[int, Optional[Doc], Optional[str]]]:
+    # vraca (redni broj, zapis, greska); redni broj je stabilan izmedu pokretanja
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        if fmt == "jsonl":
+            n = 0
+            for line in f:
+                if not line.strip():
+                    continue
+                n += 1
+                if n <= skip:
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError as e:
+                    yield n, None, f"neispravan JSON: {e}"
+                    continue
+                try:
+                    yield n, _normalize_record(rec), None
+                except ValueError as e:
+                    yield n, None, f"neispravan zapis: {e}"
+        else:
+            for n, row in enumerate(csv.DictReader(f), start=1):
+                if n <= skip:
+                    continue
+                row["ingredients"] = _csv_ingredients(row.get("ingredients", ""))
+                yield n, _normalize_record(row), None
+
+
+def _load_checkpoint(checkpoint_path: Optional[str], source: str) -> int:
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if data.get("source") != source:
+        raise ValueError(f"Checkpoint pripada drugom izvoru: {data.get('source')}")
+    return int(data.get("position", 0))
+
+
+def _save_checkpoint(checkpoint_path: Optional[str], source: str, position: int) -> None:
+    if not checkpoint_path:
+        return
+    tmp = checkpoint_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"source": source, "position": position, "updated_at": datetime.utcnow().isoformat()}, f)
+    os.replace(tmp, checkpoint_path)
+
+
+class _AuthorResolver:
+
+    def __init__(self, db, default_author: str = ""):
+        self.db = db
+        self.default_author = default_author.strip()
+        self._ids: Dict[str, Any] = {}
+
+    def resolve(self, username: str):
+        username = username or self.default_author
+        if not username:
+            return None
+        if username not in self._ids:
+            u = self.db["users"].find_one({"username": username}, {"_id": 1})
+            self._ids[username] = u["_id"] if u else None
+        return self._ids[username]
+
+
+def _write_chunk(db, chunk: List[Tuple[int, Doc]]) -> Tuple[int, int, List[Tuple[int, str]]]:
+    # id-evi prije upisa, df samo za recepte koji su stvarno upisani
+    services.assign_ingredient_ids(db, [doc for _, doc in chunk], count_df=False)
+    ops = []
+    for n, doc in chunk:
+        fields = {k: v for k, v in doc.items() if k != "import_key"}
+        ops.append(UpdateOne({"import_key": doc["import_key"]}, {"$setOnInsert": fields}, upsert=True))
+    failed: List[Tuple[int, str]] = []
+    try:
+        res = db["recipes"].bulk_write(ops, ordered=False)
+        upserted = res.upserted_ids
+    except BulkWriteError as e:
+        # paralelni import istog izvora moze pogoditi unique import_key (11000,
+        # zapis vec postoji); ostale greske su greske zapisa, a ostali upisi iz
+        # unordered batcha su svejedno prosli
+        upserted = {u["index"]: u["_id"] for u in e.details.get("upserted", [])}
+        for err in e.details.get("writeErrors", []):
+            if err.get("code") != 11000:
+                failed.append((chunk[err["index"]][0], f"greska upisa: {err.get('errmsg')}"))
+
+    inserted = []
+    for i, rid in upserted.items():
+        doc = dict(chunk[i][1])
+        doc["_id"] = rid
+        inserted.append(doc)
+    services.count_ingredient_df(db, inserted)
+    services.get_backend(db).refresh_feed([d["_id"] for d in inserted])
+    services.notify_recipes_changed(inserted)
+    return len(inserted), len(chunk) - len(inserted) - len(failed), failed
+
+
+def import_recipes(
+    db,
+    path: str,
+    fmt: Optional[str] = None,
+    default_author: str = "",
+    chunk_size: int = 1000,
+    checkpoint_path: Optional[str] = None,
+    source: Optional[str] = None,
+    progress: Optional[Callable[[Doc], None]] = None,
+) -> Doc:
+    fmt = fmt or detect_format(path)
+    source = source or os.path.basename(path)
+    ensure_import_key_index(db)
+    start = _load_checkpoint(checkpoint_path, source)
+    authors = _AuthorResolver(db, default_author)
+
+    stats: Doc = {
+        "source": source,
+        "resumed_from": start,
+        "read": 0,
+        "inserted": 0,
+        "existing": 0,
+        "errors": 0,
+        "error_samples": [],
+        "seconds": 0.0,
+        "rate": 0.0,
+    }
+    t0 = time.perf_counter()
+    chunk: List[Tuple[int, Doc]] = []
+    position = start
+
+    def error(n: int, msg: str) -> None:
+        stats["errors"] += 1
+        if len(stats["error_samples"]) < 20:
+            stats["error_samples"].append(f"#{n}: {msg}")
+
+    def flush() -> None:
+        nonlocal chunk
+        if chunk:
+            ins, existing, failed = _write_chunk(db, chunk)
+            stats["inserted"] += ins
+            stats["existing"] += existing
+            for n, msg in failed:
+                error(n, msg)
+            chunk = []
+        _save_checkpoint(checkpoint_path, source, position)
+        stats["seconds"] = time.perf_counter() - t0
+        stats["rate"] = stats["read"] / stats["seconds"] if stats["seconds"] else 0.0
+        if progress:
+            progress(stats)
+
+    for n, rec, err in iter_records(path, fmt, skip=start):
+        position = n
+        stats["read"] += 1
+        if err:
+            error(n, err)
+        else:
+            author_id = authors.resolve(rec["author"])
+            if author_id is None:
+                error(n, f"nepoznat autor '{rec['author'] or default_author}'")
+            elif not rec["title"].strip():
+                error(n, "prazan naslov")
+            else:
+                try:
+                    doc = services.build_recipe_doc(
+                        author_id, rec["title"], rec["description"], rec["ingredients"], rec["steps"]
+                    )
+                except ValueError as e:
+                    error(n, str(e))
+                else:
+                    doc["import_key"] = f"{source}:{n}"
+                    chunk.append((n, doc))
+
+        if stats["read"] % int(chunk_size) == 0:
+            flush()
+
+    flush()
+    return stats
+
+
+def _print_progress(stats: Doc) -> None:
+    print(
+        f"[{stats['source']}] procitano {stats['read']}, upisano {stats['inserted']}, "
+        f"vec postoji {stats['existing']}, greske {stats['errors']} "
+        f"({stats['rate']:.0f} rec/s)"
+    )
+
+
+def main(argv=None):
+    from mongo import get_db, ensure_indexes
+
+    parser = argparse.ArgumentParser(description="Bulk import recepata iz JSONL/CSV datoteke.")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=["jsonl", "csv"], default=None)
+    parser.add_argument("--author", default="", help="username za zapise bez autora")
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--checkpoint", default=None, help="datoteka za nastavak prekinutog importa")
+    parser.add_argument("--source", default=None, help="ime izvora za import_key (default: ime datoteke)")
+    args = parser.parse_args(argv)
+
+    db = get_db()
+    ensure_indexes(db)
+    stats = import_recipes(
+        db,
+        args.path,
+        fmt=args.format,
+        default_author=args.author,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint,
+        source=args.source,
+        progress=_print_progress,
+    )
+    for line in stats["error_samples"]:
+        print("  greska", line)
+    print(f"Gotovo za {stats['seconds']:.1f}s ({stats['rate']:.0f} rec/s).")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,46 @@
 from __future__ import annotations
 
+import hashlib
+import json
 import re
 import unicodedata
-from typing import List, Set
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, List, Set, Tuple
 
 ## Normalizacija ###
 
+# Isti rezultat kao NFKD + izbacivanje kombinirajucih znakova + re.sub na
+# [^a-z0-9\s_-] + sazimanje razmaka, ali preko str.translate. NFKD dekompozicija
+# ide znak po znak, a preslagivanje kombinirajucih znakova ne utjece na
+# rezultat jer se svi ionako brisu, pa se svaki znak moze preslikati jednom i
+# zapamtiti u tablici.
+
+_DROP_RE = re.compile(r"[^a-z0-9\s_-]")
+
+
+class _NormalizeTable(dict):
+    def __missing__(self, code: int) -> str:
+        decomposed = unicodedata.normalize("NFKD", chr(code))
+        out = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+        out = _DROP_RE.sub("", out)
+        self[code] = out
+        return out
+
+
+_NORMALIZE_TABLE = _NormalizeTable()
+
+NORMALIZE_CACHE_SIZE = 65536
+
+
+@lru_cache(maxsize=NORMALIZE_CACHE_SIZE)
 def normalize_key(text: str) -> str:
     text = (text or "").strip().lower()
-    text = unicodedata.normalize("NFKD", text)
-    text = "".join(ch for ch in text if not unicodedata.combining(ch))
-    text = re.sub(r"[^a-z0-9\s_-]", "", text)
-    text = re.sub(r"\s+", " ", text).strip().replace(" ", "_")
-    return text
+    return "_".join(text.translate(_NORMALIZE_TABLE).split())
+
+
+def normalize_many(texts: Iterable[str]) -> List[str]:
+    return [normalize_key(t) for t in texts]
 
 
 SYNONYMS = {
@@ -46,22 +74,160 @@ ALLERGEN_RULES = {
     "riba": {"riba", "tuna", "losos", "sardina", "inćun", "incun"},
 }
 
+# Bit po alergenu za allergen_mask na receptu (filtar $bitsAllClear). Maske su
+# spremljene u bazi, pa se postojeci bitovi ne smiju mijenjati; novi alergen
+# dobiva sljedeci slobodni bit.
+ALLERGEN_BITS = {
+    "orasasti_plodovi": 1 << 0,
+    "mlijeko": 1 << 1,
+    "jaja": 1 << 2,
+    "gluten": 1 << 3,
+    "soja": 1 << 4,
+    "riba": 1 << 5,
+}
+if set(ALLERGEN_BITS) != set(ALLERGEN_RULES):
+    raise RuntimeError("ALLERGEN_BITS mora imati bit za svaki alergen iz ALLERGEN_RULES.")
+
+# Matcher se gradi jednom iz ALLERGEN_RULES. Naziv sastojka se normalizira i
+# razbije na tokene (po _ i -); jednotokenski okidaci se traze u obrnutoj mapi
+# token -> alergeni, a visetokenski (npr. indijski_orascic) Aho-Corasick
+# automatom nad tokenima, pa se nadu i unutar duzih naziva.
+
+_TOKEN_SPLIT_RE = re.compile(r"[_-]+")
+
+
+def _tokens(key: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT_RE.split(key) if t]
+
+
+class AllergenMatcher:
+
+    def __init__(self, rules: Dict[str, Set[str]]):
+        self.by_token: Dict[str, Set[str]] = {}
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._out: List[Set[str]] = [set()]
+
+        for allergen, triggers in rules.items():
+            for trigger in triggers:
+                for form in {trigger, normalize_key(trigger)}:
+                    toks = _tokens(form)
+                    if len(toks) == 1:
+                        self.by_token.setdefault(toks[0], set()).add(allergen)
+                    elif toks:
+                        self._insert(toks, allergen)
+        self._build_fail_links()
+
+    def _insert(self, toks: List[str], allergen: str) -> None:
+        state = 0
+        for t in toks:
+            nxt = self._goto[state].get(t)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][t] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+            state = nxt
+        self._out[state].add(allergen)
+
+    def _build_fail_links(self) -> None:
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for t, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and t not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(t, 0)
+                self._out[nxt] |= self._out[self._fail[nxt]]
+
+    def match_key(self, key: str) -> Set[str]:
+        found: Set[str] = set()
+        state = 0
+        for t in _tokens(key):
+            hit = self.by_token.get(t)
+            if hit:
+                found |= hit
+            while state and t not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(t, 0)
+            if self._out[state]:
+                found |= self._out[state]
+        return found
+
+    def detect(self, ingredient_keys: Iterable[str], ingredient_names: Iterable[str]) -> List[str]:
+        found: Set[str] = set()
+        for k in ingredient_keys:
+            found |= self.match_key(k)
+        for n in ingredient_names:
+            found |= self.match_key(normalize_key(n))
+        return sorted(found)
+
+    def detect_many(self, items: Iterable[Tuple[Iterable[str], Iterable[str]]]) -> List[List[str]]:
+        # isti kljucevi i nazivi se ponavljaju kroz tisuce recepata, pa se
+        # rezultat po kljucu pamti za cijeli batch
+        memo: Dict[str, Set[str]] = {}
+
+        def match(key: str) -> Set[str]:
+            hit = memo.get(key)
+            if hit is None:
+                hit = memo[key] = self.match_key(key)
+            return hit
+
+        out = []
+        for keys, names in items:
+            found: Set[str] = set()
+            for k in keys:
+                found |= match(k)
+            for n in names:
+                found |= match(normalize_key(n))
+            out.append(sorted(found))
+        return out
+
+
+_ALLERGEN_MATCHER = AllergenMatcher(ALLERGEN_RULES)
+
+
 def detect_allergens(ingredient_keys: List[str], ingredient_names: List[str]) -> List[str]:
+    return _ALLERGEN_MATCHER.detect(ingredient_keys, ingredient_names)
+
+
+def detect_allergens_many(items: Iterable[Tuple[List[str], List[str]]]) -> List[List[str]]:
+    return _ALLERGEN_MATCHER.detect_many(items)
+
+
+def allergen_mask(allergens: Iterable[str]) -> int:
+    # nepoznati nazivi ne doprinose (kao i $nin s nepostojecim alergenom)
+    mask = 0
+    for a in allergens:
+        mask |= ALLERGEN_BITS.get(a, 0)
+    return mask
 
-    tokens: Set[str] = set(ingredient_keys)
 
-    for n in ingredient_names:
-        nk = normalize_key(n)
-        parts = nk.split("_")
-        tokens.update(parts)
-        tokens.add(nk)
+### Verzija pravila ###
 
-    found: Set[str] = set()
-    for allergen, triggers in ALLERGEN_RULES.items():
-        if tokens.intersection(triggers):
-            found.add(allergen)
+# Svaki recept pamti pod kojom verzijom pravila je tagiran. Verzija je otisak
+# ALLERGEN_RULES + SYNONYMS + MATCHER_VERSION, pa se mijenja cim se pravila
+# promijene; MATCHER_VERSION treba povecati kad se promijeni sam algoritam.
+MATCHER_VERSION = 2
 
-    return sorted(found)
+
+def _rules_fingerprint() -> str:
+    payload = json.dumps(
+        {
+            "allergens": {k: sorted(v) for k, v in ALLERGEN_RULES.items()},
+            "synonyms": SYNONYMS,
+            "matcher": MATCHER_VERSION,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+RULES_VERSION = _rules_fingerprint()
 
 
 def split_norm_csv(csv_text: str) -> List[str]:
@@ -73,3 +239,7 @@ def split_norm_csv(csv_text: str) -> List[str]:
         for x in csv_text.split(",")
         if x.strip()
     ]
+
+
+def split_norm_csv_many(csv_texts: Iterable[str]) -> List[List[str]]:
+    return [split_norm_csv(t) for t in csv_texts]
@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import argparse
+import time
+
+from bson import ObjectId
+
+from mongo import get_db, ensure_indexes
+import services
+
+
+def cmd_reconcile_counters(db, args):
+    # --every: trajni posao uz app (brojaci se mijenjaju bez transakcije, vidi
+    # services.save_recipe), inace jedan prolaz
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    while True:
+        t0 = time.perf_counter()
+        scanned, fixed = services.reconcile_recipe_counters(
+            db, batch_size=args.batch_size, start_after=start_after
+        )
+        dt = time.perf_counter() - t0
+        print(f"Pregledano recepata: {scanned}, ispravljeno: {fixed} ({dt:.1f}s)")
+        if not args.every:
+            return
+        start_after = None
+        time.sleep(args.every)
+
+
+def cmd_retag(db, args):
+    if args.dry_run:
+        print(f"Recepata za re-tagiranje: {services.count_outdated_recipes(db)}")
+        return
+
+    def progress(scanned, updated, last_id):
+        print(f"  pregledano {scanned}, azurirano {updated}, zadnji _id {last_id}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    scanned, updated, last_id = services.retag_recipes(
+        db,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        start_after=start_after,
+        progress=progress,
+    )
+    dt = time.perf_counter() - t0
+    print(f"Re-tagirano {updated}/{scanned} recepata ({dt:.1f}s), verzija pravila {services.RULES_VERSION}")
+
+
+def cmd_backfill_similarity(db, args):
+    if args.dry_run:
+        print(f"Recepata bez LSH traka: {services.count_missing_lsh_bands(db)}")
+        return
+
+    def progress(scanned, updated, last_id):
+        print(f"  pregledano {scanned}, azurirano {updated}, zadnji _id {last_id}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    scanned, updated, last_id = services.backfill_lsh_bands(
+        db,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        start_after=start_after,
+        progress=progress,
+    )
+    dt = time.perf_counter() - t0
+    print(f"LSH trake upisane za {updated}/{scanned} recepata ({dt:.1f}s), verzija {services.LSH_VERSION}")
+
+
+def cmd_backfill_ingredient_ids(db, args):
+    if args.dry_run:
+        print(f"Recepata bez ingredient_ids: {services.count_missing_ingredient_ids(db)}")
+        return
+
+    def progress(scanned, updated, last_id):
+        print(f"  pregledano {scanned}, azurirano {updated}, zadnji _id {last_id}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    scanned, updated, last_id = services.backfill_ingredient_ids(
+        db,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        start_after=start_after,
+        progress=progress,
+    )
+    print(f"ingredient_ids upisani za {updated}/{scanned} recepata ({time.perf_counter() - t0:.1f}s)")
+    if args.recount:
+        print(f"df ispravljen za {services.recount_ingredient_df(db)} sastojaka")
+
+
+def cmd_drop_key_index(db, args):
+    if args.dry_run:
+        print(f"Recepata bez ingredient_ids: {services.count_missing_ingredient_ids(db)}")
+        return
+    dropped = services.drop_ingredient_key_indexes(db)
+    if dropped:
+        print(f"Obrisani indeksi: {', '.join(dropped)}")
+    else:
+        print("Nista nije obrisano (indeksa nema ili neki recepti jos nemaju ingredient_ids).")
+
+
+def cmd_backfill_allergen_mask(db, args):
+    if args.dry_run:
+        print(f"Recepata bez allergen_mask: {services.count_missing_allergen_mask(db)}")
+        return
+
+    def progress(scanned, updated, last_id):
+        print(f"  pregledano {scanned}, azurirano {updated}, zadnji _id {last_id}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    scanned, updated, last_id = services.backfill_allergen_mask(
+        db,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        start_after=start_after,
+        progress=progress,
+    )
+    dt = time.perf_counter() - t0
+    print(f"allergen_mask upisan za {updated}/{scanned} recepata ({dt:.1f}s)")
+
+
+def cmd_backfill_trend(db, args):
+    if args.dry_run:
+        print(f"Recepata bez trenda: {services.count_missing_trend(db)}")
+        return
+
+    def progress(scanned, updated, last_id):
+        print(f"  pregledano {scanned}, azurirano {updated}, zadnji _id {last_id}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    scanned, updated, last_id = services.backfill_trend(
+        db,
+        batch_size=args.batch_size,
+        pause_seconds=args.pause,
+        start_after=start_after,
+        recompute_all=args.all,
+        progress=progress,
+    )
+    dt = time.perf_counter() - t0
+    print(f"Trend upisan za {updated}/{scanned} recepata ({dt:.1f}s)")
+
+
+def cmd_rebuild_recs(db, args):
+    def progress(stats):
+        print(f"  {stats['phase']}: zadataka {stats['tasks_done']} ({stats['seconds']:.1f}s)")
+
+    stats = services.rebuild_recipe_recs(
+        db,
+        workers=args.workers or None,
+        chunk_users=args.chunk_users,
+        chunk_recipes=args.chunk_recipes,
+        progress=progress,
+    )
+    print(
+        f"Preporuke izgradene: {stats.get('recipes', 0)} recepata, {stats.get('pairs', 0)} parova, "
+        f"{stats.get('users', 0)} korisnika, {stats['workers']} procesa ({stats['seconds']:.1f}s)"
+    )
+
+
+def cmd_rebuild_feed(db, args):
+    t0 = time.perf_counter()
+    n = services.rebuild_recipes_feed(db)
+    print(f"recipes_feed izgraden: {n} kartica ({time.perf_counter() - t0:.1f}s)")
+
+
+def cmd_check_feed(db, args):
+    def progress(stats):
+        print(f"  pregledano {stats['scanned']}, zadnji _id {stats['last_id']}")
+
+    start_after = ObjectId(args.start_after) if args.start_after else None
+    t0 = time.perf_counter()
+    stats = services.check_recipes_feed(
+        db,
+        batch_size=args.batch_size,
+        start_after=start_after,
+        fix=args.fix,
+        progress=progress,
+    )
+    dt = time.perf_counter() - t0
+    print(
+        f"Pregledano {stats['scanned']}: nedostaje {stats['missing']}, zastarjelo {stats['stale']}, "
+        f"bez recepta {stats['orphaned']}, ispravljeno {stats['fixed']} ({dt:.1f}s)"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Odrzavanje baze recepata.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("reconcile-counters", help="ponovno izracunaj save_count/comment_count")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--every", type=float, default=0, help="ponavljaj svakih N sekundi (0 = jednom)")
+    p.set_defaults(func=cmd_reconcile_counters)
+
+    p = sub.add_parser("retag", help="ponovno tagiraj recepte sa zastarjelom verzijom pravila")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--pause", type=float, default=0.2, help="pauza izmedu batcheva u sekundama")
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj zastarjelih recepata")
+    p.set_defaults(func=cmd_retag)
+
+    p = sub.add_parser("backfill-similarity", help="upisi LSH trake receptima koji ih nemaju")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--pause", type=float, default=0.1, help="pauza izmedu batcheva u sekundama")
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj recepata bez traka")
+    p.set_defaults(func=cmd_backfill_similarity)
+
+    p = sub.add_parser("backfill-ingredient-ids", help="upisi ingredient_ids i vokabular sastojaka receptima koji ih nemaju")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--pause", type=float, default=0.1, help="pauza izmedu batcheva u sekundama")
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--recount", action="store_true", help="na kraju ponovno izracunaj df svih sastojaka")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj recepata bez id-eva")
+    p.set_defaults(func=cmd_backfill_ingredient_ids)
+
+    p = sub.add_parser("drop-key-index", help="obrisi indeks nad ingredient_keys nakon backfill-ingredient-ids")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj recepata bez id-eva")
+    p.set_defaults(func=cmd_drop_key_index)
+
+    p = sub.add_parser("backfill-allergen-mask", help="upisi allergen_mask receptima koji ga nemaju")
+    p.add_argument("--batch-size", type=int, default=1000)
+    p.add_argument("--pause", type=float, default=0.1, help="pauza izmedu batcheva u sekundama")
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj recepata bez maske")
+    p.set_defaults(func=cmd_backfill_allergen_mask)
+
+    p = sub.add_parser("backfill-trend", help="izracunaj trending trend iz objava, spremanja i komentara")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--pause", type=float, default=0.1, help="pauza izmedu batcheva u sekundama")
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--all", action="store_true", help="ponovno izracunaj i recepte koji vec imaju trend")
+    p.add_argument("--dry-run", action="store_true", help="samo ispisi broj recepata bez trenda")
+    p.set_defaults(func=cmd_backfill_trend)
+
+    p = sub.add_parser("rebuild-recs", help="ponovno izgradi preporuke 'spremili su i' iz saves")
+    p.add_argument("--workers", type=int, default=0, help="broj procesa (0 = broj jezgri)")
+    p.add_argument("--chunk-users", type=int, default=2000, help="korisnika po zadatku u prvoj fazi")
+    p.add_argument("--chunk-recipes", type=int, default=50000, help="recepata po zadatku u drugoj fazi")
+    p.set_defaults(func=cmd_rebuild_recs)
+
+    p = sub.add_parser("rebuild-feed", help="ponovno izgradi recipes_feed iz recipes ($merge)")
+    p.set_defaults(func=cmd_rebuild_feed)
+
+    p = sub.add_parser("check-feed", help="usporedi recipes_feed s receptima")
+    p.add_argument("--batch-size", type=int, default=500)
+    p.add_argument("--start-after", default="", help="nastavi nakon ovog recipe _id")
+    p.add_argument("--fix", action="store_true", help="ispravi nedostajuce i zastarjele kartice")
+    p.set_defaults(func=cmd_check_feed)
+
+    args = parser.parse_args(argv)
+    db = get_db()
+    ensure_indexes(db)
+    args.func(db, args)
+
+
+if __name__ == "__main__":
+    main()
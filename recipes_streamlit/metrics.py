@@ -0,0 +1,359 @@
+from __future__ import annotations
+
+import functools
+import os
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import bson
+from pymongo import monitoring
+
+
+### Registar metrika ###
+
+# Sve sto se mjeri u procesu (pozivi services funkcija, Mongo komande, pool,
+# cache) zavrsava ovdje i moze se ispisati u Prometheus text formatu.
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Optional[Dict[str, Any]]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in (labels or {}).items()))
+
+
+class Histogram:
+
+    def __init__(self):
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+        for i, le in enumerate(LATENCY_BUCKETS):
+            if seconds <= le:
+                self.buckets[i] += 1
+
+    def quantile(self, q: float) -> float:
+        # gornja granica bucketa u kojem je q-ti kvantil (gruba procjena)
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        for le, n in zip(LATENCY_BUCKETS, self.buckets):
+            if n >= rank:
+                return le
+        return self.max
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms: Dict[Tuple[str, Labels], Histogram] = {}
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._help: Dict[str, str] = {}
+        self._collectors: List[Callable[[], List[Tuple[str, Dict[str, Any], float]]]] = []
+
+    def describe(self, name: str, text: str) -> None:
+        self._help[name] = text
+
+    def observe(self, name: str, seconds: float, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            h = self._histograms.get(key)
+            if h is None:
+                h = self._histograms[key] = Histogram()
+            h.observe(seconds)
+
+    def inc(self, name: str, value: float = 1, labels: Optional[Dict[str, Any]] = None) -> None:
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def register_collector(self, fn: Callable[[], List[Tuple[str, Dict[str, Any], float]]]) -> None:
+        # collector vraca gauge vrijednosti (ime, labele, vrijednost) u trenutku ispisa
+        self._collectors.append(fn)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+    def histograms(self, name: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            items = [(dict(lb), h) for (n, lb), h in self._histograms.items() if n == name]
+            return [
+                dict(
+                    labels,
+                    count=h.count,
+                    avg_ms=(h.sum / h.count * 1000) if h.count else 0.0,
+                    p50_ms=h.quantile(0.50) * 1000,
+                    p95_ms=h.quantile(0.95) * 1000,
+                    p99_ms=h.quantile(0.99) * 1000,
+                    max_ms=h.max * 1000,
+                    total_s=h.sum,
+                )
+                for labels, h in items
+            ]
+
+    def counters(self, name: str) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [dict(dict(lb), value=v) for (n, lb), v in self._counters.items() if n == name]
+
+    def render_prometheus(self) -> str:
+        lines: List[str] = []
+
+        def fmt_labels(lb: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+            parts = list(lb) + ([extra] if extra else [])
+            if not parts:
+                return ""
+            body = ",".join(f'{k}="{_escape(v)}"' for k, v in parts)
+            return "{" + body + "}"
+
+        def header(name: str, kind: str) -> None:
+            if name in self._help:
+                lines.append(f"# HELP {name} {self._help[name]}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        for (name, lb), h in histograms:
+            if name not in seen:
+                header(name, "histogram")
+                seen.add(name)
+            for le, n in zip(LATENCY_BUCKETS, h.buckets):
+                lines.append(f"{name}_bucket{fmt_labels(lb, ('le', repr(le)))} {n}")
+            lines.append(f"{name}_bucket{fmt_labels(lb, ('le', '+Inf'))} {h.count}")
+            lines.append(f"{name}_sum{fmt_labels(lb)} {h.sum}")
+            lines.append(f"{name}_count{fmt_labels(lb)} {h.count}")
+
+        for (name, lb), v in counters:
+            if name not in seen:
+                header(name, "counter")
+                seen.add(name)
+            lines.append(f"{name}{fmt_labels(lb)} {v}")
+
+        for collect in self._collectors:
+            for name, labels, v in collect():
+                if name not in seen:
+                    header(name, "gauge")
+                    seen.add(name)
+                lines.append(f"{name}{fmt_labels(_labels(labels))} {v}")
+
+        return "\n".join(lines) + "\n"
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+REGISTRY = MetricsRegistry()
+REGISTRY.describe("services_call_seconds", "Trajanje poziva services funkcija.")
+REGISTRY.describe("services_call_errors_total", "Broj poziva services funkcija koji su bacili iznimku.")
+REGISTRY.describe("mongo_command_seconds", "Trajanje Mongo komandi po imenu komande i kolekciji.")
+REGISTRY.describe("mongo_command_failures_total", "Broj neuspjelih Mongo komandi.")
+REGISTRY.describe("mongo_command_documents_total", "Broj dokumenata vracenih Mongo komandama.")
+REGISTRY.describe("mongo_command_reply_bytes_total", "Procjena velicine BSON odgovora Mongo komandi u bajtovima (uzorak).")
+
+
+def timed(fn):
+    name = fn.__name__
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        t0 = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            REGISTRY.inc("services_call_errors_total", labels={"function": name})
+            raise
+        finally:
+            REGISTRY.observe("services_call_seconds", time.perf_counter() - t0, {"function": name})
+
+    return wrapper
+
+
+### Slow query log ###
+
+SLOW_MS = float(os.getenv("METRICS_SLOW_MS", "200"))
+# bson.encode odgovora kosta koliko i dekodiranje, pa se velicina mjeri samo
+# za udio komandi (0 = iskljuceno, 1 = sve) i skalira na procjenu ukupnog
+REPLY_BYTES_SAMPLE = float(os.getenv("METRICS_REPLY_BYTES", "0"))
+# najvise jedan automatski explain sporog upita svakih toliko sekundi (0 = samo na zahtjev)
+EXPLAIN_INTERVAL = float(os.getenv("METRICS_EXPLAIN_INTERVAL", "10"))
+
+EXPLAINABLE = {"find", "aggregate", "count", "distinct"}
+
+
+def _explainable_command(cmd: Dict[str, Any]) -> Dict[str, Any]:
+    # bez session/cluster polja koja driver dodaje, da se komanda moze ponoviti u explain
+    return {k: v for k, v in cmd.items() if not k.startswith("$") and k not in ("lsid", "txnNumber")}
+
+
+def _plan_summary(plan: Dict[str, Any]) -> str:
+    stages = []
+    node = plan
+    while isinstance(node, dict) and node:
+        stage = node.get("stage")
+        if stage:
+            if stage == "IXSCAN" and node.get("indexName"):
+                stage = f"IXSCAN {node['indexName']}"
+            stages.append(stage)
+        node = node.get("inputStage") or (node.get("inputStages") or [None])[0] or node.get("queryPlan")
+    return " <- ".join(stages)
+
+
+class SlowQueryLog:
+
+    def __init__(self, max_entries: int = 100, explain_interval: float = EXPLAIN_INTERVAL):
+        self.explain_interval = float(explain_interval)
+        self._lock = threading.Lock()
+        self._entries: deque = deque(maxlen=int(max_entries))
+        self._client = None
+        self._wake = threading.Event()
+
+    def add(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._entries.appendleft(entry)
+        if self._client is not None:
+            self._wake.set()
+
+    # explain se ne smije pokretati iz samog listenera, pa ga radi pozadinska
+    # dretva: najnoviji upit bez plana, pa pauza explain_interval sekundi
+    def auto_explain(self, client) -> None:
+        if self.explain_interval <= 0:
+            return
+        with self._lock:
+            started = self._client is not None
+            self._client = client
+        if not started:
+            threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True).start()
+
+    def _explain_loop(self) -> None:
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            while self._explain_next():
+                time.sleep(self.explain_interval)
+
+    def _explain_next(self) -> bool:
+        for e in self.entries():
+            if e.get("plan") is None and e.get("command") is not None:
+                self._explain(self._client, e)
+                return True
+        return False
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    @staticmethod
+    def _explain(client, e: Dict[str, Any]) -> None:
+        try:
+            res = client[e["db"]].command("explain", e["command"], verbosity="queryPlanner")
+            planner = res.get("queryPlanner") or (res.get("stages") or [{}])[0].get("$cursor", {}).get("queryPlanner", {})
+            winning = planner.get("winningPlan", {})
+            e["plan"] = _plan_summary(winning) or "(nepoznat plan)"
+            e["explain"] = res
+        except Exception as ex:
+            e["plan"] = f"explain nije uspio: {ex}"
+
+    def explain_pending(self, client) -> int:
+        done = 0
+        for e in self.entries():
+            if e.get("plan") is not None or e.get("command") is None:
+                continue
+            self._explain(client, e)
+            done += 1
+        return done
+
+
+SLOW_LOG = SlowQueryLog()
+
+
+### Listener za Mongo komande ###
+
+def _reply_documents(reply: Dict[str, Any]) -> int:
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        batch = cursor.get("firstBatch", cursor.get("nextBatch"))
+        if batch is not None:
+            return len(batch)
+    if "n" in reply and isinstance(reply["n"], int):
+        return reply["n"]
+    return 0
+
+
+class CommandMetrics(monitoring.CommandListener):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[Any, int], Dict[str, Any]] = {}
+
+    def started(self, event):
+        name = event.command_name
+        if name in ("explain", "hello", "isMaster", "ismaster", "ping", "endSessions"):
+            return
+        coll = event.command.get(name)
+        if name == "getMore":
+            coll = event.command.get("collection")
+        info = {
+            "command_name": name,
+            "db": event.database_name,
+            "collection": coll if isinstance(coll, str) else "",
+            "command": _explainable_command(event.command) if name in EXPLAINABLE else None,
+        }
+        with self._lock:
+            self._inflight[(event.connection_id, event.request_id)] = info
+
+    def _pop(self, event) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._inflight.pop((event.connection_id, event.request_id), None)
+
+    def succeeded(self, event):
+        info = self._pop(event)
+        if info is None:
+            return
+        seconds = event.duration_micros / 1e6
+        labels = {"command": info["command_name"], "collection": info["collection"]}
+        docs = _reply_documents(event.reply)
+        REGISTRY.observe("mongo_command_seconds", seconds, labels)
+        REGISTRY.inc("mongo_command_documents_total", docs, labels)
+        if REPLY_BYTES_SAMPLE and random.random() < REPLY_BYTES_SAMPLE:
+            REGISTRY.inc("mongo_command_reply_bytes_total", len(bson.encode(event.reply)) / REPLY_BYTES_SAMPLE, labels)
+
+        if seconds * 1000 >= SLOW_MS:
+            SLOW_LOG.add(dict(
+                info,
+                at=datetime.utcnow(),
+                duration_ms=seconds * 1000,
+                documents=docs,
+                plan=None,
+            ))
+
+    def failed(self, event):
+        info = self._pop(event)
+        if info is None:
+            return
+        labels = {"command": info["command_name"], "collection": info["collection"]}
+        REGISTRY.observe("mongo_command_seconds", event.duration_micros / 1e6, labels)
+        REGISTRY.inc("mongo_command_failures_total", 1, labels)
+
+
+COMMAND_METRICS = CommandMetrics()
@@ -1,31 +1,285 @@
 from __future__ import annotations
 
 import os
-from pymongo import MongoClient, ASCENDING
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from pymongo import MongoClient, ASCENDING, DESCENDING, monitoring
 from dotenv import load_dotenv
 
+from metrics import COMMAND_METRICS, REGISTRY, SLOW_LOG
+
 load_dotenv()
 
+
+### Metrike connection poola ###
+
+# kumulativne granice (sekunde) za histogram cekanja na slobodnu konekciju
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+
+
+class PoolMetrics(monitoring.ConnectionPoolListener):
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self.checked_out = 0
+            self.max_checked_out = 0
+            self.checkouts = 0
+            self.checkout_failures: Dict[str, int] = {}
+            self.wait_count = 0
+            self.wait_sum = 0.0
+            self.wait_max = 0.0
+            self.wait_buckets = [0] * len(WAIT_BUCKETS)
+            self.connections_open = 0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.pools_cleared = 0
+
+    def _observe_wait(self) -> None:
+        t0 = getattr(self._local, "t0", None)
+        if t0 is None:
+            return
+        self._local.t0 = None
+        wait = time.perf_counter() - t0
+        self.wait_count += 1
+        self.wait_sum += wait
+        self.wait_max = max(self.wait_max, wait)
+        for i, le in enumerate(WAIT_BUCKETS):
+            if wait <= le:
+                self.wait_buckets[i] += 1
+
+    def connection_check_out_started(self, event):
+        self._local.t0 = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        with self._lock:
+            self._observe_wait()
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+
+    def connection_check_out_failed(self, event):
+        with self._lock:
+            self._observe_wait()
+            reason = str(event.reason)
+            self.checkout_failures[reason] = self.checkout_failures.get(reason, 0) + 1
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self._lock:
+            self.pools_cleared += 1
+
+    def pool_closed(self, event):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "checked_out": self.checked_out,
+                "max_checked_out": self.max_checked_out,
+                "checkouts": self.checkouts,
+                "checkout_failures": dict(self.checkout_failures),
+                "wait_count": self.wait_count,
+                "wait_sum_seconds": self.wait_sum,
+                "wait_avg_seconds": (self.wait_sum / self.wait_count) if self.wait_count else 0.0,
+                "wait_max_seconds": self.wait_max,
+                "wait_buckets": dict(zip(WAIT_BUCKETS, self.wait_buckets)),
+                "connections_open": self.connections_open,
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "pools_cleared": self.pools_cleared,
+            }
+
+
+POOL_METRICS = PoolMetrics()
+
+
+def _pool_gauges():
+    snap = POOL_METRICS.snapshot()
+    out = [
+        ("mongo_pool_checked_out", {}, snap["checked_out"]),
+        ("mongo_pool_max_checked_out", {}, snap["max_checked_out"]),
+        ("mongo_pool_checkouts", {}, snap["checkouts"]),
+        ("mongo_pool_connections_open", {}, snap["connections_open"]),
+        ("mongo_pool_wait_seconds_sum", {}, snap["wait_sum_seconds"]),
+        ("mongo_pool_wait_seconds_max", {}, snap["wait_max_seconds"]),
+        ("mongo_pool_cleared", {}, snap["pools_cleared"]),
+    ]
+    for le, n in snap["wait_buckets"].items():
+        out.append(("mongo_pool_wait_le", {"le": le}, n))
+    for reason, n in snap["checkout_failures"].items():
+        out.append(("mongo_pool_checkout_failures", {"reason": reason}, n))
+    return out
+
+
+REGISTRY.register_collector(_pool_gauges)
+
+
+### Dijeljeni MongoClient ###
+
+# Jedan MongoClient po procesu (app, importer, maintenance); MongoClient je
+# thread-safe i sam drzi pool, pa ga nema smisla graditi po pozivu.
+
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+
+
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    raw = os.getenv(name, "")
+    return int(raw) if raw.strip() else default
+
+
+def _default_compressors() -> str:
+    # zstd samo ako je paket instaliran, inace PyMongo upozorava pri svakom spajanju
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return "zlib"
+    return "zstd,zlib"
+
+
+def client_options() -> Dict[str, Any]:
+    opts: Dict[str, Any] = {
+        "appname": os.getenv("MONGO_APP_NAME", "recipes_streamlit"),
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 100),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", None),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", None),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        "readPreference": os.getenv("MONGO_READ_PREFERENCE", "primary"),
+    }
+    compressors = os.getenv("MONGO_COMPRESSORS", _default_compressors()).strip()
+    if compressors:
+        opts["compressors"] = compressors
+        opts["zlibCompressionLevel"] = _env_int("MONGO_ZLIB_LEVEL", 1)
+    return {k: v for k, v in opts.items() if v is not None}
+
+
+def get_client(event_listeners: Optional[List[Any]] = None) -> MongoClient:
+    global _client
+    with _client_lock:
+        if _client is None:
+            uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
+            listeners = [POOL_METRICS, COMMAND_METRICS] + list(event_listeners or [])
+            client = MongoClient(uri, event_listeners=listeners, **client_options())
+            client.admin.command("ping")
+            SLOW_LOG.auto_explain(client)
+            _client = client
+        return _client
+
+
+def close_client() -> None:
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+            _client = None
+
+
 def get_db():
-    uri = os.getenv("MONGO_URI", "mongodb://localhost:27017")
     db_name = os.getenv("MONGO_DB_NAME", "recipes_app")
-    client = MongoClient(uri)
-    db = client[db_name]
-    db.command("ping")
-    return db
+    return get_client()[db_name]
+
+
+# zadani maxTimeMS za citanja iz services (0 = bez limita)
+MAX_TIME_MS = _env_int("MONGO_MAX_TIME_MS", 5000)
+
+
+def read_options() -> Dict[str, Any]:
+    return {"maxTimeMS": MAX_TIME_MS} if MAX_TIME_MS else {}
+
+
+def pool_metrics() -> Dict[str, Any]:
+    return POOL_METRICS.snapshot()
+
+
+# materijalizirane kartice recepata, vidi backends.feed_stages
+FEED_COLLECTION = "recipes_feed"
+
+# preporuke iz spremanja, vidi recommend.py
+CO_SAVES_COLLECTION = "co_saves"
+RECS_COLLECTION = "recipe_recs"
+
+# vokabular sastojaka: {_id: kljuc, id: gusti int, df: broj recepata}
+INGREDIENTS_COLLECTION = "ingredients"
+# brojaci za dodjelu id-eva ({_id: "ingredients", n: zadnji dodijeljeni}),
+# re-tagiranja ({_id: "recipes_retag", n}, vidi services._sync_index) i
+# oznake zavrsenih migracija ({_id: "migrations"}, vidi services._migrated)
+COUNTERS_COLLECTION = "counters"
+MIGRATIONS_DOC = "migrations"
+
+
+# upsert po import_key bez ovog indeksa skenira kolekciju za svaki zapis i ne
+# stiti od duplikata; importer ga osigurava i kad se ensure_indexes preskoci
+def ensure_import_key_index(db):
+    db["recipes"].create_index(
+        [("import_key", ASCENDING)],
+        unique=True,
+        partialFilterExpression={"import_key": {"$exists": True}},
+    )
+
 
 def ensure_indexes(db):
+    # multikey indeks nad ingredient_keys trebaju samo filtri po stringovima
+    # (prije backfill-ingredient-ids); nakon migracije ga maintenance.py
+    # drop-key-index brise, pa ga se ovdje vise ne stvara
+    migrations = db[COUNTERS_COLLECTION].find_one({"_id": MIGRATIONS_DOC}) or {}
+    key_index = "ingredient_ids" not in migrations
+
     users = db["users"]
     recipes = db["recipes"]
     saves = db["saves"]
     comments = db["comments"]
+    feed = db[FEED_COLLECTION]
+    co_saves = db[CO_SAVES_COLLECTION]
+    ingredients = db[INGREDIENTS_COLLECTION]
 
     users.create_index([("username", ASCENDING)], unique=True)
 
     recipes.create_index([("author_id", ASCENDING)])
     recipes.create_index([("created_at", ASCENDING)])
-    recipes.create_index([("ingredient_keys", ASCENDING)])
+    # allergen_mask na kraju sort indeksa: "bez alergena" ($bitsAllClear) se
+    # provjerava na kljucu indeksa, bez citanja dokumenata koje filtar odbaci
+    recipes.create_index([("created_at", DESCENDING), ("_id", DESCENDING), ("allergen_mask", ASCENDING)])
+    recipes.create_index([("author_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    if key_index:
+        recipes.create_index([("ingredient_keys", ASCENDING)])
+    recipes.create_index([("ingredient_ids", ASCENDING)])
     recipes.create_index([("allergens", ASCENDING)])
+    # kandidati za slicne recepte (similarity.py)
+    recipes.create_index([("lsh_bands", ASCENDING)])
+    # trending poredak (trending.py)
+    recipes.create_index([("trend", DESCENDING), ("_id", DESCENDING), ("allergen_mask", ASCENDING)])
+    ensure_import_key_index(db)
 
     saves.create_index([("user_id", 1), ("recipe_id", 1)], unique=True)
     saves.create_index([("recipe_id", 1)])
@@ -33,3 +287,18 @@ def ensure_indexes(db):
 
     comments.create_index([("recipe_id", 1), ("created_at", -1)])
     comments.create_index([("user_id", 1), ("created_at", -1)])
+
+    # isti indeksi kao za kartice na recipes, jer feed sluzi iste upite
+    feed.create_index([("created_at", DESCENDING), ("_id", DESCENDING), ("allergen_mask", ASCENDING)])
+    feed.create_index([("author_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+    feed.create_index([("trend", DESCENDING), ("_id", DESCENDING), ("allergen_mask", ASCENDING)])
+    if key_index:
+        feed.create_index([("ingredient_keys", ASCENDING)])
+    feed.create_index([("ingredient_ids", ASCENDING)])
+    feed.create_index([("allergens", ASCENDING)])
+
+    ingredients.create_index([("id", ASCENDING)], unique=True)
+
+    # recommend.rebuild ih postavlja i na novu kolekciju prije zamjene
+    co_saves.create_index([("r", ASCENDING), ("o", ASCENDING)], unique=True)
+    co_saves.create_index([("r", ASCENDING), ("n", DESCENDING), ("o", DESCENDING)])
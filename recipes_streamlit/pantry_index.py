@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import heapq
+import threading
+from array import array
+from collections import Counter
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from bson import ObjectId
+
+try:
+    import numpy as np
+except ImportError:  # radi i bez numpy-ja, samo sporije brojanje
+    np = None
+
+
+### In-memory indeks za "Imam doma" ###
+
+# Svaki recept dobije gusti int id (redoslijed dodavanja), a za svaki
+# ingredient key i alergen drzi se posting lista tih id-eva. Broj poklapanja
+# se racuna zbrajanjem posting lista samo za kljuceve iz smocnice, umjesto
+# $setIntersection nad cijelom kolekcijom. Kod jednakog broja poklapanja
+# poredak je po (created_at, _id) kao SORTS["pantry"]: _rank[gusti id] je
+# mjesto recepta u tom poretku.
+
+def _sort_time(dt: Optional[datetime]) -> datetime:
+    # Mongo cuva milisekunde; bez datuma (ne bi trebalo) recept je najnoviji
+    dt = dt or datetime.utcnow()
+    return dt.replace(microsecond=dt.microsecond // 1000 * 1000)
+
+
+class PantryIndex:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids: List[ObjectId] = []
+        self._dense: Dict[ObjectId, int] = {}
+        self._sort_keys: List[Tuple[datetime, ObjectId]] = []
+        self._rank = array("i")
+        self._rank_dirty = False
+        self._max_key: Optional[Tuple[datetime, ObjectId]] = None
+        # kljucevi i alergeni po gustom id-u, za azuriranje na mjestu
+        self._slots: List[Tuple[Tuple[str, ...], Tuple[str, ...]]] = []
+        self._postings: Dict[str, array] = {}
+        self._allergens: Dict[str, array] = {}
+
+    @classmethod
+    def build(cls, backend, batch_size: int = 10000) -> "PantryIndex":
+        index = cls()
+        for d in backend.iter_recipes(("ingredient_keys", "allergens", "created_at"), batch_size):
+            index._add(d["_id"], d.get("ingredient_keys") or [], d.get("allergens") or [], d.get("created_at"))
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @staticmethod
+    def _move(lists: Dict[str, array], dense: int, old: Tuple[str, ...], new: Tuple[str, ...]) -> None:
+        # samo promijenjeni kljucevi (re-tagiranje obicno mijenja malo njih)
+        for k in set(old) - set(new):
+            lists[k].remove(dense)
+        for k in set(new) - set(old):
+            lists.setdefault(k, array("i")).append(dense)
+
+    def _add(
+        self,
+        rid: ObjectId,
+        keys: Iterable[str],
+        allergens: Iterable[str],
+        created_at: Optional[datetime] = None,
+    ) -> None:
+        keys, allergens = tuple(sorted(set(keys))), tuple(sorted(set(allergens)))
+        dense = self._dense.get(rid)
+        if dense is not None:
+            # ponovno dodan recept (npr. nakon re-tagiranja): isti gusti id
+            old_keys, old_allergens = self._slots[dense]
+            self._move(self._postings, dense, old_keys, keys)
+            self._move(self._allergens, dense, old_allergens, allergens)
+            self._slots[dense] = (keys, allergens)
+            if created_at is not None and _sort_time(created_at) != self._sort_keys[dense][0]:
+                self._sort_keys[dense] = (_sort_time(created_at), rid)
+                self._max_key = max(self._max_key, self._sort_keys[dense])
+                self._rank_dirty = True
+            return
+
+        sort_key = (_sort_time(created_at), rid)
+        dense = len(self._ids)
+        self._ids.append(rid)
+        self._dense[rid] = dense
+        self._slots.append((keys, allergens))
+        # u poretku (build, novi recepti) rang je samo sljedeci broj
+        if self._max_key is not None and sort_key < self._max_key:
+            self._rank_dirty = True
+        else:
+            self._max_key = sort_key
+        self._sort_keys.append(sort_key)
+        self._rank.append(dense)
+        self._move(self._postings, dense, (), keys)
+        self._move(self._allergens, dense, (), allergens)
+
+    def add(
+        self,
+        rid: ObjectId,
+        keys: Iterable[str],
+        allergens: Iterable[str],
+        created_at: Optional[datetime] = None,
+    ) -> None:
+        with self._lock:
+            self._add(rid, keys, allergens, created_at)
+
+    def _ranks(self) -> array:
+        # nakon dodavanja izvan poretka rangovi se racunaju ispocetka (rijetko)
+        if self._rank_dirty:
+            order = sorted(range(len(self._ids)), key=self._sort_keys.__getitem__)
+            for r, d in enumerate(order):
+                self._rank[d] = r
+            self._rank_dirty = False
+        return self._rank
+
+    def search(
+        self,
+        pantry_keys: List[str],
+        min_match: int = 1,
+        exclude_allergens: Optional[List[str]] = None,
+        limit: int = 50,
+        after: Optional[Tuple[int, ObjectId]] = None,
+    ) -> List[Tuple[ObjectId, int]]:
+        min_match = max(int(min_match), 1)
+        with self._lock:
+            lists = [self._postings[k] for k in set(pantry_keys) if k in self._postings]
+            if not lists:
+                return []
+
+            excluded = [self._allergens[a] for a in set(exclude_allergens or []) if a in self._allergens]
+
+            rank = self._ranks()
+            after_key = None
+            if after is not None:
+                dense = self._dense.get(after[1])
+                after_key = (int(after[0]), rank[dense] if dense is not None else -1)
+
+            if np is not None:
+                top = self._search_numpy(lists, excluded, min_match, int(limit), after_key, rank)
+            else:
+                top = self._search_python(lists, excluded, min_match, int(limit), after_key, rank)
+            return [(self._ids[d], c) for d, c in top]
+
+    def _search_numpy(self, lists, excluded, min_match, limit, after_key, rank) -> List[Tuple[int, int]]:
+        n = len(self._ids)
+        postings = np.concatenate([np.frombuffer(p, dtype=np.int32) for p in lists])
+        counts = np.bincount(postings, minlength=n)
+
+        mask = counts >= min_match
+        for p in excluded:
+            mask[np.frombuffer(p, dtype=np.int32)] = False
+
+        cand = np.flatnonzero(mask)
+        # (match_count, rang) u jednom int64 kljucu -> jedan argpartition
+        scores = counts[cand].astype(np.int64) * n + np.frombuffer(rank, dtype=np.int32)[cand]
+        if after_key is not None:
+            keep = scores < after_key[0] * n + after_key[1]
+            cand, scores = cand[keep], scores[keep]
+
+        if len(scores) > limit:
+            part = np.argpartition(-scores, limit - 1)[:limit]
+            cand, scores = cand[part], scores[part]
+        order = np.argsort(-scores, kind="stable")
+        return [(int(d), int(counts[d])) for d in cand[order]]
+
+    def _search_python(self, lists, excluded, min_match, limit, after_key, rank) -> List[Tuple[int, int]]:
+        counts: Counter = Counter()
+        for p in lists:
+            counts.update(p)
+
+        skip = set()
+        for p in excluded:
+            skip.update(p)
+
+        cand = (
+            (c, rank[d], d) for d, c in counts.items()
+            if c >= min_match and d not in skip and (after_key is None or (c, rank[d]) < after_key)
+        )
+        return [(d, c) for c, _, d in heapq.nlargest(limit, cand)]
@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+import heapq
+import itertools
+import multiprocessing
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, ReplaceOne, UpdateOne
+
+from mongo import CO_SAVES_COLLECTION, RECS_COLLECTION
+
+
+Doc = Dict[str, Any]
+Rec = Tuple[ObjectId, int]
+
+
+### Preporuke iz spremanja ###
+
+# "Tko je spremio ovo, spremio je i": rijetka matrica supojavljivanja je
+# kolekcija co_saves s retkom (r, o, n) za svaki par recepata koje je spremio
+# barem jedan isti korisnik (n = broj takvih korisnika, oba smjera), a
+# recipe_recs drzi gotovu top-N listu po receptu, pa je citanje jedan
+# find_one po _id.
+#
+# save/unsave mijenjaju samo parove spremljenog recepta s ostalim spremanjima
+# istog korisnika unutar prozora MAX_USER_SAVES najnovijih (window_changes);
+# liste tih recepata se azuriraju bez ponovnog racunanja kad god je to
+# egzaktno (merge_rec), inace iz co_saves retka preko indeksa.
+# Puna obnova (rebuild) ide u dvije faze u paralelnim procesima:
+#   1. rasponi user_id -> djelomicni brojevi parova u co_saves_parts
+#   2. rasponi recipe _id -> zbroj po paru u co_saves i top-N u recipe_recs
+# u pomocne kolekcije koje na kraju rename zamijeni s pravima, pa citanja ne
+# vide pola posla. Promjene iz save/unsave za vrijeme obnove se gube do
+# sljedece obnove. Od korisnika s puno spremanja broji se samo
+# MAX_USER_SAVES najnovijih.
+
+TOP_N = 20
+MAX_USER_SAVES = 200
+INSERT_BATCH = 10000
+# djelomicni brojevi se ispisuju u co_saves_parts cim ih se nakupi ovoliko
+FLUSH_PAIRS = 500000
+
+PARTS_COLLECTION = CO_SAVES_COLLECTION + "_parts"
+_REBUILD_SUFFIX = "_rebuild"
+
+
+def _key(rec: Rec) -> Tuple[int, ObjectId]:
+    # veci broj zajednickih spremanja prvi, kod jednakih noviji recept
+    return rec[1], rec[0]
+
+
+def top_n(row: Dict[ObjectId, int], n: int = TOP_N) -> List[Rec]:
+    return heapq.nlargest(n, ((o, c) for o, c in row.items() if c > 0), key=_key)
+
+
+def pair_counts(groups: Iterable[Sequence[ObjectId]], counts: Optional[Counter] = None) -> Counter:
+    # svaka grupa su spremanja jednog korisnika, najnovija prva
+    counts = counts if counts is not None else Counter()
+    for rids in groups:
+        counts.update(itertools.permutations(rids[:MAX_USER_SAVES], 2))
+    return counts
+
+
+def merge_rec(recs: List[Rec], rid: ObjectId, n: int) -> Optional[List[Rec]]:
+    # nova vrijednost para (vlasnik liste, rid); None znaci da lista vise nije
+    # sigurno top-N i treba je izracunati iz co_saves retka
+    rest = [r for r in recs if r[0] != rid]
+    was_in = len(rest) != len(recs)
+    if len(recs) < TOP_N:
+        # lista nije puna, dakle sadrzi sve parove s n > 0
+        return sorted(rest + [(rid, n)] if n > 0 else rest, key=_key, reverse=True)
+    # puna lista: svi parovi izvan nje su ispod zadnjeg elementa
+    floor = _key(recs[-1])
+    if n > 0 and (not was_in or _key((rid, n)) >= floor):
+        return sorted(rest + [(rid, n)], key=_key, reverse=True)[:TOP_N]
+    if not was_in:
+        return recs
+    return None
+
+
+def window_changes(
+    others: Sequence[ObjectId], position: int, recipe_id: ObjectId, delta: int
+) -> List[Tuple[ObjectId, Sequence[ObjectId], int]]:
+    # others: najnovija spremanja korisnika bez recipe_id (najvise
+    # MAX_USER_SAVES), position: koliko ih je novije od recipe_id. Kao u
+    # pair_counts broji se samo prozor MAX_USER_SAVES najnovijih: spremanje
+    # izvan njega ne mijenja nista, a unutar njega istiskuje (save) ili vraca
+    # (unsave) spremanje na granici prozora. Vraca (recept, partneri, delta).
+    if position >= MAX_USER_SAVES:
+        return []
+    partners = others[:MAX_USER_SAVES - 1]
+    changes = [(recipe_id, partners, delta)]
+    if len(others) >= MAX_USER_SAVES:
+        changes.append((others[MAX_USER_SAVES - 1], partners, -delta))
+    return changes
+
+
+def merge_recs(recs: List[Rec], pairs: Sequence[Tuple[ObjectId, int]]) -> Optional[List[Rec]]:
+    # merge_rec za vise promijenjenih parova iste liste
+    for rid, n in pairs:
+        recs = merge_rec(recs, rid, n)
+        if recs is None:
+            return None
+    return recs
+
+
+def _recs_doc(rid: ObjectId, recs: List[Rec]) -> Doc:
+    return {"_id": rid, "recs": [{"recipe_id": o, "n": n} for o, n in recs], "updated_at": datetime.utcnow()}
+
+
+def _recs_from_doc(doc: Optional[Doc]) -> List[Rec]:
+    return [(r["recipe_id"], r["n"]) for r in (doc or {}).get("recs") or []]
+
+
+### Mongo: citanje i inkrementalno azuriranje ###
+
+def recipe_recs(db, recipe_id: ObjectId) -> List[Rec]:
+    return _recs_from_doc(db[RECS_COLLECTION].find_one({"_id": recipe_id}))
+
+
+def _row_top(co, rid: ObjectId) -> List[Rec]:
+    cur = co.find({"r": rid, "n": {"$gt": 0}}, {"_id": 0, "o": 1, "n": 1}).sort([("n", DESCENDING), ("o", DESCENDING)]).limit(TOP_N)
+    return [(d["o"], d["n"]) for d in cur]
+
+
+def apply_delta(db, user_id: ObjectId, recipe_id: ObjectId, delta: int, saved_at: datetime) -> int:
+    # poziva se nakon upisa/brisanja spremanja (saved_at je njegov created_at);
+    # vraca broj azuriranih lista
+    newest = list(
+        db["saves"]
+        .find({"user_id": user_id, "recipe_id": {"$ne": recipe_id}}, {"_id": 0, "recipe_id": 1, "created_at": 1})
+        .sort("created_at", -1)
+        .limit(MAX_USER_SAVES)
+    )
+    position = sum(1 for d in newest if d["created_at"] > saved_at)
+    changes = window_changes([d["recipe_id"] for d in newest], position, recipe_id, delta)
+    partners = changes[0][1] if changes else []
+    if not partners:
+        return 0
+
+    co = db[CO_SAVES_COLLECTION]
+    ops = []
+    for rid, _, d in changes:
+        for o in partners:
+            ops.append(UpdateOne({"r": rid, "o": o}, {"$inc": {"n": int(d)}}, upsert=True))
+            ops.append(UpdateOne({"r": o, "o": rid}, {"$inc": {"n": int(d)}}, upsert=True))
+    co.bulk_write(ops, ordered=False)
+    changed = [rid for rid, _, _ in changes]
+    co.delete_many({"r": {"$in": changed + list(partners)}, "n": {"$lte": 0}})
+
+    counts = {
+        (d["r"], d["o"]): d["n"]
+        for d in co.find({"r": {"$in": list(partners)}, "o": {"$in": changed}}, {"_id": 0, "r": 1, "o": 1, "n": 1})
+    }
+    current = {d["_id"]: _recs_from_doc(d) for d in db[RECS_COLLECTION].find({"_id": {"$in": list(partners)}})}
+
+    writes = [ReplaceOne({"_id": rid}, _recs_doc(rid, _row_top(co, rid)), upsert=True) for rid in changed]
+    for o in partners:
+        old = current.get(o, [])
+        new = merge_recs(old, [(rid, counts.get((o, rid), 0)) for rid in changed])
+        if new is None:
+            new = _row_top(co, o)
+        if new != old:
+            writes.append(ReplaceOne({"_id": o}, _recs_doc(o, new), upsert=True))
+    db[RECS_COLLECTION].bulk_write(writes, ordered=False)
+    return len(writes)
+
+
+### Mongo: puna obnova ###
+
+def _ranges(coll, chunk: int) -> List[Tuple[Optional[ObjectId], Optional[ObjectId]]]:
+    # granice svakih chunk _id-eva, citano samo iz _id indeksa
+    bounds: List[ObjectId] = []
+    for i, d in enumerate(coll.find({}, {"_id": 1}).sort("_id", 1)):
+        if i and i % chunk == 0:
+            bounds.append(d["_id"])
+    edges: List[Optional[ObjectId]] = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _range_filter(field: str, lo: Optional[ObjectId], hi: Optional[ObjectId]) -> Doc:
+    cond: Doc = {}
+    if lo is not None:
+        cond["$gte"] = lo
+    if hi is not None:
+        cond["$lt"] = hi
+    return {field: cond} if cond else {}
+
+
+def _insert_rows(coll, rows: Iterable[Doc]) -> int:
+    n = 0
+    it = iter(rows)
+    while True:
+        batch = list(itertools.islice(it, INSERT_BATCH))
+        if not batch:
+            return n
+        coll.insert_many(batch, ordered=False)
+        n += len(batch)
+
+
+def count_user_range(db, lo: Optional[ObjectId], hi: Optional[ObjectId]) -> Doc:
+    # faza 1: parovi iz spremanja korisnika u [lo, hi), djelomicni zbroj u co_saves_parts
+    cur = (
+        db["saves"]
+        .find(_range_filter("user_id", lo, hi), {"_id": 0, "user_id": 1, "recipe_id": 1})
+        .sort([("user_id", ASCENDING), ("created_at", DESCENDING)])
+    )
+    users = 0
+    pairs = 0
+    counts: Counter = Counter()
+    for _, group in itertools.groupby(cur, key=lambda d: d["user_id"]):
+        pair_counts([[d["recipe_id"] for d in itertools.islice(group, MAX_USER_SAVES)]], counts)
+        users += 1
+        if len(counts) >= FLUSH_PAIRS:
+            pairs += _insert_rows(db[PARTS_COLLECTION], ({"r": a, "o": b, "n": n} for (a, b), n in counts.items()))
+            counts.clear()
+    pairs += _insert_rows(db[PARTS_COLLECTION], ({"r": a, "o": b, "n": n} for (a, b), n in counts.items()))
+    return {"users": users, "pairs": pairs}
+
+
+def top_recipe_range(db, lo: Optional[ObjectId], hi: Optional[ObjectId]) -> Doc:
+    # faza 2: zbroj djelomicnih brojeva za recepte u [lo, hi) i njihove top-N liste
+    cur = (
+        db[PARTS_COLLECTION]
+        .find(_range_filter("r", lo, hi), {"_id": 0})
+        .sort([("r", ASCENDING), ("o", ASCENDING)])
+    )
+    co_rows: List[Doc] = []
+    recs_docs: List[Doc] = []
+    pairs = 0
+    for rid, group in itertools.groupby(cur, key=lambda d: d["r"]):
+        row: Dict[ObjectId, int] = {}
+        for d in group:
+            row[d["o"]] = row.get(d["o"], 0) + d["n"]
+        co_rows.extend({"r": rid, "o": o, "n": n} for o, n in row.items())
+        recs_docs.append(_recs_doc(rid, top_n(row)))
+        if len(co_rows) >= INSERT_BATCH:
+            pairs += _insert_rows(db[CO_SAVES_COLLECTION + _REBUILD_SUFFIX], co_rows)
+            co_rows = []
+    pairs += _insert_rows(db[CO_SAVES_COLLECTION + _REBUILD_SUFFIX], co_rows)
+    _insert_rows(db[RECS_COLLECTION + _REBUILD_SUFFIX], recs_docs)
+    return {"recipes": len(recs_docs), "pairs": pairs}
+
+
+def ensure_co_saves_indexes(co) -> None:
+    co.create_index([("r", ASCENDING), ("o", ASCENDING)], unique=True)
+    co.create_index([("r", ASCENDING), ("n", DESCENDING), ("o", DESCENDING)])
+
+
+_TASKS: Dict[str, Callable[..., Doc]] = {
+    "count_user_range": count_user_range,
+    "top_recipe_range": top_recipe_range,
+}
+
+
+def _run_task(task: str, db_name: str, lo: Optional[ObjectId], hi: Optional[ObjectId]) -> Doc:
+    # u radnom procesu: vlastiti klijent (MongoClient se ne dijeli preko procesa)
+    from mongo import get_client
+    return _TASKS[task](get_client()[db_name], lo, hi)
+
+
+def _run_phase(db, task: str, ranges, workers: int, progress, stats: Doc) -> None:
+    def done(result: Doc) -> None:
+        for k, v in result.items():
+            stats[k] = stats.get(k, 0) + v
+        stats["tasks_done"] = stats.get("tasks_done", 0) + 1
+        stats["seconds"] = time.perf_counter() - stats["_t0"]
+        if progress:
+            progress({k: v for k, v in stats.items() if not k.startswith("_")})
+
+    stats["phase"] = task
+    if workers <= 1:
+        for lo, hi in ranges:
+            done(_TASKS[task](db, lo, hi))
+        return
+    # spawn: fork procesa s otvorenim MongoClient-om nije siguran
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        futures = [pool.submit(_run_task, task, db.name, lo, hi) for lo, hi in ranges]
+        for f in futures:
+            done(f.result())
+
+
+def rebuild(
+    db,
+    workers: Optional[int] = None,
+    chunk_users: int = 2000,
+    chunk_recipes: int = 50000,
+    progress: Optional[Callable[[Doc], None]] = None,
+) -> Doc:
+    # workers <= 1 radi u ovom procesu s danim db (npr. mongomock)
+    workers = int(workers if workers is not None else (os.cpu_count() or 1))
+    stats: Doc = {"workers": workers, "_t0": time.perf_counter()}
+
+    co_tmp = db[CO_SAVES_COLLECTION + _REBUILD_SUFFIX]
+    recs_tmp = db[RECS_COLLECTION + _REBUILD_SUFFIX]
+    for coll in (db[PARTS_COLLECTION], co_tmp, recs_tmp):
+        coll.drop()
+
+    _run_phase(db, "count_user_range", _ranges(db["users"], int(chunk_users)), workers, progress, stats)
+    stats["partial_pairs"] = stats.pop("pairs", 0)
+    db[PARTS_COLLECTION].create_index([("r", ASCENDING), ("o", ASCENDING)])
+    _run_phase(db, "top_recipe_range", _ranges(db["recipes"], int(chunk_recipes)), workers, progress, stats)
+
+    ensure_co_saves_indexes(co_tmp)
+    if recs_tmp.name not in db.list_collection_names():
+        # bez ijednog spremanja; prazna kolekcija da rename ima sto zamijeniti
+        db.create_collection(recs_tmp.name)
+    co_tmp.rename(CO_SAVES_COLLECTION, dropTarget=True)
+    recs_tmp.rename(RECS_COLLECTION, dropTarget=True)
+    db[PARTS_COLLECTION].drop()
+
+    stats["seconds"] = time.perf_counter() - stats.pop("_t0")
+    stats.pop("tasks_done", None)
+    stats.pop("phase", None)
+    return stats
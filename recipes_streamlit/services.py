@@ -1,12 +1,35 @@
 from __future__ import annotations
 
+import base64
+import os
+import threading
+import time
+from collections import Counter
 from datetime import datetime
-from typing import Any, Dict, List, Optional, Set, Tuple, Union
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple, Union
 
-from bson import ObjectId
+from bson import ObjectId, json_util
+from pymongo import ReplaceOne, ReturnDocument, UpdateOne
 from pymongo.errors import DuplicateKeyError
 
-from logic import canonicalize_key, normalize_key, detect_allergens, split_norm_csv
+from backends import CARD_SORTS, SORTS, StorageBackend, as_backend, feed_stages
+from logic import (
+    RULES_VERSION,
+    allergen_mask,
+    canonicalize_key,
+    normalize_key,
+    detect_allergens,
+    detect_allergens_many,
+    split_norm_csv,
+)
+from metrics import REGISTRY, timed
+from pantry_index import PantryIndex
+from text_index import FIELD_WEIGHTS, TextIndex, tokenize
+from suggest import SuggestIndex
+from similarity import LSH_VERSION, MAX_CANDIDATES, lsh_bands, rank_by_jaccard
+from cache import ResultCache, UserDirectory, VocabularyCache
+import trending
+from mongo import COUNTERS_COLLECTION, FEED_COLLECTION, INGREDIENTS_COLLECTION, MIGRATIONS_DOC
 
 
 Doc = Dict[str, Any]
@@ -36,11 +59,41 @@ def serialize_doc(d: Doc) -> Doc:
     return serialize_value(d)
 
 
+### Backend ###
+
+# sve funkcije primaju ili pymongo Database ili gotov StorageBackend
+# (npr. backends.MemoryBackend za testove i benchmark bez mongod-a)
+def get_backend(db) -> StorageBackend:
+    return as_backend(
+        db,
+        join_authors=not USE_USER_DIRECTORY,
+        feed=USE_RECIPES_FEED,
+        mask_allergens=USE_ALLERGEN_MASK,
+        use_ingredient_ids=USE_INGREDIENT_IDS,
+    )
+
+
+# kartice iz materijaliziranog recipes_feed (vidi backends.feed_stages);
+# prazan ili razjeden feed app popravi pri pokretanju (ensure_recipes_feed)
+USE_RECIPES_FEED = os.getenv("USE_RECIPES_FEED", "1") == "1"
+
+# "bez alergena" kao $bitsAllClear nad allergen_mask; na bazi s receptima bez
+# maske app pri pokretanju ostaje na $nin (detect_allergen_mask) dok se ne
+# pokrene maintenance.py backfill-allergen-mask
+USE_ALLERGEN_MASK = os.getenv("USE_ALLERGEN_MASK", "1") == "1"
+
+# filtri po sastojcima nad ingredient_ids umjesto stringova; na bazi bez
+# vokabulara ili s receptima bez id-eva app pri pokretanju ostaje na
+# stringovima (detect_ingredient_ids) dok se ne pokrene
+# maintenance.py backfill-ingredient-ids
+USE_INGREDIENT_IDS = os.getenv("USE_INGREDIENT_IDS", "1") == "1"
+
+
 ### Login i Register ###
 
+@timed
 def login(db, username: str, password: str) -> Tuple[Optional[Doc], Optional[str]]:
-    users = db["users"]
-    user = users.find_one({"username": username})
+    user = get_backend(db).find_user(username)
     if not user:
         return None, "Korisnik ne postoji."
     if password != user.get("password", ""):
@@ -48,8 +101,9 @@ def login(db, username: str, password: str) -> Tuple[Optional[Doc], Optional[str
     return user, None
 
 
+@timed
 def register(db, username: str, password: str, display_name: str) -> Tuple[Optional[Doc], Optional[str]]:
-    users = db["users"]
+    backend = get_backend(db)
     doc = {
         "username": username,
         "display_name": display_name or username,
@@ -57,24 +111,25 @@ def register(db, username: str, password: str, display_name: str) -> Tuple[Optio
         "created_at": datetime.utcnow(),
     }
     try:
-        res = users.insert_one(doc)
+        user_id = backend.insert_user(doc)
     except DuplicateKeyError:
         return None, "Username već postoji."
-    return users.find_one({"_id": res.inserted_id}), None
+    return backend.get_user(user_id), None
 
 
+# pristup stranici Admin / metrike: is_admin na korisniku ili username u
+# ADMIN_USERS (odvojeni zarezom)
+ADMIN_USERS = {u.strip() for u in os.getenv("ADMIN_USERS", "").split(",") if u.strip()}
 
-### Recepti ###
 
-def create_recipe(
-    db,
-    user_id: ObjectId,
-    title: str,
-    description: str,
-    ingredients_input: List[Doc],
-    steps: List[str],) -> Tuple[ObjectId, List[str], List[str]]:
-    recipes = db["recipes"]
+def is_admin(user: Optional[Doc]) -> bool:
+    return bool(user) and (bool(user.get("is_admin")) or user.get("username") in ADMIN_USERS)
+
+
+
+### Recepti ###
 
+def _ingredient_fields(ingredients_input: List[Doc]) -> Tuple[List[Doc], List[str], List[str]]:
     ingredients: List[Doc] = []
     keys: List[str] = []
     names: List[str] = []
@@ -94,13 +149,25 @@ def create_recipe(
         if k:
             keys.append(k)
 
+    return ingredients, sorted(set(keys)), names
+
+
+def build_recipe_doc(
+    user_id: ObjectId,
+    title: str,
+    description: str,
+    ingredients_input: List[Doc],
+    steps: List[str],
+    created_at: Optional[datetime] = None,
+) -> Doc:
+    ingredients, ingredient_keys, names = _ingredient_fields(ingredients_input)
     if not ingredients:
         raise ValueError("Nema sastojaka.")
 
-    ingredient_keys = sorted(set(keys))
     allergens = detect_allergens(ingredient_keys, names)
+    created_at = created_at or datetime.utcnow()
 
-    doc = {
+    return {
         "author_id": user_id,
         "title": title.strip(),
         "description": (description or "").strip(),
@@ -108,222 +175,797 @@ def create_recipe(
         "ingredient_keys": ingredient_keys,
         "steps": steps,
         "allergens": allergens,
-        "created_at": datetime.utcnow(),
+        "allergen_mask": allergen_mask(allergens),
+        "rules_version": RULES_VERSION,
+        "lsh_bands": lsh_bands(ingredient_keys),
+        "lsh_version": LSH_VERSION,
+        "save_count": 0,
+        "comment_count": 0,
+        "trend": trending.event_value("recipe", created_at),
+        "created_at": created_at,
     }
-    rid = recipes.insert_one(doc).inserted_id
-    return rid, ingredient_keys, allergens
 
 
+@timed
+def create_recipe(
+    db,
+    user_id: ObjectId,
+    title: str,
+    description: str,
+    ingredients_input: List[Doc],
+    steps: List[str],) -> Tuple[ObjectId, List[str], List[str]]:
+    doc = build_recipe_doc(user_id, title, description, ingredients_input, steps)
+    # kao import: df se broji tek kad je recept upisan
+    assign_ingredient_ids(db, [doc], count_df=False)
+    doc["_id"] = get_backend(db).insert_recipe(doc)
+    count_ingredient_df(db, [doc])
+    notify_recipes_changed([doc])
+    return doc["_id"], doc["ingredient_keys"], doc["allergens"]
+
+
+# ingredient_ids (sortirani) iz vokabulara; novi kljucevi dobiju sljedeci id.
+# count_df=False samo dodijeli id-eve (import broji df tek za upisane recepte).
+def assign_ingredient_ids(db, docs: List[Doc], count_df: bool = True) -> None:
+    counts: Counter = Counter()
+    for d in docs:
+        for k in d.get("ingredient_keys") or []:
+            counts.setdefault(k, 0)
+            if count_df:
+                counts[k] += 1
+    ids = get_backend(db).register_ingredients(counts)
+    for d in docs:
+        d["ingredient_ids"] = sorted(ids[k] for k in d.get("ingredient_keys") or [])
+
+
+def count_ingredient_df(db, docs: List[Doc]) -> None:
+    counts = Counter(k for d in docs for k in d.get("ingredient_keys") or [])
+    if counts:
+        get_backend(db).register_ingredients(counts)
+
+
+# svi putevi koji upisuju ili mijenjaju recepte (create_recipe, bulk import,
+# re-tagiranje) javljaju ih ovdje da in-process indeksi i cache ostanu azurni
+def notify_recipes_changed(docs: List[Doc]) -> None:
+    if not docs:
+        return
+    if _pantry_index is not None:
+        _pantry_add(_pantry_index, docs)
+    if _text_index is not None:
+        # re-tagiranje ne mijenja tekst pa ne salje naslov
+        _text_add(_text_index, [d for d in docs if "title" in d])
+    if _suggest_index is not None:
+        for d in docs:
+            _suggest_index.add(d.get("ingredient_keys") or [], count="title" in d)
+    # novi recepti iz ovog procesa su vec u indeksima, ne treba ih dohvatiti
+    _advance_index_marks([d["_id"] for d in docs if "title" in d])
+    _result_cache.bump_all()
+
+
+@timed
 def list_my_recipes(db, user_id: ObjectId, limit: int = 50) -> List[Doc]:
-    cur = db["recipes"].find({"author_id": user_id}).sort("created_at", -1).limit(int(limit))
-    return list(cur)
+    return get_backend(db).recipes_by_author(user_id, limit)
 
 
-### PIPELINE ###
-def _recipe_enrich_pipeline(
-    base_match: Optional[Dict[str, Any]] = None,
-    limit: int = 50,
-    extra_stages: Optional[List[Dict[str, Any]]] = None,
-    include_match_fields: bool = False,
-):
-    pipeline: List[Dict[str, Any]] = []
-    if base_match:
-        pipeline.append({"$match": base_match})
-
-    if extra_stages:
-        pipeline.extend(extra_stages)
-
-    project = {
-        "_id": 1,
-        "title": 1,
-        "ingredient_keys": 1,
-        "allergens": 1,
-        "created_at": 1,
-        "author_username": "$author.username",
-        "author_display_name": "$author.display_name",
-        "save_count": 1,
-        "comment_count": 1,
-    }
-    if include_match_fields:
-        project["match_count"] = 1
-        project["match_keys"] = 1
+### Paginacija ###
 
-    pipeline += [
-        {"$lookup": {"from": "saves", "localField": "_id", "foreignField": "recipe_id", "as": "saves"}},
-        {"$addFields": {"save_count": {"$size": "$saves"}}},
+# SORTS i keyset uvjeti su u backends.py; ovdje je samo cursor za UI
 
-        {"$lookup": {"from": "comments", "localField": "_id", "foreignField": "recipe_id", "as": "comments"}},
-        {"$addFields": {"comment_count": {"$size": "$comments"}}},
+def encode_cursor(sort_name: str, doc: Doc) -> str:
+    values = [doc.get(field) for field, _ in SORTS[sort_name]]
+    raw = json_util.dumps([sort_name] + values)
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
 
-        {"$lookup": {"from": "users", "localField": "author_id", "foreignField": "_id", "as": "author"}},
-        {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
 
-        {"$project": project},
-        {"$sort": {"created_at": -1}},
-        {"$limit": int(limit)},
-    ]
-    return pipeline
+def decode_cursor(sort_name: str, cursor: str) -> List[Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8")
+        values = json_util.loads(raw)
+    except Exception:
+        raise ValueError("Neispravan cursor.")
+    if not isinstance(values, list) or len(values) != len(SORTS[sort_name]) + 1 or values[0] != sort_name:
+        raise ValueError("Cursor ne pripada ovoj pretrazi.")
+    return values[1:]
+
+
+def next_cursor(docs: List[Doc], limit: int, sort_name: str = "newest") -> Optional[str]:
+    if len(docs) < int(limit) or not docs:
+        return None
+    return encode_cursor(sort_name, docs[-1])
+
+
+### Autori ###
+
+# s ukljucenim imenikom pipelinei ne rade $lookup u users, nego vrate samo
+# id autora, a username/display_name se popune iz cache-a nakon upita
+USE_USER_DIRECTORY = os.getenv("USE_USER_DIRECTORY", "1") == "1"
+
+_user_directory = UserDirectory(
+    max_entries=int(os.getenv("USER_DIRECTORY_SIZE", "10000")),
+    ttl_seconds=float(os.getenv("USER_DIRECTORY_TTL", "300")),
+)
+
+
+def _fill_authors(db, docs: List[Doc], display_name: bool = False) -> List[Doc]:
+    users = _user_directory.get_many(get_backend(db), [d.get("_author_id") for d in docs])
+    for d in docs:
+        u = users.get(d.pop("_author_id", None))
+        if not u:
+            continue
+        d["author_username"] = u.get("username")
+        if display_name:
+            d["author_display_name"] = u.get("display_name")
+    return docs
+
+
+def user_directory_stats() -> Dict[str, Any]:
+    return _user_directory.stats()
+
 
+def _cache_gauges():
+    out = []
+    caches = (("results", _result_cache.stats()), ("users", _user_directory.stats()), ("vocabulary", _vocabulary.stats()))
+    for cache_name, stats in caches:
+        for k in ("size", "hits", "misses", "evictions"):
+            out.append((f"services_cache_{k}", {"cache": cache_name}, stats[k]))
+    return out
 
-def list_all_recipes_enriched(db, username: str = "", limit: int = 50) -> List[Doc]:
-    base_match = None
+
+REGISTRY.register_collector(_cache_gauges)
+
+
+### Pretrage ###
+
+# Kljucevi iz upita se prevode u id-eve preko cache-a vokabulara. Nepoznat
+# kljuc u $all (ili samo nepoznati u any-of) znaci prazan rezultat bez upita,
+# a $all ide od najrjedeg kljuca jer Mongo indeksom suzi po prvom elementu.
+_vocabulary = VocabularyCache(
+    max_entries=int(os.getenv("VOCABULARY_CACHE_SIZE", "200000")),
+    ttl_seconds=float(os.getenv("VOCABULARY_TTL", "300")),
+)
+
+
+def _plan_terms(
+    backend: StorageBackend,
+    all_keys: List[str],
+    any_keys: List[str],
+    exclude_keys: List[str],
+) -> Optional[Tuple[List[str], List[str], List[str], Optional[Dict[str, int]]]]:
+    if not backend.use_ingredient_ids:
+        return all_keys, any_keys, exclude_keys, None
+    vocab = _vocabulary.get_many(backend, all_keys + any_keys + exclude_keys)
+    if any(k not in vocab for k in all_keys) or (any_keys and not any(k in vocab for k in any_keys)):
+        return None
+    all_keys = sorted(set(all_keys), key=lambda k: (vocab[k][1], k))
+    any_keys = [k for k in any_keys if k in vocab]
+    exclude_keys = [k for k in exclude_keys if k in vocab]
+    return all_keys, any_keys, exclude_keys, {k: v[0] for k, v in vocab.items()}
+
+
+def vocabulary_cache_stats() -> Dict[str, Any]:
+    return _vocabulary.stats()
+
+
+def _card_sort(sort: str) -> str:
+    if sort not in CARD_SORTS:
+        raise ValueError(f"Nepoznat poredak: {sort}")
+    return sort
+
+
+def _list_all_recipes(
+    db,
+    username: str = "",
+    limit: int = 50,
+    after: Optional[str] = None,
+    sort: str = "newest",
+) -> List[Doc]:
+    sort = _card_sort(sort)
+    backend = get_backend(db)
+    author_id = None
     if username.strip():
-        u = db["users"].find_one({"username": username.strip()})
+        u = backend.find_user(username.strip())
         if not u:
             return []
-        base_match = {"author_id": u["_id"]}
+        author_id = u["_id"]
+
+    docs = backend.recipe_cards(
+        author_id=author_id,
+        after=decode_cursor(sort, after) if after else None,
+        limit=limit,
+        sort=sort,
+    )
+    return _fill_authors(db, docs, display_name=True)
+
+
+def _search_by_ingredients(
+    db,
+    inc_csv: str = "",
+    any_csv: str = "",
+    exc_csv: str = "",
+    exa_csv: str = "",
+    limit: int = 50,
+    after: Optional[str] = None,
+    sort: str = "newest",
+) -> List[Doc]:
+    sort = _card_sort(sort)
+    backend = get_backend(db)
+    plan = _plan_terms(backend, split_norm_csv(inc_csv), split_norm_csv(any_csv), split_norm_csv(exc_csv))
+    if plan is None:
+        return []
+    all_keys, any_keys, exclude_keys, key_ids = plan
+
+    docs = backend.recipe_cards(
+        all_keys=all_keys,
+        any_keys=any_keys,
+        exclude_keys=exclude_keys,
+        exclude_allergens=split_norm_csv(exa_csv),
+        after=decode_cursor(sort, after) if after else None,
+        limit=limit,
+        sort=sort,
+        key_ids=key_ids,
+    )
+    return _fill_authors(db, docs, display_name=True)
+
+
+def _pantry_ranked_search(
+    db,
+    pantry_csv: str,
+    min_match: int = 1,
+    exa_csv: str = "",
+    limit: int = 50,
+    after: Optional[str] = None,
+) -> List[Doc]:
+    pantry_keys = sorted(set(split_norm_csv(pantry_csv)))
+    backend = get_backend(db)
+    key_ids = None
+    if backend.use_ingredient_ids:
+        # nepoznati kljucevi ne mogu se poklopiti ni s jednim receptom
+        key_ids = {k: v[0] for k, v in _vocabulary.get_many(backend, pantry_keys).items()}
+        if not key_ids and int(min_match) >= 1:
+            return []
 
-    pipeline = _recipe_enrich_pipeline(base_match=base_match, limit=limit)
-    return list(db["recipes"].aggregate(pipeline))
+    if _pantry_index is not None and int(min_match) >= 1 and _pantry_index_fresh(db):
+        return _pantry_search_indexed(db, pantry_keys, min_match, exa_csv, limit, after, key_ids)
 
+    docs = backend.pantry_cards(
+        pantry_keys,
+        min_match=min_match,
+        exclude_allergens=split_norm_csv(exa_csv),
+        after=decode_cursor("pantry", after) if after else None,
+        limit=limit,
+        key_ids=key_ids,
+    )
+    return _fill_authors(db, docs, display_name=True)
 
+
+### Cache rezultata ###
+
+# kljuc je normalizirani upit (sortirani split_norm_csv), pa "Luk, riza" i
+# "riza,luk" dijele unos; upisi u services ponistavaju unose preko generacija
+_result_cache = ResultCache(
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "256")),
+    ttl_seconds=float(os.getenv("RESULT_CACHE_TTL", "60")),
+)
+
+
+def _norm_terms(csv_text: str) -> Tuple[str, ...]:
+    return tuple(sorted(set(split_norm_csv(csv_text))))
+
+
+def _cached(db, key: Tuple[Any, ...], compute) -> List[Doc]:
+    key = (get_backend(db).name,) + key
+    hit = _result_cache.get(key)
+    if hit is not None:
+        return hit
+    token = _result_cache.token()
+    docs = compute()
+    _result_cache.put(key, docs, [d["_id"] for d in docs], token)
+    return list(docs)
+
+
+def result_cache_stats() -> Dict[str, Any]:
+    return _result_cache.stats()
+
+
+def clear_result_cache() -> None:
+    _result_cache.clear()
+
+
+@timed
+def list_all_recipes_enriched(
+    db,
+    username: str = "",
+    limit: int = 50,
+    after: Optional[str] = None,
+    sort: str = "newest",
+) -> List[Doc]:
+    if sort == "trending":
+        # svako spremanje/komentar mijenja poredak, a bump(rid) ne vidi recept
+        # koji tek treba uci u stranicu; upit ide po (trend, _id) indeksu
+        return _list_all_recipes(db, username, limit, after, sort)
+    key = ("all", username.strip(), int(limit), after, sort)
+    return _cached(db, key, lambda: _list_all_recipes(db, username, limit, after, sort))
+
+
+@timed
 def search_by_ingredients_enriched(
     db,
     inc_csv: str = "",
     any_csv: str = "",
     exc_csv: str = "",
     exa_csv: str = "",
-    limit: int = 50
+    limit: int = 50,
+    after: Optional[str] = None,
+    sort: str = "newest",
 ) -> List[Doc]:
-    filters: List[Dict[str, Any]] = []
-    inc = split_norm_csv(inc_csv)
-    anyk = split_norm_csv(any_csv)
-    exc = split_norm_csv(exc_csv)
-    exa = split_norm_csv(exa_csv)
-
-    if inc:
-        filters.append({"ingredient_keys": {"$all": inc}})
-    if anyk:
-        filters.append({"ingredient_keys": {"$in": anyk}})
-    if exc:
-        filters.append({"ingredient_keys": {"$nin": exc}})
-    if exa:
-        filters.append({"allergens": {"$nin": exa}})
-
-    if not filters:
-        q = {}
-    elif len(filters) == 1:
-        q = filters[0]
-    else:
-        q = {"$and": filters}
-
-    pipeline = _recipe_enrich_pipeline(base_match=q if q else None, limit=limit)
-    return list(db["recipes"].aggregate(pipeline))
+    if sort == "trending":
+        return _search_by_ingredients(db, inc_csv, any_csv, exc_csv, exa_csv, limit, after, sort)
+    key = (
+        "search",
+        _norm_terms(inc_csv), _norm_terms(any_csv), _norm_terms(exc_csv), _norm_terms(exa_csv),
+        int(limit), after, sort,
+    )
+    return _cached(db, key, lambda: _search_by_ingredients(db, inc_csv, any_csv, exc_csv, exa_csv, limit, after, sort))
 
 
+@timed
 def pantry_ranked_search_enriched(
     db,
     pantry_csv: str,
     min_match: int = 1,
     exa_csv: str = "",
-    limit: int = 50
+    limit: int = 50,
+    after: Optional[str] = None,
 ) -> List[Doc]:
-    pantry_keys = sorted(set(split_norm_csv(pantry_csv)))
+    key = ("pantry", _norm_terms(pantry_csv), int(min_match), _norm_terms(exa_csv), int(limit), after)
+    return _cached(db, key, lambda: _pantry_ranked_search(db, pantry_csv, min_match, exa_csv, limit, after))
 
-    extra: List[Dict[str, Any]] = []
 
-    exa = split_norm_csv(exa_csv)
-    if exa:
-        extra.append({"$match": {"allergens": {"$nin": exa}}})
+### Svjezina in-process indeksa ###
 
-    extra += [
-        {"$addFields": {"match_keys": {"$setIntersection": ["$ingredient_keys", pantry_keys]}}},
-        {"$addFields": {"match_count": {"$size": "$match_keys"}}},
-        {"$match": {"match_count": {"$gte": int(min_match)}}},
-        {"$sort": {"match_count": -1, "created_at": -1}},
-    ]
+# Pantry, tekst i prijedlozi drze se u memoriji procesa i prate samo upise
+# koji prolaze kroz notify_recipes_changed u istom procesu. Recepte koje
+# upisu importer, maintenance ili druga replika hvata _sync_index: najvise
+# svakih INDEX_SYNC_SECONDS usporedi procijenjeni broj recepata, najnoviji
+# _id i brojac re-tagiranja s onim sto je indeks vidio. Recepti s vecim
+# _id-em dodaju se u indeks; razlika koju oni ne pokrivaju dvije provjere
+# zaredom (brisanje, _id izvan redoslijeda) ili re-tagiranje iz drugog
+# procesa grade indeks ispocetka u pozadinskoj dretvi.
+INDEX_SYNC_SECONDS = float(os.getenv("INDEX_SYNC_SECONDS", "30"))
+# {_id: "recipes_retag", n: broj batcheva retag_recipes s izmjenama}
+RETAG_COUNTER = "recipes_retag"
+
+_index_marks: Dict[str, Doc] = {}
+_index_rebuilding: Set[str] = set()
+_index_sync_lock = threading.Lock()
+
+
+def _recipes_mark(db) -> Doc:
+    recipes = db["recipes"]
+    retags = db[COUNTERS_COLLECTION].find_one({"_id": RETAG_COUNTER}) or {}
+    return {
+        "count": recipes.estimated_document_count(),
+        "newest": _newest_id(recipes),
+        "retags": retags.get("n", 0),
+        "checked_at": time.monotonic(),
+        "behind": False,
+    }
 
-    pipeline = _recipe_enrich_pipeline(
-        base_match=None,
+
+# oznaka se uzima prije gradnje: recepti upisani za vrijeme gradnje dohvate
+# se jos jednom pri sljedecoj provjeri (add je za isti _id idempotentan)
+def _build_index(db, kind: str, build):
+    mark = None if isinstance(db, StorageBackend) else _recipes_mark(db)
+    index = build(get_backend(db))
+    with _index_sync_lock:
+        if mark is None:
+            _index_marks.pop(kind, None)
+        else:
+            _index_marks[kind] = mark
+    return index
+
+
+def _advance_index_marks(new_ids: List[ObjectId]) -> None:
+    if not new_ids or not _index_marks:
+        return
+    with _index_sync_lock:
+        for mark in _index_marks.values():
+            mark["count"] += len(new_ids)
+            mark["newest"] = max(new_ids + ([mark["newest"]] if mark["newest"] is not None else []))
+
+
+def _bump_retags(db) -> None:
+    c = db[COUNTERS_COLLECTION].find_one_and_update(
+        {"_id": RETAG_COUNTER}, {"$inc": {"n": 1}}, upsert=True, return_document=ReturnDocument.AFTER
+    )
+    # vlastiti retag je vec javljen kroz notify_recipes_changed
+    with _index_sync_lock:
+        for mark in _index_marks.values():
+            if mark["retags"] == c["n"] - 1:
+                mark["retags"] = c["n"]
+
+
+def _rebuild_in_background(db, kind: str, enable) -> None:
+    def run():
+        try:
+            enable(db)
+        finally:
+            _index_rebuilding.discard(kind)
+
+    _index_rebuilding.add(kind)
+    threading.Thread(target=run, name=f"rebuild-{kind}-index", daemon=True).start()
+
+
+# False dok se indeks gradi ispocetka jer zaostaje za kolekcijom
+def _sync_index(db, kind: str, fields: Sequence[str], apply, enable) -> bool:
+    mark = _index_marks.get(kind)
+    if mark is None or time.monotonic() - mark["checked_at"] < INDEX_SYNC_SECONDS:
+        return kind not in _index_rebuilding
+    with _index_sync_lock:
+        if kind in _index_rebuilding:
+            return False
+        if _index_marks.get(kind) is not mark or time.monotonic() - mark["checked_at"] < INDEX_SYNC_SECONDS:
+            return True
+        now = _recipes_mark(db)
+        new: List[Doc] = []
+        if now["newest"] != mark["newest"]:
+            q = {"_id": {"$gt": mark["newest"]}} if mark["newest"] is not None else {}
+            new = list(db["recipes"].find(q, dict.fromkeys(fields, 1)).sort("_id", 1))
+        # recept upisan izmedu brojanja i dohvata dodje u sljedecoj provjeri
+        behind = mark["count"] + len(new) != now["count"]
+        if now["retags"] != mark["retags"] or (behind and mark["behind"]):
+            _rebuild_in_background(db, kind, enable)
+            return False
+        if new:
+            apply(new)
+            _result_cache.bump_all()
+        mark.update(
+            count=mark["count"] + len(new),
+            newest=new[-1]["_id"] if new else mark["newest"],
+            checked_at=now["checked_at"],
+            behind=behind,
+        )
+        return True
+
+
+### In-memory pantry indeks ###
+
+_pantry_index: Optional[PantryIndex] = None
+
+
+def enable_pantry_index(db) -> PantryIndex:
+    global _pantry_index
+    _pantry_index = _build_index(db, "pantry", PantryIndex.build)
+    return _pantry_index
+
+
+def disable_pantry_index() -> None:
+    global _pantry_index
+    _pantry_index = None
+    _index_marks.pop("pantry", None)
+
+
+def _pantry_add(index: PantryIndex, docs: List[Doc]) -> None:
+    for d in docs:
+        index.add(d["_id"], d.get("ingredient_keys") or [], d.get("allergens") or [], d.get("created_at"))
+
+
+# dok se zastarjeli indeks gradi ispocetka pretraga ide kroz Mongo
+def _pantry_index_fresh(db) -> bool:
+    return _sync_index(
+        db,
+        "pantry",
+        ("ingredient_keys", "allergens", "created_at"),
+        lambda docs: _pantry_add(_pantry_index, docs),
+        enable_pantry_index,
+    )
+
+
+def _pantry_search_indexed(
+    db,
+    pantry_keys: List[str],
+    min_match: int,
+    exa_csv: str,
+    limit: int,
+    after: Optional[str],
+    key_ids: Optional[Dict[str, int]] = None,
+) -> List[Doc]:
+    after_key = None
+    if after:
+        match_count, _, rid = decode_cursor("pantry", after)
+        after_key = (match_count, rid)
+
+    top = _pantry_index.search(
+        pantry_keys,
+        min_match=min_match,
+        exclude_allergens=split_norm_csv(exa_csv),
         limit=limit,
-        extra_stages=extra,
-        include_match_fields=True
+        after=after_key,
     )
-    return list(db["recipes"].aggregate(pipeline))
+    if not top:
+        return []
+
+    # Mongo samo dohvaca karticu za vec rangirane id-eve, poredak ostaje iz indeksa
+    order = {rid: i for i, (rid, _) in enumerate(top)}
+    docs = get_backend(db).cards_by_ids(list(order), pantry_keys, key_ids)
+    docs.sort(key=lambda d: order[d["_id"]])
+    return _fill_authors(db, docs, display_name=True)
+
 
+### Pretraga teksta ###
+
+# in-process BM25 indeks (text_index.py) nad naslovom, opisom i koracima;
+# app.py ga gradi pri pokretanju (TEXT_INDEX=0 ostavlja gradnju prvoj
+# pretrazi), novi recepti ulaze kroz notify_recipes_changed i _sync_index
+_text_index: Optional[TextIndex] = None
+# Streamlit sesije su zasebne dretve; gradnja ide samo jednom
+_text_index_lock = threading.Lock()
+
+
+def enable_text_index(db) -> TextIndex:
+    global _text_index
+    _text_index = _build_index(db, "text", TextIndex.build)
+    return _text_index
+
+
+def _text_add(index: TextIndex, docs: List[Doc]) -> None:
+    for d in docs:
+        index.add(d["_id"], d)
+
+
+def text_index_stats() -> Dict[str, Any]:
+    return _text_index.stats() if _text_index is not None else {}
+
+
+def _search_text(db, query: str, limit: int) -> List[Doc]:
+    index = _text_index
+    if index is None or index.name != get_backend(db).name:
+        with _text_index_lock:
+            index = _text_index
+            if index is None or index.name != get_backend(db).name:
+                index = enable_text_index(db)
+    # za vrijeme gradnje ispocetka sluzi se stari indeks
+    _sync_index(db, "text", tuple(FIELD_WEIGHTS), lambda docs: _text_add(_text_index, docs), enable_text_index)
+
+    top = _text_index.search(query, limit=limit)
+    if not top:
+        return []
+
+    order = {rid: i for i, (rid, _) in enumerate(top)}
+    scores = dict(top)
+    docs = get_backend(db).cards_by_ids(list(order))
+    for d in docs:
+        d["score"] = round(scores[d["_id"]], 3)
+    docs.sort(key=lambda d: order[d["_id"]])
+    return _fill_authors(db, docs, display_name=True)
+
+
+@timed
+def search_text(db, query: str, limit: int = 20) -> List[Doc]:
+    tokens = tuple(tokenize(query))
+    if not tokens:
+        return []
+    key = ("text", tokens, int(limit))
+    return _cached(db, key, lambda: _search_text(db, query, limit))
+
+
+### Prijedlozi sastojaka ###
+
+# autocomplete i ispravak tipfelera nad ingredient key-evima iz korpusa
+# (suggest.py); kao i indeks teksta gradi se pri pokretanju ili lijeno i prati
+# notify_recipes_changed i _sync_index. Recept upisan za vrijeme gradnje moze
+# se brojati dvaput; df sluzi samo za poredak prijedloga.
+_suggest_index: Optional[SuggestIndex] = None
+_suggest_index_lock = threading.Lock()
+
+
+def enable_suggest_index(db) -> SuggestIndex:
+    global _suggest_index
+    _suggest_index = _build_index(db, "suggest", SuggestIndex.build)
+    return _suggest_index
+
+
+def _suggest_add(index: SuggestIndex, docs: List[Doc]) -> None:
+    for d in docs:
+        index.add(d.get("ingredient_keys") or [])
+
+
+def _suggestions(db) -> SuggestIndex:
+    index = _suggest_index
+    if index is None or index.name != get_backend(db).name:
+        with _suggest_index_lock:
+            index = _suggest_index
+            if index is None or index.name != get_backend(db).name:
+                index = enable_suggest_index(db)
+    _sync_index(db, "suggest", ("ingredient_keys",), lambda docs: _suggest_add(_suggest_index, docs), enable_suggest_index)
+    return _suggest_index
+
+
+def suggest_index_stats() -> Dict[str, Any]:
+    return _suggest_index.stats() if _suggest_index is not None else {}
+
+
+@timed
+def suggest_ingredients(db, prefix: str, limit: int = 10) -> List[Doc]:
+    return _suggestions(db).suggest(prefix, limit)
+
+
+@timed
+def correct_csv(db, csv_text: str) -> Tuple[str, List[Tuple[str, str]]]:
+    # vraca ispravljeni csv (normalizirani kljucevi) i parove (upisano, ispravljeno);
+    # nepoznati pojmovi bez dovoljno bliskog kljuca ostaju kakvi jesu
+    index = _suggestions(db)
+    terms: List[str] = []
+    fixes: List[Tuple[str, str]] = []
+    for raw in (csv_text or "").split(","):
+        keys = split_norm_csv(raw)
+        if not keys:
+            continue
+        key = keys[0]
+        fixed = index.correct(raw) or key
+        if fixed != key:
+            fixes.append((raw.strip(), fixed))
+        terms.append(fixed)
+    return ",".join(terms), fixes
+
+
+### Slicni recepti ###
+
+# "Vise ovakvih": kandidati iz LSH traka na receptima (similarity.py, indeks
+# na lsh_bands), pa tocan Jaccard nad ingredient_keys samo za njih
+def _similar(db, keys: List[str], exclude: Optional[ObjectId], limit: int) -> List[Doc]:
+    bands = lsh_bands(keys)
+    if not bands:
+        return []
+    backend = get_backend(db)
+    top = rank_by_jaccard(keys, backend.lsh_candidates(bands, MAX_CANDIDATES), limit, exclude)
+    if not top:
+        return []
+
+    order = {rid: i for i, (rid, _) in enumerate(top)}
+    scores = dict(top)
+    docs = backend.cards_by_ids(list(order))
+    for d in docs:
+        d["similarity"] = round(scores[d["_id"]], 3)
+    docs.sort(key=lambda d: order[d["_id"]])
+    return _fill_authors(db, docs, display_name=True)
+
+
+@timed
+def similar_recipes(db, recipe_id: OID, limit: int = 10) -> List[Doc]:
+    rid = to_objectid(recipe_id)
+
+    def compute() -> List[Doc]:
+        r = get_backend(db).get_recipe(rid, ("ingredient_keys",))
+        if not r:
+            return []
+        return _similar(db, r.get("ingredient_keys") or [], rid, limit)
+
+    return _cached(db, ("similar", rid, int(limit)), compute)
+
+
+@timed
+def similar_to_ingredients(db, csv_text: str, limit: int = 10) -> List[Doc]:
+    keys = [k for k in _norm_terms(csv_text) if k]
+    if not keys:
+        return []
+    return _cached(db, ("similar_keys", tuple(keys), int(limit)), lambda: _similar(db, keys, None, limit))
 
 
 # Saves ###
 
+@timed
 def get_saved_recipe_ids(db, user_id: ObjectId) -> Set[ObjectId]:
-    cur = db["saves"].find({"user_id": user_id}, {"recipe_id": 1})
-    return {d["recipe_id"] for d in cur}
+    return get_backend(db).saved_recipe_ids(user_id)
+
 
+@timed
+def saved_ids_among(db, user_id: ObjectId, recipe_ids: List[OID]) -> Set[ObjectId]:
+    # samo za prikazane recepte; za cijelu povijest vidi get_saved_recipe_ids
+    rids = [to_objectid(r) for r in recipe_ids]
+    if not rids:
+        return set()
+    return get_backend(db).saved_among(user_id, rids)
 
+
+@timed
 def save_recipe(db, user_id: ObjectId, recipe_id: OID) -> Tuple[bool, str]:
     try:
         rid = to_objectid(recipe_id)
     except Exception:
         return False, "Neispravan recipe id."
 
-    recipes = db["recipes"]
-    saves = db["saves"]
-
-    r = recipes.find_one({"_id": rid}, {"title": 1})
+    backend = get_backend(db)
+    r = backend.get_recipe(rid, ("title",))
     if not r:
         return False, "Ne postoji recept s tim id-om."
 
     doc = {"user_id": user_id, "recipe_id": rid, "created_at": datetime.utcnow()}
     try:
-        saves.insert_one(doc)
-        return True, f"Spremljeno: {r.get('title')}"
+        backend.insert_save(doc)
     except DuplicateKeyError:
         return False, "Već si spremio/la ovaj recept."
+    # zasebni upisi bez transakcije; razilazenje ispravlja reconcile-counters
+    backend.inc_recipe_counter(rid, "save_count", 1)
+    backend.add_trend(rid, trending.event_value("save", doc["created_at"]))
+    backend.apply_co_saves(user_id, rid, 1, doc["created_at"])
+    _result_cache.bump(rid)
+    return True, f"Spremljeno: {r.get('title')}"
 
 
+@timed
 def unsave_recipe(db, user_id: ObjectId, recipe_id: OID) -> Tuple[bool, str]:
     try:
         rid = to_objectid(recipe_id)
     except Exception:
         return False, "Neispravan recipe id."
 
-    res = db["saves"].delete_one({"user_id": user_id, "recipe_id": rid})
-    if res.deleted_count:
+    backend = get_backend(db)
+    deleted = backend.delete_save(user_id, rid)
+    if deleted:
+        backend.inc_recipe_counter(rid, "save_count", -1)
+        # oduzima se tocno clan koji je spremanje dodalo
+        backend.add_trend(rid, trending.event_value("save", deleted["created_at"]), remove=True)
+        backend.apply_co_saves(user_id, rid, -1, deleted["created_at"])
+        _result_cache.bump(rid)
         return True, "Uklonjeno iz spremljenih."
     return False, "Taj recept nije bio spremljen."
 
 
 
+@timed
 def list_saved_recipes(db, user_id: ObjectId, limit: int = 50) -> List[Doc]:
-    pipeline = [
-        {"$match": {"user_id": user_id}},
-        {"$sort": {"created_at": -1}},
-        {"$lookup": {"from": "recipes", "localField": "recipe_id", "foreignField": "_id", "as": "recipe"}},
-        {"$unwind": {"path": "$recipe", "preserveNullAndEmptyArrays": False}},
-        {"$lookup": {"from": "users", "localField": "recipe.author_id", "foreignField": "_id", "as": "author"}},
-        {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
-        {"$project": {
-            "_id": 0,
-            "saved_at": "$created_at",
-            "recipe_id": "$recipe._id",
-            "title": "$recipe.title",
-            "author_username": "$author.username",
-            "allergens": "$recipe.allergens",
-            "ingredient_keys": "$recipe.ingredient_keys"
-        }},
-        {"$limit": int(limit)}
-    ]
-    return list(db["saves"].aggregate(pipeline))
+    return _fill_authors(db, get_backend(db).saved_recipes(user_id, limit))
 
 
+@timed
 def save_count(db, recipe_id: OID) -> Tuple[Optional[str], Optional[int], Optional[str]]:
     rid = to_objectid(recipe_id)
-    r = db["recipes"].find_one({"_id": rid}, {"title": 1})
+    r = get_backend(db).get_recipe(rid, ("title", "save_count"))
     if not r:
         return None, None, "Ne postoji recept s tim id-om."
-    n = db["saves"].count_documents({"recipe_id": rid})
-    return r.get("title"), n, None
+    return r.get("title"), int(r.get("save_count", 0)), None
+
+
+### Preporuke iz spremanja ###
+
+# "Spremili su i": gotove top-N liste po receptu (recommend.py), pa je
+# citanje jedan lookup po _id; save/unsave ih azuriraju inkrementalno, a
+# rebuild_recipe_recs ih periodicki izgradi ispocetka (maintenance.py rebuild-recs)
+@timed
+def recommended_recipes(db, recipe_id: OID, limit: int = 10) -> List[Doc]:
+    rid = to_objectid(recipe_id)
+    backend = get_backend(db)
+    recs = backend.recipe_recs(rid)[:int(limit)]
+    if not recs:
+        return []
+
+    order = {o: i for i, (o, _) in enumerate(recs)}
+    counts = dict(recs)
+    docs = backend.cards_by_ids(list(order))
+    for d in docs:
+        d["co_saves"] = counts[d["_id"]]
+    docs.sort(key=lambda d: order[d["_id"]])
+    return _fill_authors(db, docs, display_name=True)
+
+
+def rebuild_recipe_recs(
+    db,
+    workers: Optional[int] = None,
+    chunk_users: int = 2000,
+    chunk_recipes: int = 50000,
+    progress=None,
+) -> Doc:
+    return get_backend(db).rebuild_recs(workers, chunk_users, chunk_recipes, progress)
 
 
 
 ### Comments ###
 
+@timed
 def add_comment(db, user_id: ObjectId, recipe_id: OID, text: str) -> Tuple[bool, str]:
     rid = to_objectid(recipe_id)
-    recipes = db["recipes"]
-    comments = db["comments"]
-
-    r = recipes.find_one({"_id": rid}, {"title": 1})
+    backend = get_backend(db)
+    r = backend.get_recipe(rid, ("title",))
     if not r:
         return False, "Ne postoji recept s tim id-om."
 
@@ -331,29 +973,609 @@ def add_comment(db, user_id: ObjectId, recipe_id: OID, text: str) -> Tuple[bool,
     if not text:
         return False, "Komentar ne smije biti prazan."
 
-    comments.insert_one({
+    now = datetime.utcnow()
+    backend.insert_comment({
         "recipe_id": rid,
         "user_id": user_id,
         "text": text,
-        "created_at": datetime.utcnow(),
+        "created_at": now,
     })
+    backend.inc_recipe_counter(rid, "comment_count", 1)
+    backend.add_trend(rid, trending.event_value("comment", now))
+    _result_cache.bump(rid)
     return True, f"Komentar dodan na: {r.get('title')}"
 
 
+@timed
 def list_comments_for_recipe(db, recipe_id: OID, limit: int = 100) -> Tuple[Optional[str], List[Doc], Optional[str]]:
     rid = to_objectid(recipe_id)
-    recipes = db["recipes"]
-    r = recipes.find_one({"_id": rid}, {"title": 1})
+    backend = get_backend(db)
+    r = backend.get_recipe(rid, ("title",))
     if not r:
         return None, [], "Ne postoji recept s tim id-om."
 
+    results = _fill_authors(db, backend.comments_for_recipe(rid, limit))
+    return r.get("title"), results, None
+
+
+@timed
+def list_comments_for_recipes(db, recipe_ids: List[OID], per_recipe: int = 100) -> Dict[ObjectId, List[Doc]]:
+    rids = [to_objectid(r) for r in recipe_ids]
+    if not rids:
+        return {}
+
+    out = get_backend(db).comments_for_recipes(rids, per_recipe)
+    _fill_authors(db, [c for comments in out.values() for c in comments])
+    return out
+
+
+
+### Brojaci ###
+
+def _count_by_recipe(coll, recipe_ids: List[ObjectId]) -> Dict[ObjectId, int]:
     pipeline = [
-        {"$match": {"recipe_id": rid}},
-        {"$sort": {"created_at": -1}},
-        {"$lookup": {"from": "users", "localField": "user_id", "foreignField": "_id", "as": "author"}},
-        {"$unwind": {"path": "$author", "preserveNullAndEmptyArrays": True}},
-        {"$project": {"text": 1, "created_at": 1, "author_username": "$author.username"}},
-        {"$limit": int(limit)},
+        {"$match": {"recipe_id": {"$in": recipe_ids}}},
+        {"$group": {"_id": "$recipe_id", "n": {"$sum": 1}}},
     ]
-    results = list(db["comments"].aggregate(pipeline))
-    return r.get("title"), results, None
+    return {d["_id"]: d["n"] for d in coll.aggregate(pipeline)}
+
+
+# save_count/comment_count na receptu se mijenjaju s $inc uz insert/delete u
+# saves/comments, bez transakcije (samostalni mongod je nema); ako se ta dva
+# koraka razidu (pad procesa, rucni import), ovo ih ponovno izracuna iz samih
+# kolekcija. Zato mora redovito raditi uz app:
+#   python maintenance.py reconcile-counters --every 3600 Odrzavanje (brojaci,
+# re-tagiranje) radi izravno nad Mongo bazom, ne preko backenda.
+def reconcile_recipe_counters(
+    db,
+    batch_size: int = 500,
+    start_after: Optional[ObjectId] = None,
+) -> Tuple[int, int]:
+    # ide po _id redoslijedu pa se moze prekinuti i nastaviti sa start_after
+    recipes = db["recipes"]
+    scanned = 0
+    fixed = 0
+    last_id = start_after
+
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        batch = list(
+            recipes.find(q, {"save_count": 1, "comment_count": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        ids = [d["_id"] for d in batch]
+        saves = _count_by_recipe(db["saves"], ids)
+        comments = _count_by_recipe(db["comments"], ids)
+
+        ops = []
+        fixed_ids = []
+        for d in batch:
+            sc = saves.get(d["_id"], 0)
+            cc = comments.get(d["_id"], 0)
+            if d.get("save_count") != sc or d.get("comment_count") != cc:
+                ops.append(UpdateOne({"_id": d["_id"]}, {"$set": {"save_count": sc, "comment_count": cc}}))
+                fixed_ids.append(d["_id"])
+        if ops:
+            recipes.bulk_write(ops, ordered=False)
+            get_backend(db).refresh_feed(fixed_ids)
+            _result_cache.bump_all()
+
+        scanned += len(batch)
+        fixed += len(ops)
+        last_id = ids[-1]
+
+    return scanned, fixed
+
+
+### Re-tagiranje ###
+
+def count_outdated_recipes(db) -> int:
+    return db["recipes"].count_documents({"rules_version": {"$ne": RULES_VERSION}})
+
+
+# Ponovno izracuna ingredient key-eve i alergene za recepte tagirane starijom
+# verzijom pravila. Ide po _id redoslijedu u batchevima s pauzom izmedu njih,
+# a upis je uvjetovan starom verzijom pa je siguran uz zive upise i ponovno
+# pokretanje (npr. sa start_after iz prethodnog pokretanja).
+def retag_recipes(
+    db,
+    batch_size: int = 500,
+    pause_seconds: float = 0.0,
+    start_after: Optional[ObjectId] = None,
+    progress=None,
+) -> Tuple[int, int, Optional[ObjectId]]:
+    recipes = db["recipes"]
+    scanned = 0
+    updated = 0
+    last_id = start_after
+    conflicts = False
+
+    while True:
+        q: Dict[str, Any] = {"rules_version": {"$ne": RULES_VERSION}}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = list(
+            recipes.find(q, {"ingredients": 1, "rules_version": 1, "ingredient_keys": 1, "ingredient_ids": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        fields = [_ingredient_fields(d.get("ingredients") or []) for d in batch]
+        allergens = detect_allergens_many((keys, names) for _, keys, names in fields)
+
+        # df se pomice za razliku starih i novih kljuceva (recept bez
+        # ingredient_ids jos nije bio brojan); prije upisa se samo dodijele
+        # id-evi, a razlika primijeni tek kad su svi uvjetovani upisi prosli
+        df: Counter = Counter()
+        for d, (_, keys, _) in zip(batch, fields):
+            df.update(keys)
+            if "ingredient_ids" in d:
+                df.subtract(d.get("ingredient_keys") or [])
+        key_ids = get_backend(db).register_ingredients(dict.fromkeys(df, 0))
+
+        ops = []
+        changed: List[Doc] = []
+        for d, (ingredients, keys, _), alg in zip(batch, fields, allergens):
+            new = {
+                "ingredients": ingredients,
+                "ingredient_keys": keys,
+                "allergens": alg,
+                "allergen_mask": allergen_mask(alg),
+                "ingredient_ids": sorted(key_ids[k] for k in keys),
+                "rules_version": RULES_VERSION,
+                "lsh_bands": lsh_bands(keys),
+                "lsh_version": LSH_VERSION,
+            }
+            ops.append(UpdateOne({"_id": d["_id"], "rules_version": d.get("rules_version")}, {"$set": new}))
+            changed.append(dict(new, _id=d["_id"]))
+
+        res = recipes.bulk_write(ops, ordered=False)
+        if res.matched_count == len(ops):
+            get_backend(db).register_ingredients(dict(df))
+        else:
+            # dio recepata je u meduvremenu izmijenjen (ili ga je re-tagirao
+            # drugi proces); ne zna se koji, pa se df na kraju prebroji
+            conflicts = True
+        get_backend(db).refresh_feed([d["_id"] for d in changed])
+        notify_recipes_changed(changed)
+        if res.modified_count:
+            # in-process indeksi drugih procesa ovo ne vide kroz broj recepata
+            _bump_retags(db)
+
+        scanned += len(batch)
+        updated += res.modified_count
+        last_id = batch[-1]["_id"]
+        if progress:
+            progress(scanned, updated, last_id)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    if conflicts:
+        recount_ingredient_df(db)
+    return scanned, updated, last_id
+
+
+def count_missing_lsh_bands(db) -> int:
+    return db["recipes"].count_documents({"lsh_version": {"$ne": LSH_VERSION}})
+
+
+# LSH trake za recepte upisane prije similarity.py ili s drugim parametrima;
+# isti obrazac kao retag_recipes (po _id, uvjetovan upis, nastavak sa start_after)
+def backfill_lsh_bands(
+    db,
+    batch_size: int = 1000,
+    pause_seconds: float = 0.0,
+    start_after: Optional[ObjectId] = None,
+    progress=None,
+) -> Tuple[int, int, Optional[ObjectId]]:
+    recipes = db["recipes"]
+    scanned = 0
+    updated = 0
+    last_id = start_after
+
+    while True:
+        q: Dict[str, Any] = {"lsh_version": {"$ne": LSH_VERSION}}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = list(
+            recipes.find(q, {"ingredient_keys": 1, "lsh_version": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        ops = [
+            UpdateOne(
+                {"_id": d["_id"], "lsh_version": d.get("lsh_version")},
+                {"$set": {"lsh_bands": lsh_bands(d.get("ingredient_keys") or []), "lsh_version": LSH_VERSION}},
+            )
+            for d in batch
+        ]
+        res = recipes.bulk_write(ops, ordered=False)
+        _result_cache.bump_all()
+
+        scanned += len(batch)
+        updated += res.modified_count
+        last_id = batch[-1]["_id"]
+        if progress:
+            progress(scanned, updated, last_id)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    return scanned, updated, last_id
+
+
+def count_missing_ingredient_ids(db) -> int:
+    return db["recipes"].count_documents({"ingredient_ids": {"$exists": False}})
+
+
+def detect_ingredient_ids(db) -> bool:
+    # _plan_terms bi za nepoznat kljuc (prazan vokabular) ili recept bez
+    # ingredient_ids vratio krive rezultate, pa se do backfilla (i ponovnog
+    # pokretanja) filtrira po ingredient_keys; vraca koriste li se id-evi
+    global USE_INGREDIENT_IDS
+    if not USE_INGREDIENT_IDS or isinstance(db, StorageBackend):
+        return USE_INGREDIENT_IDS
+    if not db["recipes"].estimated_document_count():
+        return USE_INGREDIENT_IDS
+    if not db[INGREDIENTS_COLLECTION].estimated_document_count() or not _migrated(db, "ingredient_ids"):
+        USE_INGREDIENT_IDS = False
+    return USE_INGREDIENT_IDS
+
+
+# ingredient_ids i vokabular (id-evi, df) za recepte upisane prije njih; isti
+# obrazac kao backfill_lsh_bands. Uvjetovan upis ne pregazi id-eve koje je u
+# meduvremenu postavio retag.
+def backfill_ingredient_ids(
+    db,
+    batch_size: int = 1000,
+    pause_seconds: float = 0.0,
+    start_after: Optional[ObjectId] = None,
+    progress=None,
+) -> Tuple[int, int, Optional[ObjectId]]:
+    recipes = db["recipes"]
+    scanned = 0
+    updated = 0
+    last_id = start_after
+
+    while True:
+        q: Dict[str, Any] = {"ingredient_ids": {"$exists": False}}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = list(
+            recipes.find(q, {"ingredient_keys": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        assign_ingredient_ids(db, batch)
+        ops = [
+            UpdateOne(
+                {"_id": d["_id"], "ingredient_ids": {"$exists": False}},
+                {"$set": {"ingredient_ids": d["ingredient_ids"]}},
+            )
+            for d in batch
+        ]
+        res = recipes.bulk_write(ops, ordered=False)
+        ids = [d["_id"] for d in batch]
+        get_backend(db).refresh_feed(ids)
+        _result_cache.bump_all()
+
+        scanned += len(batch)
+        updated += res.modified_count
+        last_id = ids[-1]
+        if progress:
+            progress(scanned, updated, last_id)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    # oznaka za detect_ingredient_ids i ensure_indexes (samo kad vise nema
+    # recepata bez ingredient_ids, npr. ne nakon prekinutog pokretanja)
+    _migrated(db, "ingredient_ids")
+    return scanned, updated, last_id
+
+
+# df u vokabularu ponovno iz recepata (npr. nakon rucnih izmjena ili
+# prekinutih re-tagiranja); kljucevi bez recepata ostaju s df 0
+def recount_ingredient_df(db) -> int:
+    counts = {
+        d["_id"]: d["df"]
+        for d in db["recipes"].aggregate(
+            [
+                {"$match": {"ingredient_ids": {"$exists": True}}},
+                {"$unwind": "$ingredient_keys"},
+                {"$group": {"_id": "$ingredient_keys", "df": {"$sum": 1}}},
+            ],
+            allowDiskUse=True,
+        )
+    }
+    vocab = db[INGREDIENTS_COLLECTION]
+    ops = [
+        UpdateOne({"_id": d["_id"]}, {"$set": {"df": counts.get(d["_id"], 0)}})
+        for d in vocab.find({}, {"df": 1})
+        if d.get("df") != counts.get(d["_id"], 0)
+    ]
+    if ops:
+        vocab.bulk_write(ops, ordered=False)
+    _vocabulary.clear()
+    return len(ops)
+
+
+def _has_missing(db, field: str) -> bool:
+    # prvi recept bez polja je dovoljan; na migriranoj bazi to je prolaz kroz
+    # cijelu kolekciju, pa ga pokrece samo _migrated dok oznaka ne postoji
+    return db["recipes"].find_one({field: {"$exists": False}}, {"_id": 1}) is not None
+
+
+# {_id: "migrations", <polje>: vrijeme} u counters: svi recepti imaju polje
+# (novi recepti ga uvijek dobiju pri upisu). Oznaku postavlja backfill kad
+# vise nema recepata bez polja, a detect_* pri pokretanju cita samo nju.
+# Baza bez oznake (nova, ili migrirana prije oznaka) provjeri se jednom.
+def _migrated(db, field: str) -> bool:
+    marker = db[COUNTERS_COLLECTION].find_one({"_id": MIGRATIONS_DOC}, {field: 1}) or {}
+    if field in marker:
+        return True
+    if _has_missing(db, field):
+        return False
+    db[COUNTERS_COLLECTION].update_one({"_id": MIGRATIONS_DOC}, {"$set": {field: datetime.utcnow()}}, upsert=True)
+    return True
+
+
+# Nakon backfill-ingredient-ids filtri idu po ingredient_ids, pa multikey
+# indeks nad ingredient_keys samo usporava upise (ensure_indexes ga tada vise
+# ne stvara). Vraca imena obrisanih indeksa; bez oznake migracije ne brise nista.
+def drop_ingredient_key_indexes(db) -> List[str]:
+    if not _migrated(db, "ingredient_ids"):
+        return []
+    dropped = []
+    for name in ("recipes", FEED_COLLECTION):
+        coll = db[name]
+        for index_name, info in coll.index_information().items():
+            if [field for field, _ in info["key"]] == ["ingredient_keys"]:
+                coll.drop_index(index_name)
+                dropped.append(f"{name}.{index_name}")
+    return dropped
+
+
+def count_missing_allergen_mask(db) -> int:
+    return db["recipes"].count_documents({"allergen_mask": {"$exists": False}})
+
+
+def detect_allergen_mask(db) -> bool:
+    # $bitsAllClear bi ispustio recepte bez maske, pa se do backfilla (i ponovnog
+    # pokretanja) filtrira po allergens; vraca koristi li se maska
+    global USE_ALLERGEN_MASK
+    if USE_ALLERGEN_MASK and not isinstance(db, StorageBackend) and not _migrated(db, "allergen_mask"):
+        USE_ALLERGEN_MASK = False
+    return USE_ALLERGEN_MASK
+
+
+# allergen_mask iz vec spremljenih allergens (bez ponovne detekcije) za
+# recepte upisane prije maske; upis je uvjetovan da maska i dalje nedostaje,
+# pa ne pregazi masku koju je u meduvremenu postavio retag
+def backfill_allergen_mask(
+    db,
+    batch_size: int = 1000,
+    pause_seconds: float = 0.0,
+    start_after: Optional[ObjectId] = None,
+    progress=None,
+) -> Tuple[int, int, Optional[ObjectId]]:
+    recipes = db["recipes"]
+    scanned = 0
+    updated = 0
+    last_id = start_after
+
+    while True:
+        q: Dict[str, Any] = {"allergen_mask": {"$exists": False}}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = list(
+            recipes.find(q, {"allergens": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        ops = [
+            UpdateOne(
+                {"_id": d["_id"], "allergen_mask": {"$exists": False}},
+                {"$set": {"allergen_mask": allergen_mask(d.get("allergens") or [])}},
+            )
+            for d in batch
+        ]
+        res = recipes.bulk_write(ops, ordered=False)
+        ids = [d["_id"] for d in batch]
+        get_backend(db).refresh_feed(ids)
+        _result_cache.bump_all()
+
+        scanned += len(batch)
+        updated += res.modified_count
+        last_id = ids[-1]
+        if progress:
+            progress(scanned, updated, last_id)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    # oznaka za detect_allergen_mask (nastavak sa start_after ne vidi ranije recepte)
+    _migrated(db, "allergen_mask")
+    return scanned, updated, last_id
+
+
+def count_missing_trend(db) -> int:
+    return db["recipes"].count_documents({"trend": None})
+
+
+def _event_times(coll, recipe_ids: List[ObjectId]) -> Dict[ObjectId, List[datetime]]:
+    out: Dict[ObjectId, List[datetime]] = {}
+    for d in coll.find({"recipe_id": {"$in": recipe_ids}}, {"recipe_id": 1, "created_at": 1}):
+        if d.get("created_at") is not None:
+            out.setdefault(d["recipe_id"], []).append(d["created_at"])
+    return out
+
+
+# trend iz cijele povijesti (objava, spremanja, komentari) za recepte bez
+# njega, a s recompute_all za sve (npr. nakon promjene TREND_HALF_LIFE_HOURS).
+# Upis je uvjetovan procitanim trendom; recept koji se u meduvremenu promijenio
+# ostaje kakav je (zivi update ga je vec azurirao) i ne broji se u updated.
+def backfill_trend(
+    db,
+    batch_size: int = 500,
+    pause_seconds: float = 0.0,
+    start_after: Optional[ObjectId] = None,
+    recompute_all: bool = False,
+    progress=None,
+) -> Tuple[int, int, Optional[ObjectId]]:
+    recipes = db["recipes"]
+    scanned = 0
+    updated = 0
+    last_id = start_after
+
+    while True:
+        q: Dict[str, Any] = {} if recompute_all else {"trend": None}
+        if last_id is not None:
+            q["_id"] = {"$gt": last_id}
+        batch = list(
+            recipes.find(q, {"created_at": 1, "trend": 1})
+            .sort("_id", 1)
+            .limit(int(batch_size))
+        )
+        if not batch:
+            break
+
+        ids = [d["_id"] for d in batch]
+        saves = _event_times(db["saves"], ids)
+        comments = _event_times(db["comments"], ids)
+
+        ops = []
+        for d in batch:
+            events = [("recipe", d["created_at"])] if d.get("created_at") else []
+            events += [("save", t) for t in saves.get(d["_id"], [])]
+            events += [("comment", t) for t in comments.get(d["_id"], [])]
+            ops.append(UpdateOne({"_id": d["_id"], "trend": d.get("trend")}, {"$set": {"trend": trending.score(events)}}))
+
+        res = recipes.bulk_write(ops, ordered=False)
+        get_backend(db).refresh_feed(ids)
+        _result_cache.bump_all()
+
+        scanned += len(batch)
+        updated += res.modified_count
+        last_id = ids[-1]
+        if progress:
+            progress(scanned, updated, last_id)
+        if pause_seconds:
+            time.sleep(pause_seconds)
+
+    return scanned, updated, last_id
+
+
+### Materijalizirani feed ###
+
+def rebuild_recipes_feed(db) -> int:
+    # cijeli feed iz recipes jednim pipelineom na serveru; $merge zamjenjuje
+    # postojece kartice po _id, pa se moze pokretati uz zive upise
+    db["recipes"].aggregate(
+        feed_stages() + [{"$merge": {
+            "into": FEED_COLLECTION,
+            "on": "_id",
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }}],
+        allowDiskUse=True,
+    )
+    _result_cache.bump_all()
+    return db[FEED_COLLECTION].estimated_document_count()
+
+
+def _newest_id(collection) -> Optional[ObjectId]:
+    d = collection.find_one({}, {"_id": 1}, sort=[("_id", -1)])
+    return d["_id"] if d else None
+
+
+def ensure_recipes_feed(db) -> bool:
+    # prvo pokretanje s USE_RECIPES_FEED=1 nad postojecom bazom, ili feed koji
+    # je zaostao (recepti upisani dok je USE_RECIPES_FEED bio 0, pad izmedu
+    # dva upisa). Provjera je jeftina: broj dokumenata i najnoviji _id (indeks);
+    # zastarjele kartice istog broja ovdje se ne vide, za njih je check-feed.
+    if not USE_RECIPES_FEED or isinstance(db, StorageBackend):
+        return False
+    recipes, feed = db["recipes"], db[FEED_COLLECTION]
+    n_recipes = recipes.estimated_document_count()
+    if not n_recipes:
+        return False
+    n_feed = feed.estimated_document_count()
+    if not n_feed:
+        rebuild_recipes_feed(db)
+        return True
+    if n_feed == n_recipes and _newest_id(feed) == _newest_id(recipes):
+        return False
+    check_recipes_feed(db, fix=True)
+    return True
+
+
+# Usporeduje feed s karticama izracunatim iz recipes (isti feed_stages) po
+# _id redoslijedu: nedostajuce, zastarjele i kartice bez recepta. S fix=True
+# ih odmah ispravi; kao reconcile se moze nastaviti sa start_after.
+def check_recipes_feed(
+    db,
+    batch_size: int = 500,
+    start_after: Optional[ObjectId] = None,
+    fix: bool = False,
+    progress=None,
+) -> Doc:
+    feed = db[FEED_COLLECTION]
+    stats = {"scanned": 0, "missing": 0, "stale": 0, "orphaned": 0, "fixed": 0, "last_id": start_after}
+    last_id = start_after
+
+    while True:
+        q = {"_id": {"$gt": last_id}} if last_id is not None else {}
+        pipeline = [{"$match": q}, {"$sort": {"_id": 1}}, {"$limit": int(batch_size)}] + feed_stages()
+        expected = list(db["recipes"].aggregate(pipeline))
+
+        ids = [d["_id"] for d in expected]
+        # kartice u istom _id rasponu kojima recept vise ne postoji (zadnji
+        # prolaz bez recepata pokupi sve iza last_id)
+        rng: Doc = {"$nin": ids}
+        if last_id is not None:
+            rng["$gt"] = last_id
+        if ids:
+            rng["$lte"] = ids[-1]
+        orphans = [d["_id"] for d in feed.find({"_id": rng}, {"_id": 1})]
+
+        actual = {d["_id"]: d for d in feed.find({"_id": {"$in": ids}})} if ids else {}
+        bad = []
+        for d in expected:
+            cur = actual.get(d["_id"])
+            if cur is None:
+                stats["missing"] += 1
+                bad.append(d)
+            elif cur != d:
+                stats["stale"] += 1
+                bad.append(d)
+        stats["orphaned"] += len(orphans)
+
+        if fix and (bad or orphans):
+            if bad:
+                feed.bulk_write([ReplaceOne({"_id": d["_id"]}, d, upsert=True) for d in bad], ordered=False)
+            if orphans:
+                feed.delete_many({"_id": {"$in": orphans}})
+            stats["fixed"] += len(bad) + len(orphans)
+            _result_cache.bump_all()
+
+        if not ids:
+            break
+        stats["scanned"] += len(ids)
+        last_id = stats["last_id"] = ids[-1]
+        if progress:
+            progress(stats)
+
+    return stats
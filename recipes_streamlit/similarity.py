@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import random
+import struct
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from bson import ObjectId
+
+
+Doc = Dict[str, Any]
+
+
+### Slicni recepti (MinHash + LSH) ###
+
+# Svaki recept dobije MinHash potpis nad ingredient_keys (NUM_PERM hash
+# funkcija, za svaku minimum po kljucevima). Potpis se reze u BANDS traka po
+# ROWS vrijednosti, a svaka traka se sazme u jedan int64 - to je polje
+# lsh_bands na receptu s multikey indeksom. Dva recepta dijele barem jednu
+# traku s vjerojatnoscu 1 - (1 - J^ROWS)^BANDS, gdje je J Jaccard slicnost
+# skupova sastojaka, pa upit {"lsh_bands": {"$in": trake}} preko indeksa vraca
+# kandidate (ne skenira kolekciju), a oni se zatim rangiraju tocnim Jaccardom.
+# 32 x 3 daje prag oko J = 0.3; s 2 reda po traci cesti sastojci (luk, sol,
+# ulje) dovode previse kandidata, a s 4 se gube recepti sa J oko 0.4.
+# Kandidata se uzima najvise MAX_CANDIDATES, prvo oni s vise zajednickih traka.
+# Hash funkcije su fiksne (blake2b + fiksni seed), pa su trake iste u svim
+# procesima i ne treba ih ponovno racunati dok se sastojci ne promijene.
+
+NUM_PERM = 96
+BANDS = 32
+ROWS = NUM_PERM // BANDS
+MAX_CANDIDATES = 1000
+
+SEED = 20240611
+_PRIME = (1 << 61) - 1
+
+_rng = random.Random(SEED)
+_COEFFS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_BAND_FMT = struct.Struct(f"<B{ROWS}Q")
+
+# recepti s drugom verzijom imaju trake iz drugih parametara (backfill_lsh_bands)
+LSH_VERSION = hashlib.sha1(f"{NUM_PERM}:{BANDS}:{SEED}".encode("utf-8")).hexdigest()[:8]
+
+
+@lru_cache(maxsize=200000)
+def _key_hashes(key: str) -> Tuple[int, ...]:
+    # vokabular je ogranicen, pa se svih NUM_PERM vrijednosti kljuca racuna jednom
+    x = int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+    return tuple((a * x + b) % _PRIME for a, b in _COEFFS)
+
+
+def signature(keys: Iterable[str]) -> List[int]:
+    hashes = [_key_hashes(k) for k in set(keys) if k]
+    if not hashes:
+        return []
+    return list(map(min, zip(*hashes)))
+
+
+def band_keys(sig: Sequence[int]) -> List[int]:
+    if not sig:
+        return []
+    out = []
+    for b in range(BANDS):
+        packed = _BAND_FMT.pack(b, *sig[b * ROWS:(b + 1) * ROWS])
+        out.append(int.from_bytes(hashlib.blake2b(packed, digest_size=8).digest(), "little", signed=True))
+    return out
+
+
+def lsh_bands(keys: Iterable[str]) -> List[int]:
+    return band_keys(signature(keys))
+
+
+def jaccard(a: Iterable[str], b: Iterable[str]) -> float:
+    a, b = set(a), set(b)
+    if not a or not b:
+        return 0.0
+    inter = len(a & b)
+    return inter / (len(a) + len(b) - inter)
+
+
+def rank_by_jaccard(
+    keys: Iterable[str],
+    candidates: Iterable[Doc],
+    limit: int,
+    exclude: Optional[ObjectId] = None,
+    min_similarity: float = 0.0,
+) -> List[Tuple[ObjectId, float]]:
+    # tocan Jaccard nad kandidatima iz LSH-a; kod jednake slicnosti noviji _id prvi
+    keys = set(keys)
+    scored = []
+    for d in candidates:
+        if d["_id"] == exclude:
+            continue
+        s = jaccard(keys, d.get("ingredient_keys") or [])
+        if s > min_similarity:
+            scored.append((s, d["_id"]))
+    return [(rid, s) for s, rid in heapq.nlargest(int(limit), scored)]
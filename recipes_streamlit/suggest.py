@@ -0,0 +1,184 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from logic import canonicalize_key, normalize_key
+
+
+### Autocomplete i ispravak sastojaka ###
+
+# Indeks nad razlicitim ingredient key-evima iz recepata, s brojem recepata
+# po kljucu (df) kao tezinom:
+#   - prefiksi: trie do dubine TRIE_DEPTH gdje svaki cvor drzi top-K kljuceva
+#     po df-u, pa je kratki prefiks jedan dict lookup; dulji prefiksi idu
+#     bisectom po sortiranom vokabularu (raspon je tada malen)
+#   - tipfeleri: ogranicena Damerau-Levenshtein udaljenost (1 za kratke, 2 za
+#     dulje rijeci) racunata setnjom po istom sortiranom vokabularu, uz
+#     odsijecanje podstabala koja sigurno prelaze granicu
+
+TRIE_DEPTH = 4
+TOP_K = 20
+
+
+def max_distance(term: str) -> int:
+    # dopusteni broj tipfelera raste s duljinom rijeci
+    if len(term) <= 2:
+        return 0
+    return 1 if len(term) <= 7 else 2
+
+
+def normalize_term(text: str) -> str:
+    return canonicalize_key(normalize_key(text))
+
+
+class SuggestIndex:
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._vocab: List[str] = []
+        self._trie: Dict[str, List[str]] = {}
+
+    @classmethod
+    def build(cls, backend, batch_size: int = 10000) -> "SuggestIndex":
+        index = cls(name=backend.name)
+        counts: Dict[str, int] = {}
+        for d in backend.iter_recipes(("ingredient_keys",), batch_size):
+            for k in d.get("ingredient_keys") or []:
+                counts[k] = counts.get(k, 0) + 1
+        for k, n in counts.items():
+            index._add_key(k, n)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._counts)
+
+    def _add_key(self, key: str, n: int) -> None:
+        if not key:
+            return
+        if key not in self._counts:
+            self._counts[key] = 0
+            bisect.insort(self._vocab, key)
+        self._counts[key] += n
+
+        rank = (-self._counts[key], key)
+        for depth in range(1, min(len(key), TRIE_DEPTH) + 1):
+            top = self._trie.setdefault(key[:depth], [])
+            if key in top:
+                top.sort(key=lambda k: (-self._counts[k], k))
+            elif len(top) < TOP_K or rank < (-self._counts[top[-1]], top[-1]):
+                top.append(key)
+                top.sort(key=lambda k: (-self._counts[k], k))
+                del top[TOP_K:]
+
+    def add(self, keys: Iterable[str], count: bool = True) -> None:
+        # count=False samo osigurava da kljuc postoji (npr. nakon re-tagiranja)
+        with self._lock:
+            for k in set(keys):
+                self._add_key(k, 1 if count else 0)
+
+    def _top(self, q: str, limit: int, lo: int = 0, hi: Optional[int] = None) -> List[str]:
+        # najcesci kljucevi s prefiksom q; [lo, hi) je vec poznat raspon u vokabularu
+        if len(q) <= TRIE_DEPTH:
+            return self._trie.get(q, [])[:limit]
+        # top-K pretka u trie-u je sortiran po df-u, pa ako sadrzi dovoljno
+        # kljuceva s prefiksom q, to su bas najcesci kljucevi ispod q
+        top = [k for k in self._trie.get(q[:TRIE_DEPTH], []) if k.startswith(q)]
+        if len(top) >= limit:
+            return top[:limit]
+        if hi is None:
+            lo = bisect.bisect_left(self._vocab, q)
+            hi = bisect.bisect_left(self._vocab, q + "\uffff", lo)
+        return heapq.nsmallest(limit, self._vocab[lo:hi], key=lambda k: (-self._counts[k], k))
+
+    def _fuzzy(self, q: str, limit: int, max_dist: int, prefix: bool = False) -> List[Tuple[int, str]]:
+        # Levenshtein (OSA) setnja po sortiranom vokabularu kao implicitnom trie-u:
+        # redak DP tablice za zajednicki prefiks susjednih kljuceva racuna se
+        # jednom, a cim je cijeli redak > max_dist, preskace se (bisect) cijelo
+        # podstablo s tim prefiksom
+        vocab = self._vocab
+        n = len(q)
+        rows = [list(range(n + 1))]
+        # best[d] = najmanja udaljenost q do nekog prefiksa puta duljine <= d
+        best = [n]
+        path = ""
+        scored: List[Tuple[int, int, str]] = []
+        i = 0
+        while i < len(vocab):
+            key = vocab[i]
+            common = 0
+            top = min(len(path), len(key))
+            while common < top and path[common] == key[common]:
+                common += 1
+            del rows[common + 1:]
+            del best[common + 1:]
+
+            pruned = 0
+            for depth in range(common + 1, len(key) + 1):
+                c = key[depth - 1]
+                prev = rows[-1]
+                # racuna se samo pojas |depth - j| <= max_dist, ostalo je sigurno > max_dist
+                cur = [max_dist + 1] * (n + 1)
+                if depth <= max_dist:
+                    cur[0] = depth
+                for j in range(max(1, depth - max_dist), min(n, depth + max_dist) + 1):
+                    v = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (q[j - 1] != c))
+                    if depth > 1 and j > 1 and q[j - 1] == key[depth - 2] and q[j - 2] == c:
+                        v = min(v, rows[-2][j - 2] + 1)
+                    cur[j] = v
+                rows.append(cur)
+                best.append(min(best[-1], cur[-1]))
+                low = min(cur)
+                # dublji retci nikad nisu manji od min(cur)
+                if low > max_dist or (prefix and best[-1] <= low):
+                    pruned = depth
+                    break
+            path = key[:len(rows) - 1]
+
+            if not pruned:
+                d = best[-1] if prefix else rows[-1][-1]
+                if d <= max_dist:
+                    scored.append((d, -self._counts[key], key))
+                i += 1
+                continue
+
+            sub = key[:pruned]
+            hi = bisect.bisect_left(vocab, sub + "\uffff", i)
+            if prefix and best[pruned] <= max_dist:
+                # udaljenost se dublje ne moze smanjiti, pa cijelo podstablo
+                # pogada s istom udaljenoscu; dovoljni su najcesci kljucevi
+                for k in self._top(sub, limit, i, hi):
+                    scored.append((best[pruned], -self._counts[k], k))
+            i = hi
+        return [(d, k) for d, _, k in heapq.nsmallest(limit, scored)]
+
+    def suggest(self, text: str, limit: int = 10) -> List[Dict[str, object]]:
+        q = normalize_term(text)
+        if not q:
+            return []
+        limit = min(int(limit), TOP_K)
+        with self._lock:
+            out = [{"key": k, "count": self._counts[k], "distance": 0} for k in self._top(q, limit)]
+            if not out:
+                # upit nije prefiks nijednog kljuca, dakle vjerojatno tipfeler
+                for d, k in self._fuzzy(q, limit, max_distance(q), prefix=True):
+                    out.append({"key": k, "count": self._counts[k], "distance": d})
+            return out
+
+    def correct(self, text: str) -> Optional[str]:
+        q = normalize_term(text)
+        if not q:
+            return None
+        with self._lock:
+            if q in self._counts:
+                return q
+            best = self._fuzzy(q, 1, max_distance(q))
+            return best[0][1] if best else None
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"keys": len(self._counts), "trie_nodes": len(self._trie)}
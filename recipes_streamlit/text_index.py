@@ -0,0 +1,263 @@
+from __future__ import annotations
+
+import bisect
+import heapq
+import math
+import re
+import threading
+from array import array
+from collections import Counter
+from typing import Any, Dict, List, Set, Tuple
+
+from bson import ObjectId
+
+from logic import normalize_key
+
+try:
+    import numpy as np
+except ImportError:  # radi i bez numpy-ja, samo sporije bodovanje
+    np = None
+
+
+### Pretraga teksta (BM25) ###
+
+# Invertirani indeks nad naslovom, opisom i koracima recepta. Rijeci se
+# normaliziraju istim normalize_key pravilima kao sastojci (mala slova, bez
+# dijakritika), pa "Sarma", "sarma" i "šarma" daju isti token. Naslov ima
+# veci tezinski faktor. Zadnja rijec upita se prosiruje na sve rijeci s tim
+# prefiksom (sorted vokabular + bisect), a rezultat je top-k po BM25 bez
+# prolaska kroz cijelu kolekciju - boduju se samo posting liste iz upita.
+
+FIELD_WEIGHTS = {"title": 3.0, "description": 1.0, "steps": 1.0}
+
+K1 = 1.2
+B = 0.75
+
+MIN_PREFIX = 2
+MAX_EXPANSIONS = 30
+PREFIX_WEIGHT = 0.7
+
+# zamijenjeni zapisi (izmijenjen tekst) ostaju u posting listama dok ih
+# nema dovoljno da se isplati sazimanje
+COMPACT_MIN_DEAD = 1000
+COMPACT_DEAD_FRACTION = 0.25
+
+STOPWORDS = {
+    "a", "i", "u", "s", "sa", "na", "za", "od", "do", "te", "se", "je", "o", "k",
+    "uz", "iz", "po", "ili", "da", "ne", "to", "su", "ga", "ih", "pa", "kao",
+}
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    out = []
+    for word in _WORD_RE.findall(text or ""):
+        for tok in normalize_key(word).replace("-", "_").split("_"):
+            if tok and tok not in STOPWORDS:
+                out.append(tok)
+    return out
+
+
+def _idf(df: int, n: int) -> float:
+    return math.log(1 + (n - df + 0.5) / (df + 0.5))
+
+
+def _field_text(doc: Dict[str, Any], field: str) -> str:
+    value = doc.get(field)
+    if isinstance(value, list):
+        return " ".join(str(v) for v in value)
+    return str(value or "")
+
+
+class TextIndex:
+
+    def __init__(self, name: str = ""):
+        self.name = name
+        self._lock = threading.Lock()
+        self._ids: List[ObjectId] = []
+        self._dense: Dict[ObjectId, int] = {}
+        self._lengths = array("f")
+        self._total_length = 0.0
+        self._postings: Dict[str, Tuple[array, array]] = {}
+        # df samo zivih zapisa (za IDF); posting liste sadrze i mrtve
+        self._df: Dict[str, int] = {}
+        self._terms: List[Tuple[str, ...]] = []
+        self._vocab: List[str] = []
+        self._dead: Set[int] = set()
+
+    @classmethod
+    def build(cls, backend, batch_size: int = 10000) -> "TextIndex":
+        index = cls(name=backend.name)
+        for d in backend.iter_recipes(tuple(FIELD_WEIGHTS), batch_size):
+            index._add(d["_id"], d, vocab=False)
+        index._vocab = sorted(index._postings)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._ids) - len(self._dead)
+
+    def _add(self, rid: ObjectId, doc: Dict[str, Any], vocab: bool = True) -> None:
+        old = self._dense.get(rid)
+        if old is not None:
+            self._dead.add(old)
+            self._total_length -= self._lengths[old]
+            for tok in self._terms[old]:
+                self._df[tok] -= 1
+            self._terms[old] = ()
+
+        tf: Counter = Counter()
+        for field, weight in FIELD_WEIGHTS.items():
+            for tok in tokenize(_field_text(doc, field)):
+                tf[tok] += weight
+        length = sum(tf.values())
+
+        dense = len(self._ids)
+        self._ids.append(rid)
+        self._dense[rid] = dense
+        self._lengths.append(length)
+        self._total_length += length
+        self._terms.append(tuple(tf))
+        for tok, n in tf.items():
+            post = self._postings.get(tok)
+            if post is None:
+                post = self._postings[tok] = (array("i"), array("f"))
+                if vocab:
+                    bisect.insort(self._vocab, tok)
+            post[0].append(dense)
+            post[1].append(n)
+            self._df[tok] = self._df.get(tok, 0) + 1
+
+        if len(self._dead) >= COMPACT_MIN_DEAD and len(self._dead) > COMPACT_DEAD_FRACTION * len(self._ids):
+            self._compact()
+
+    def _compact(self) -> None:
+        # izbacuje mrtve zapise i prenumerira gusti id; rijeci bez zivih
+        # zapisa nestaju iz vokabulara
+        remap = array("i", [-1]) * len(self._ids)
+        ids: List[ObjectId] = []
+        lengths = array("f")
+        terms: List[Tuple[str, ...]] = []
+        for d, rid in enumerate(self._ids):
+            if d in self._dead:
+                continue
+            remap[d] = len(ids)
+            ids.append(rid)
+            lengths.append(self._lengths[d])
+            terms.append(self._terms[d])
+
+        postings: Dict[str, Tuple[array, array]] = {}
+        for tok, (pids, tfs) in self._postings.items():
+            if not self._df.get(tok):
+                continue
+            keep = [(remap[d], tf) for d, tf in zip(pids, tfs) if remap[d] >= 0]
+            postings[tok] = (array("i", (d for d, _ in keep)), array("f", (tf for _, tf in keep)))
+
+        self._ids, self._lengths, self._terms = ids, lengths, terms
+        self._dense = {rid: d for d, rid in enumerate(ids)}
+        self._postings = postings
+        self._df = {tok: df for tok, df in self._df.items() if df}
+        self._vocab = sorted(postings)
+        self._dead = set()
+
+    def add(self, rid: ObjectId, doc: Dict[str, Any]) -> None:
+        # ponovno dodani recept (izmijenjen tekst) zamjenjuje stari zapis
+        with self._lock:
+            self._add(rid, doc)
+
+    def _expand(self, token: str, prefix: bool) -> List[Tuple[str, float]]:
+        terms = [(token, 1.0)] if self._df.get(token) else []
+        if not prefix or len(token) < MIN_PREFIX:
+            return terms
+        lo = bisect.bisect_left(self._vocab, token)
+        hi = bisect.bisect_left(self._vocab, token + "\uffff")
+        candidates = (t for t in self._vocab[lo:hi] if t != token and self._df.get(t))
+        # kratki prefiksi mogu pogoditi puno rijeci; zadrzavaju se najcesce
+        best = heapq.nlargest(MAX_EXPANSIONS, candidates, key=self._df.__getitem__)
+        return terms + [(t, PREFIX_WEIGHT) for t in best]
+
+    def search(self, query: str, limit: int = 20, prefix: bool = True) -> List[Tuple[ObjectId, float]]:
+        tokens = list(dict.fromkeys(tokenize(query)))
+        if not tokens:
+            return []
+        with self._lock:
+            n = len(self)
+            if not n:
+                return []
+            avgdl = self._total_length / n or 1.0
+            # prosirenje prefiksom samo za zadnju rijec (dok korisnik jos tipka)
+            groups = [
+                self._expand(tok, prefix and i == len(tokens) - 1)
+                for i, tok in enumerate(tokens)
+            ]
+            groups = [g for g in groups if g]
+            if not groups:
+                return []
+
+            weighted = [
+                [(self._postings[t], w * _idf(self._df[t], n)) for t, w in group]
+                for group in groups
+            ]
+            if np is not None:
+                top = self._search_numpy(weighted, avgdl, int(limit))
+            else:
+                top = self._search_python(weighted, avgdl, int(limit))
+            return [(self._ids[d], s) for d, s in top]
+
+    def _search_numpy(self, groups, avgdl, limit) -> List[Tuple[int, float]]:
+        lengths = np.frombuffer(self._lengths, dtype=np.float32)
+        all_ids, all_scores = [], []
+        for group in groups:
+            gi, gs = [], []
+            for (ids, tfs), idf in group:
+                ids = np.frombuffer(ids, dtype=np.int32)
+                tf = np.frombuffer(tfs, dtype=np.float32)
+                norm = K1 * (1 - B + B * lengths[ids] / avgdl)
+                gi.append(ids)
+                gs.append(idf * tf * (K1 + 1) / (tf + norm))
+            ids, scores = np.concatenate(gi), np.concatenate(gs)
+            if len(gi) > 1:
+                # unutar jedne rijeci upita vrijedi najbolje poklapanje (tocno ili prefiks)
+                order = np.lexsort((-scores, ids))
+                ids, scores = ids[order], scores[order]
+                first = np.ones(len(ids), dtype=bool)
+                first[1:] = ids[1:] != ids[:-1]
+                ids, scores = ids[first], scores[first]
+            all_ids.append(ids)
+            all_scores.append(scores)
+
+        uniq, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        totals = np.bincount(inverse, weights=np.concatenate(all_scores))
+        if self._dead:
+            keep = ~np.isin(uniq, np.fromiter(self._dead, dtype=np.int64))
+            uniq, totals = uniq[keep], totals[keep]
+
+        if len(uniq) > limit:
+            part = np.argpartition(-totals, limit - 1)[:limit]
+            uniq, totals = uniq[part], totals[part]
+        order = np.lexsort((-uniq, -totals))
+        return [(int(uniq[i]), float(totals[i])) for i in order]
+
+    def _search_python(self, groups, avgdl, limit) -> List[Tuple[int, float]]:
+        totals: Dict[int, float] = {}
+        for group in groups:
+            best: Dict[int, float] = {}
+            for (ids, tfs), idf in group:
+                for d, tf in zip(ids, tfs):
+                    s = idf * tf * (K1 + 1) / (tf + K1 * (1 - B + B * self._lengths[d] / avgdl))
+                    if s > best.get(d, 0.0):
+                        best[d] = s
+            for d, s in best.items():
+                totals[d] = totals.get(d, 0.0) + s
+
+        cand = ((s, d) for d, s in totals.items() if d not in self._dead)
+        return [(d, s) for s, d in heapq.nlargest(limit, cand)]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self),
+                "terms": sum(1 for df in self._df.values() if df),
+                "postings": sum(len(p[0]) for p in self._postings.values()),
+                "avg_length": (self._total_length / len(self)) if len(self) else 0.0,
+            }
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import math
+import os
+from datetime import datetime
+from typing import Iterable, Optional, Tuple
+
+
+### Trending ###
+
+# Popularnost sa zaboravom: svaki dogadaj (objava recepta, spremanje,
+# komentar) vrijedi w * exp(-DECAY * starost). Umjesto periodickog
+# prepisivanja svih recepata cuva se
+#   trend = ln(sum w_i * exp(DECAY * (t_i - EPOCH)))
+# Svi recepti dijele isti faktor exp(-DECAY * sad), pa je poredak po trendu
+# isti kao poredak po trenutnoj popularnosti, a novi dogadaj je jedan update
+# (log-sum-exp starog trenda i novog clana). Vrijednosti rastu linearno s
+# vremenom, ali u log prostoru nema overflowa.
+#
+# Promjena TREND_HALF_LIFE_HOURS mijenja skalu: nakon nje treba
+# maintenance.py backfill-trend --all.
+
+HALF_LIFE_HOURS = float(os.getenv("TREND_HALF_LIFE_HOURS", "72"))
+DECAY = math.log(2) / (HALF_LIFE_HOURS * 3600.0)
+EPOCH = datetime(2024, 1, 1)
+
+WEIGHTS = {"recipe": 1.0, "save": 3.0, "comment": 1.0}
+
+# oduzimanje (unsave) ostavlja barem ovaj udio, da ln ne dobije 0 zbog zaokruzivanja
+MIN_FRACTION = 1e-9
+
+
+def event_value(kind: str, at: datetime) -> float:
+    return math.log(WEIGHTS[kind]) + DECAY * (at - EPOCH).total_seconds()
+
+
+def log_add(trend: Optional[float], value: float) -> float:
+    if trend is None:
+        return value
+    hi, lo = max(trend, value), min(trend, value)
+    return hi + math.log1p(math.exp(lo - hi))
+
+
+def log_sub(trend: Optional[float], value: float) -> Optional[float]:
+    if trend is None:
+        return None
+    return trend + math.log(max(MIN_FRACTION, 1.0 - math.exp(min(0.0, value - trend))))
+
+
+def score(events: Iterable[Tuple[str, datetime]]) -> Optional[float]:
+    trend: Optional[float] = None
+    for kind, at in events:
+        trend = log_add(trend, event_value(kind, at))
+    return trend
+
+
+def popularity(trend: Optional[float], now: Optional[datetime] = None) -> float:
+    # trenutna vrijednost sum w_i * exp(-DECAY * starost), za prikaz
+    if trend is None:
+        return 0.0
+    now = now or datetime.utcnow()
+    return math.exp(trend - DECAY * (now - EPOCH).total_seconds())